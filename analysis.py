@@ -0,0 +1,202 @@
+import argparse
+import collections
+import concurrent.futures
+import json
+import os
+import sys
+import threading
+import typing
+
+import chess
+import chess.engine
+
+import uci
+
+
+class AnalysisResult:
+    """
+    The engine's verdict on a single position
+    """
+    def __init__(self, fen: str, lines: typing.Optional[typing.List[typing.Dict]] = None,
+                 error: typing.Optional[str] = None):
+        """
+        :param fen: The FEN of the position, as it was given
+        :param lines: One dict per principal variation, best first, holding the 'move' (UCI), 'score_cp' or 'mate'
+                      (from white's point of view), 'depth' and 'pv' (UCI moves)
+        :param error: Why the position could not be analysed (E.G an invalid FEN), if it could not
+        """
+        self.fen = fen
+        self.lines = lines or []
+        self.error = error
+
+    @property
+    def best_move(self) -> typing.Optional[str]:
+        return self.lines[0]['move'] if self.lines else None
+
+    def to_json(self) -> typing.Dict:
+        """
+        :return: A JSON serializable representation of the result
+        """
+        data = {'fen': self.fen, 'best_move': self.best_move}
+        if self.lines:
+            data['score_cp'] = self.lines[0]['score_cp']
+            data['mate'] = self.lines[0]['mate']
+            data['lines'] = self.lines
+        if self.error:
+            data['error'] = self.error
+        return data
+
+
+class AnalysisPool:
+    """
+    Analyses a stream of positions on a pool of engine processes.
+
+    Each worker thread owns its own engine process (and chess.engine session); the threads merely wait on their engine,
+    so throughput grows with the number of processes rather than being capped at one search at a time.
+    """
+
+    def __init__(self, engine_path=uci.ENGINE_PATH, processes: typing.Optional[int] = None,
+                 limit: typing.Optional[chess.engine.Limit] = None, multipv=1,
+                 engine_options: typing.Optional[typing.Dict] = None, backlog: typing.Optional[int] = None):
+        """
+        :param engine_path: The path of the engine binary
+        :param processes: How many engine processes to run, one per core by default
+        :param limit: The search limit of every position, 2 seconds by default
+        :param multipv: How many principal variations to report per position
+        :param engine_options: UCI options of every engine process (Threads should usually stay at 1)
+        :param backlog: How many positions may be queued ahead of the one being yielded (bounds memory on long streams)
+        """
+        self.engine_path = engine_path
+        self.processes = processes or os.cpu_count() or 1
+        self.limit = limit or chess.engine.Limit(time=2.00)
+        self.multipv = multipv
+        self.engine_options = engine_options
+        self.backlog = backlog or self.processes * 4
+        self._local = threading.local()
+        self._engines = []
+        self._engines_lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.processes)
+
+    def __enter__(self) -> 'AnalysisPool':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _get_engine(self) -> chess.engine.SimpleEngine:
+        engine = getattr(self._local, 'engine', None)
+        if engine is None:
+            engine = uci.open_engine(self.engine_path, self.engine_options)
+            self._local.engine = engine
+            with self._engines_lock:
+                self._engines.append(engine)
+        return engine
+
+    def _drop_engine(self) -> None:
+        engine = self._local.engine
+        self._local.engine = None
+        with self._engines_lock:
+            self._engines.remove(engine)
+        try:
+            engine.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _to_line(info: typing.Dict) -> typing.Dict:
+        score = info['score'].white() if 'score' in info else None
+        pv = [move.uci() for move in info.get('pv', [])]
+        return {
+            'move': pv[0] if pv else None,
+            'score_cp': score.score() if score is not None else None,
+            'mate': score.mate() if score is not None else None,
+            'depth': info.get('depth'),
+            'pv': pv
+        }
+
+    def analyse_position(self, fen: str) -> AnalysisResult:
+        """
+        Analyse a single position on the engine of the calling thread
+        :param fen: The FEN of the position (as produced by Board.to_fen_string; the move counters are optional)
+        """
+        try:
+            position = chess.Board(fen)
+        except ValueError as e:
+            return AnalysisResult(fen, error='Invalid FEN: {}'.format(e))
+        if position.is_game_over():
+            return AnalysisResult(fen, error='Game over: {}'.format(position.result()))
+        try:
+            infos = self._get_engine().analyse(position, self.limit, multipv=self.multipv)
+        except (chess.engine.EngineError, chess.engine.EngineTerminatedError) as e:
+            # The next position gets a fresh engine process
+            self._drop_engine()
+            return AnalysisResult(fen, error='Engine failure: {}'.format(e))
+        if isinstance(infos, dict):
+            infos = [infos]
+        return AnalysisResult(fen, [self._to_line(info) for info in infos])
+
+    def analyse(self, fens: typing.Iterable[str]) -> typing.Iterator[AnalysisResult]:
+        """
+        Analyse a stream of positions on the pool
+        :param fens: The FENs of the positions; consumed lazily
+        :return: The results, yielded in the same order as the FENs as soon as each one (and those before it) is done
+        """
+        pending = collections.deque()
+        for fen in fens:
+            pending.append(self._executor.submit(self.analyse_position, fen))
+            while len(pending) >= self.backlog or (pending and pending[0].done()):
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def close(self) -> None:
+        """
+        Wait for the positions in progress and quit every engine process
+        """
+        self._executor.shutdown(wait=True)
+        with self._engines_lock:
+            engines, self._engines = self._engines, []
+        for engine in engines:
+            try:
+                engine.quit()
+            except chess.engine.EngineTerminatedError:
+                pass
+
+
+def read_fens(lines: typing.Iterable[str]) -> typing.Iterator[str]:
+    """
+    :param lines: Lines of text, one FEN per line; blank lines and lines starting with '#' are skipped
+    """
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Analyse FENs (one per line) and print one JSON result per line, '
+                                                 'in input order')
+    parser.add_argument('input', nargs='?', help='File of FENs (defaults to stdin)')
+    parser.add_argument('--engine', default=uci.ENGINE_PATH, help='Path of the UCI engine binary')
+    parser.add_argument('--processes', type=int, default=None, help='Engine processes to run (defaults to one per core)')
+    parser.add_argument('--time', type=float, default=None, help='Seconds per position (defaults to 2)')
+    parser.add_argument('--depth', type=int, default=None, help='Depth per position, instead of or along with --time')
+    parser.add_argument('--multipv', type=int, default=1, help='Principal variations to report per position')
+    parser.add_argument('--hash', type=int, default=uci.DEFAULT_ENGINE_OPTIONS['Hash'], help='Hash (MB) per process')
+    args = parser.parse_args(argv)
+
+    limit = None
+    if args.time is not None or args.depth is not None:
+        limit = chess.engine.Limit(time=args.time, depth=args.depth)
+    source = open(args.input) if args.input else sys.stdin
+    try:
+        with AnalysisPool(args.engine, args.processes, limit, args.multipv, {'Hash': args.hash}) as pool:
+            for result in pool.analyse(read_fens(source)):
+                print(json.dumps(result.to_json()), flush=True)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+import asyncio
+import concurrent.futures
+import time
+
+import chess.engine
+
+import game
+import uci
+
+
+class AsyncGame(game.Game):
+    """
+    A Game played as an asyncio pipeline, so that its stages overlap instead of running one after the other.
+
+    The engine session (python-chess' asynchronous protocol) stays open for the whole game. The board is captured and
+    recognized on one executor thread and the mouse is driven on another: as soon as our move is handed to the mouse,
+    the engine starts pondering the expected reply and the board watcher starts looking for it, while the drag is still
+    completing.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(AsyncGame, self).__init__(*args, **kwargs)
+        self.transport = None
+        # A single thread each, so that captures never overlap one another and mouse moves are never interleaved
+        self.recognition_executor = concurrent.futures.ThreadPoolExecutor(1)
+        self.mouse_executor = concurrent.futures.ThreadPoolExecutor(1)
+
+    async def get_engine_async(self):
+        if self.engine is None:
+            with self.metrics.span('engine.start'):
+                self.transport, self.engine = await uci.open_engine_async(self.engine_path, self.engine_options)
+        return self.engine
+
+    async def close_engine_async(self):
+        await self.stop_pondering_async()
+        if self.engine is not None:
+            try:
+                await self.engine.quit()
+            except chess.engine.EngineTerminatedError:
+                pass
+            self.engine = None
+
+    async def stop_pondering_async(self):
+        if self.ponder_search is not None:
+            self.ponder_search.stop()
+            try:
+                await self.ponder_search.wait()
+            except chess.engine.EngineTerminatedError:
+                pass
+            self.ponder_search = None
+
+    async def start_pondering_async(self, reply):
+        expected = self.played_board.copy(stack=False)
+        expected.push(reply)
+        self.expected_board_fen = expected.board_fen()
+        if self.ponder:
+            engine = await self.get_engine_async()
+            self.ponder_search = await engine.analysis(expected, game=self)
+
+    async def search_async(self, think_time):
+        engine = await self.get_engine_async()
+        self.time_manager.start_search()
+        best_move, reply, best_info = None, None, {}
+        started = time.time()
+        search = await engine.analysis(self.virtual_board, chess.engine.Limit(time=think_time), game=self)
+        with search:
+            async for info in search:
+                pv = info.get('pv')
+                if pv:
+                    best_move, reply, best_info = pv[0], pv[1] if len(pv) > 1 else None, info
+                if self.time_manager.should_stop(info, time.time() - started, think_time):
+                    break
+        await search.wait()
+        if best_move is None:
+            result = await engine.play(self.virtual_board, chess.engine.Limit(time=self.time_manager.min_time),
+                                       game=self)
+            return result.move, result.ponder
+        self.remember_search(best_move, best_info)
+        return best_move, reply
+
+    async def get_next_move_async(self):
+        """
+        :return: The start and destination squares of our move, and the reply expected to it (None if unknown); the
+                 reply is not pondered on yet, so that the engine starts pondering only once the move is on its way
+        """
+        self.prepare_move()
+        with self.metrics.span('engine.stop_pondering'):
+            await self.stop_pondering_async()
+        with self.metrics.span('game.known_move'):
+            known_move = self.get_known_move()
+        if known_move is not None:
+            print('Known Move: {}'.format(known_move))
+            self.metrics.count('known_moves_' + known_move.source)
+            best_move, reply = known_move.move, None
+        else:
+            think_time = self.time_manager.allocate(self.virtual_board, self.get_captured_square())
+            if think_time == 0:
+                best_move, reply = self.time_manager.get_forced_move(self.virtual_board), None
+            else:
+                try:
+                    with self.metrics.span('engine.search'):
+                        best_move, reply = await self.search_async(think_time)
+                except chess.engine.EngineTerminatedError:
+                    self.engine = None
+                    self.metrics.count('engine_restarts')
+                    with self.metrics.span('engine.search'):
+                        best_move, reply = await self.search_async(think_time)
+        start, dest = self.commit_move(best_move)
+        return start, dest, reply
+
+    def close(self):
+        super(AsyncGame, self).close()
+        # The watcher may still be waiting for a move that never comes
+        self.recognition_executor.shutdown(wait=False)
+        self.mouse_executor.shutdown()
+
+    def start(self):
+        asyncio.set_event_loop_policy(chess.engine.EventLoopPolicy())
+        asyncio.run(self.run())
+
+    async def run(self):
+        try:
+            await self.play_async()
+        finally:
+            await self.close_engine_async()
+            self.close()
+
+    async def play_async(self):
+        loop = asyncio.get_running_loop()
+        # Started while the first board is being read
+        engine_started = asyncio.ensure_future(self.get_engine_async())
+        while True:
+            self.metrics.start_move()
+            with self.metrics.span('game.read_position'):
+                found = await loop.run_in_executor(self.recognition_executor, self.read_position)
+            if not found or self.virtual_board.is_game_over():
+                break
+            if self.virtual_board.turn != self.color:
+                print('Waiting for the opponent to move')
+                self.metrics.count('reads_before_our_turn')
+                with self.metrics.span('game.wait_for_opponent'):
+                    moved = await loop.run_in_executor(self.recognition_executor, self.wait_for_turn)
+                if self.opponent_left(moved):
+                    break
+                continue
+            turn_started = time.time()
+            self.print_position()
+            await engine_started
+            with self.metrics.span('game.get_next_move'):
+                start, dest, reply = await self.get_next_move_async()
+            print('Moving: {} to {}'.format(str(getattr(self.board, start).piece), dest))
+            mouse = loop.run_in_executor(self.mouse_executor, self.send_move, start, dest)
+            if reply is not None:
+                await self.start_pondering_async(reply)
+            watch = loop.run_in_executor(self.recognition_executor, self.wait_for_opponent)
+            await mouse
+            self.metrics.finish_move(fen=self.virtual_board.fen(), move=start + dest)
+            if self.clock_reader is None:
+                self.time_manager.spend(time.time() - turn_started)
+            # Our move ended the game (the watcher returned at once)
+            if self.played_board.is_game_over():
+                await watch
+                break
+            with self.metrics.span('game.wait_for_opponent'):
+                moved = await watch
+            if self.opponent_left(moved):
+                break
+
+
+if __name__ == '__main__':
+    AsyncGame().start()
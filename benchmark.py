@@ -0,0 +1,155 @@
+import argparse
+import json
+import random
+import sys
+import time
+import typing
+
+import chess
+import numpy as np
+
+import board
+import imagesearch
+import render
+
+STAGES = ['locate', 'capture', 'classify', 'last_move', 'fen', 'total']
+
+EMPTY_LABEL = '.'
+
+
+def get_expected_label(position: chess.Board, square: str) -> str:
+    piece = position.piece_at(chess.SQUARE_NAMES.index(square))
+    return piece.symbol() if piece else EMPTY_LABEL
+
+
+def get_found_label(found: board.Board, square: str) -> str:
+    piece = getattr(found, square).piece
+    if not piece:
+        return EMPTY_LABEL
+    return chess.Piece(chess.PIECE_NAMES.index(piece.name), piece.color == 'white').symbol()
+
+
+def summarize(values: typing.List[float]) -> typing.Dict[str, float]:
+    if not values:
+        return {}
+    return {
+        'mean': float(np.mean(values)),
+        'p50': float(np.percentile(values, 50)),
+        'p95': float(np.percentile(values, 95)),
+        'max': float(np.max(values))
+    }
+
+
+def benchmark_renderer(renderer: render.BoardRenderer, positions: typing.List[chess.Board], scale: float,
+                       screen_scale: float, recognition: str) -> typing.Dict:
+    """
+    Recognize renders of positions and compare the outcome with the positions
+    :return: The accuracy, per-stage latency, throughput and confusion matrix of the run
+    """
+    latencies = {stage: [] for stage in STAGES}
+    confusion = {}
+    located = placements = sides = last_moves = squares = 0
+    started = time.perf_counter()
+    for position in positions:
+        image = renderer.render(position, scale=scale)
+        read_started = time.perf_counter()
+        location = board.board_locator.locate(imagesearch.to_grayscale(image))
+        located_at = time.perf_counter()
+        found = board.get_board_from_location(location, image, screen_scale * scale, recognition=recognition) \
+            if location else None
+        if found is None:
+            continue
+        evaluated_at = time.perf_counter()
+        fen = found.to_fen_string()
+        finished = time.perf_counter()
+        latencies['locate'].append(located_at - read_started)
+        for stage in ('capture', 'classify', 'last_move'):
+            latencies[stage].append(found.timings[stage])
+        latencies['fen'].append(finished - evaluated_at)
+        latencies['total'].append(finished - read_started)
+        located += 1
+        placements += fen.split(' ')[0] == position.board_fen()
+        sides += found.white_to_move == (position.turn == chess.WHITE)
+        if position.move_stack and found.last_move:
+            move = position.peek()
+            last_moves += found.last_move[1] == chess.SQUARE_NAMES[move.to_square] and \
+                found.last_move_from == chess.SQUARE_NAMES[move.from_square]
+        for square in chess.SQUARE_NAMES:
+            expected, actual = get_expected_label(position, square), get_found_label(found, square)
+            confusion.setdefault(expected, {}).setdefault(actual, 0)
+            confusion[expected][actual] += 1
+            squares += expected == actual
+    elapsed = time.perf_counter() - started
+    count = len(positions)
+    return {
+        'samples': count,
+        'located': located / count if count else 0.0,
+        'placement_accuracy': placements / located if located else 0.0,
+        'square_accuracy': squares / (located * 64) if located else 0.0,
+        'side_to_move_accuracy': sides / located if located else 0.0,
+        'last_move_accuracy': last_moves / located if located else 0.0,
+        'latency': {stage: summarize(values) for stage, values in latencies.items()},
+        # Rendering included, so a lower bound of the recognition throughput
+        'throughput': count / elapsed if elapsed else 0.0,
+        'confusion': confusion
+    }
+
+
+def run(samples=20, seed=0, scales=(1.0,), bases=('boards/board-a.png', 'boards/board-a-flipped.png'),
+        sprites_path='boards/board-a.png', screen_scale=2.0, recognition='template', threads=1) -> typing.Dict:
+    """
+    Render random legal positions (with their last move highlighted) on every sample board at every scale, and
+    recognize them headlessly
+    :param samples: How many positions to render per sample board and scale
+    :param seed: The seed of the random positions (the same seed always benchmarks the same positions)
+    :param scales: The factors the renders are resized by
+    :param bases: The sample boards drawn on
+    :param sprites_path: The sample board (start position, normal orientation) pieces are cut from
+    :param screen_scale: The scale factor the sample boards were captured at
+    :param recognition: One of Board.RECOGNITION_MODES
+    :param threads: How many threads the squares of each board are recognized on
+    :return: A JSON serializable report, one run per sample board and scale
+    """
+    board.set_recognition_threads(threads)
+    rng = random.Random(seed)
+    positions = [render.random_position(rng) for _ in range(samples)]
+    runs = []
+    for base in bases:
+        try:
+            renderer = render.BoardRenderer(base, sprites_path, screen_scale)
+        except ValueError as e:
+            runs.append({'base': base, 'error': str(e)})
+            continue
+        for scale in scales:
+            result = benchmark_renderer(renderer, positions, scale, screen_scale, recognition)
+            runs.append(dict({'base': base, 'flipped': renderer.base.flipped, 'scale': scale}, **result))
+    return {
+        'config': {'samples': samples, 'seed': seed, 'scales': list(scales), 'screen_scale': screen_scale,
+                   'recognition': recognition, 'threads': threads},
+        'runs': runs
+    }
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Benchmark recognition speed and accuracy on rendered positions')
+    parser.add_argument('--samples', type=int, default=20, help='Positions per sample board and scale')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scales', type=float, nargs='+', default=[1.0], help='Factors the renders are resized by')
+    parser.add_argument('--bases', nargs='+', default=['boards/board-a.png', 'boards/board-a-flipped.png'],
+                        help='Sample boards to draw on')
+    parser.add_argument('--recognition', choices=board.Board.RECOGNITION_MODES, default='template')
+    parser.add_argument('--threads', type=int, default=1, help='Threads the squares of each board are recognized on')
+    parser.add_argument('--output', help='File to write the JSON report to (defaults to stdout)')
+    args = parser.parse_args(argv)
+
+    report = run(args.samples, args.seed, args.scales, args.bases, recognition=args.recognition, threads=args.threads)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
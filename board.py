@@ -1,52 +1,252 @@
+import concurrent.futures
+import hashlib
+import os
 import sys
+import time
 import typing
-import autopy
+import chess
+import numpy as np
 
 from PIL import Image
 
+import boardstate
+import calibration
+import classifier
 import imagesearch
-
-scale = autopy.screen.scale()
+import locator
+import metrics
+import skinpack
+import templates
+
+try:
+    import autopy
+    scale = autopy.screen.scale()
+except Exception:
+    # No display (E.G a headless server); only screenshots already in memory can be read, see read_board_from_image
+    autopy = None
+    scale = 1.0
 
 BoardInstance = typing.TypeVar('BoardInstance', bound='Board')
 
-marker_map = [
-    ('markers/edge-top-left.png', 'markers/edge-bottom-right.png', 'normal'),
-    ('markers/edge-top-left-2.png', 'markers/edge-bottom-right-2.png', 'normal'),
-    ('markers/edge-top-left-3.png', 'markers/edge-bottom-right-3.png', 'normal'),
-    ('markers/edge-top-left-4.png', 'markers/edge-bottom-right-4.png', 'normal'),
-    ('markers/edge-top-left-5.png', 'markers/edge-bottom-right-5.png', 'normal'),
-    ('markers/edge-top-left-6.png', 'markers/edge-bottom-right-6.png', 'normal'),
-    ('markers/edge-top-left-flipped.png', 'markers/edge-bottom-right-flipped.png', 'flipped'),
-    ('markers/edge-top-left-flipped-2.png', 'markers/edge-bottom-right-flipped-2.png', 'flipped'),
-    ('markers/edge-top-left-flipped-3.png', 'markers/edge-bottom-right-flipped-3.png', 'flipped'),
-    ('markers/edge-top-left-flipped-4.png', 'markers/edge-bottom-right-flipped-4.png', 'flipped'),
-    ('markers/edge-top-left-flipped-5.png', 'markers/edge-bottom-right-flipped-5.png', 'flipped'),
-    ('markers/edge-top-left-flipped-6.png', 'markers/edge-bottom-right-flipped-6.png', 'flipped')
-]
+# Every piece/marker/board PNG, decoded once at startup (or memory mapped from the skin pack compiled by skinpack.py);
+# adding a skin is a matter of dropping PNGs in the directories
+template_bank = skinpack.load_template_bank()
+
+# Squares are recognized on this executor (when set, see set_recognition_threads) by boards not given one of their own
+square_executor = None
+
+# The learned square classifier (see train.py), loaded the first time a board is read with it
+SQUARE_MODEL_PATH = 'models/squares.npz'
+square_model = None
 
+# The geometry of boards found on previous runs, per screen setup
+calibration_store = calibration.CalibrationStore()
 
-def get_png_position_on_screen(png_path: str, precision=0.92):
+
+def get_png_position_on_screen(png_path: str, precision=0.92, skin: typing.Optional['Skin'] = None):
     """
     Returns the coordinates of a png found within the current screen shot, taken at the time of this function call
 
     :param png_path: The string, absolute path to the png file to search within the current screen
     :param precision: The accuracy in which the match must be made [default: 94% - .94]
+    :param skin: The skin the png belongs to; defaults to default_skin
     :return: The x, y coordinates of the top left corner of the first match
     """
-    pos = imagesearch.imagesearch(png_path, precision=precision)
+    pos = imagesearch.imagesearch((skin or default_skin).template_bank[png_path], precision=precision)
     return pos[0]/scale, pos[1]/scale
 
 
-def get_board() -> BoardInstance:
+def get_square_color(position: str) -> str:
+    """
+    Get the color of a square for a given chess coordinate (E.G a1, b1, h1, h8)
+    :param position: The chess coordinate of the square
+    :return: Either 'white' or 'black'
+    """
+    row_map = {
+        'a': 1,
+        'b': 2,
+        'c': 3,
+        'd': 4,
+        'e': 5,
+        'f': 6,
+        'g': 7,
+        'h': 8
+    }
+    if row_map[position[0]] % 2 == 0:
+        if int(position[1]) % 2 == 0:
+            return 'black'
+        else:
+            return 'white'
+    else:
+        if int(position[1]) % 2 == 0:
+            return 'white'
+        else:
+            return 'black'
+
+
+def get_screen_key() -> str:
+    """
+    :return: The key under which the calibration of the current screen setup (resolution and scale) is stored
+    """
+    return calibration.CalibrationStore.get_key(autopy.screen.size(), scale)
+
+
+def marker_is_on_screen(png_path: str, coords: typing.Tuple, precision=.98, margin=4, marker_scale=1.0,
+                        skin: typing.Optional['Skin'] = None) -> bool:
+    """
+    Confirm a marker is (still) at a given position on the screen, only searching a tiny region around it
+    :param png_path: The path to the marker png
+    :param coords: The x, y coordinates (in screen points) the marker is expected at
+    :param precision: The accuracy in which the match must be made
+    :param margin: How far (in pixels) the marker may have moved
+    :param marker_scale: The factor the marker png is scaled by before matching
+    :param skin: The skin the marker belongs to; defaults to default_skin
+    :return: True if the marker was found
+    """
+    template = templates.scale_template((skin or default_skin).template_bank[png_path], marker_scale)
+    x, y = max(0, int(round(coords[0] * scale)) - margin), max(0, int(round(coords[1] * scale)) - margin)
+    region = (x, y, x + template.shape[1] + 2 * margin, y + template.shape[0] + 2 * margin)
+    im = imagesearch.region_grabber(region)
+    return imagesearch.imagesearcharea(template, *region, precision=precision, im=im) != [-1, -1]
+
+
+def get_square_hash(image: np.ndarray) -> bytes:
+    """
+    Get a digest of the pixels of a square, to tell whether it changed between two reads of the board
+    :param image: The (grayscale) pixels of the square
+    :return: The digest
+    """
+    return hashlib.blake2b(np.ascontiguousarray(image).tobytes(), digest_size=16).digest()
+
+
+def locate_board(screen: typing.Optional[np.ndarray] = None,
+                 skin: typing.Optional['Skin'] = None) -> typing.Optional[locator.BoardLocation]:
+    """
+    Search a single screenshot for a board of any size (see BoardLocator)
+    :param screen: The grayscale screenshot to search; the screen is grabbed if None
+    :param skin: The skin of the board; defaults to default_skin
+    :return: The location of the board (in pixels), or None if none was found
+    """
+    if screen is None:
+        screen = imagesearch.to_grayscale(imagesearch.screen_grabber())
+    return (skin or default_skin).board_locator.locate(screen)
+
+
+def fit_board_grid(screen: np.ndarray, dimensions: typing.Tuple,
+                   screen_scale=scale) -> typing.Tuple[float, float, float]:
+    """
+    Fit the squares of a board onto a screenshot, rather than trusting the distance between its markers to give their
+    size (see locator.fit_grid)
+    :param screen: The grayscale screenshot holding the board
+    :param dimensions: (x1, y1) of the top left marker (x2, y2) of the bottom right marker, in screen points
+    :param screen_scale: The scale factor of the display the screenshot was taken on
+    :return: The grid of the board (see Board)
+    """
+    origin = (dimensions[0][0] + Board.EDGE_TOP_LEFT_CORRECT_X) * screen_scale, \
+        (dimensions[0][1] + Board.EDGE_TOP_LEFT_CORRECT_Y) * screen_scale
+    side = abs(dimensions[1][1] - dimensions[0][1]) / Board.MARKER_SPAN_SQUARES * screen_scale
+    (x, y), side = locator.fit_grid(screen, origin, side)
+    return x / screen_scale, y / screen_scale, side / screen_scale
+
+
+def set_recognition_threads(threads: typing.Optional[int]) -> None:
+    """
+    Recognize the squares of the boards created from now on in parallel, on a pool of threads; template matching and
+    the matrix products of the classifiers release the GIL, so the threads do run on several cores
+    :param threads: How many threads (E.G os.cpu_count()); None or 1 to recognize squares one after the other
+    """
+    global square_executor
+    if square_executor is not None:
+        square_executor.shutdown(wait=False)
+    square_executor = concurrent.futures.ThreadPoolExecutor(threads, thread_name_prefix='squares') \
+        if threads and threads > 1 else None
+
+
+def get_skin(pack_path: typing.Optional[str] = None) -> 'Skin':
+    """
+    :param pack_path: The path of a skin pack (see skinpack.py); None for the default skin
+    :return: The skin, loaded at most once per process, so that boards of several skins can be read side by side
+    """
+    if pack_path is None:
+        return default_skin
+    key = os.path.abspath(pack_path)
+    if key not in skins:
+        skins[key] = Skin(skinpack.SkinPack(pack_path))
+    return skins[key]
+
+
+def get_square_model() -> classifier.SquareModel:
+    """
+    :return: The learned square classifier, loading it from SQUARE_MODEL_PATH on first use
+    """
+    global square_model
+    if square_model is None:
+        square_model = classifier.SquareModel.load(SQUARE_MODEL_PATH)
+    return square_model
+
+
+def resample_square(image: np.ndarray, side: int) -> np.ndarray:
+    """
+    :param image: A (square) crop of a square
+    :return: The crop resampled to side by side pixels (the crop itself if it already is)
+    """
+    return templates.scale_template(image, side / image.shape[0])
+
+
+def read_board_from_image(image: np.ndarray, screen_scale=scale, **board_options) -> typing.Optional[BoardInstance]:
+    """
+    Read a board from a screenshot already in memory (E.G loaded from disk) rather than from the screen
+    :param image: An RGB(A) array of the screenshot
+    :param screen_scale: The scale factor of the display the screenshot was taken on (E.G 2.0 on retina displays)
+    :param board_options: Passed on to Board (capture_mode is always 'frame'); the skin given, if any, is also the one
+                          the board is located with
+    :return: An instance of the board on the screenshot, or None if no board was found
+    """
+    location = locate_board(imagesearch.to_grayscale(image), board_options.get('skin'))
+    if location is None:
+        return None
+    return get_board_from_location(location, image, screen_scale, **board_options)
+
+
+def get_board_from_location(location: locator.BoardLocation, image: np.ndarray, screen_scale=scale,
+                            **board_options) -> typing.Optional[BoardInstance]:
+    """
+    Read the board found by the BoardLocator on a screenshot already in memory
+    :param location: Where the board is on the screenshot
+    :param image: An RGB(A) array of the screenshot
+    :param screen_scale: The scale factor of the display the screenshot was taken on
+    :param board_options: Passed on to Board (capture_mode is always 'frame')
+    :return: An instance of the board on the screenshot, or None if the location does not hold a valid board
+    """
+    top = location.top_left[0] / screen_scale, location.top_left[1] / screen_scale
+    bottom = location.bottom_right[0] / screen_scale, location.bottom_right[1] / screen_scale
+    grid = fit_board_grid(imagesearch.to_grayscale(image), (top, bottom), screen_scale)
+    try:
+        return Board((top, bottom), flipped=location.orientation == 'flipped', capture_mode='frame', screenshot=image,
+                     screen_scale=screen_scale, grid=grid, **board_options)
+    except InvalidBoardError:
+        return None
+
+
+def get_board(use_calibration=True, use_locator=True, skin: typing.Optional['Skin'] = None,
+              **board_options) -> BoardInstance:
     """
     Locate a chess board on the screen, create an instance of Board class from it, with virtual representations of
     position and pieces as well as their corresponding positions
+    :param use_calibration: Try the board geometry found on a previous run (for this screen setup) first, only
+                            searching the whole screen for markers if they are no longer where they were
+    :param use_locator: Search the screen with the multi-scale BoardLocator before trying every marker set of
+                        the marker_map of the skin in turn
+    :param skin: The skin of the board; defaults to default_skin
+    :param board_options: Passed on to Board (E.G keep_frames)
     :return: An instance of the board from the current screen
     """
+    skin = skin or default_skin
+    marker_map = skin.marker_map
+
     def get_edges(top_left_png, bottom_right_png):
-        edge_bottom_right_coords = get_png_position_on_screen(bottom_right_png, precision=.98)
-        edge_top_left_coords = get_png_position_on_screen(top_left_png, precision=.98)
+        edge_bottom_right_coords = get_png_position_on_screen(bottom_right_png, precision=.98, skin=skin)
+        edge_top_left_coords = get_png_position_on_screen(top_left_png, precision=.98, skin=skin)
         return edge_top_left_coords, edge_bottom_right_coords
 
     def swap_marker_priorities(pos1, pos2):
@@ -58,15 +258,57 @@ def get_board() -> BoardInstance:
         marker_map.insert(pos1, second_ele)
         marker_map.insert(pos2, first_ele)
 
+    screen_key = get_screen_key()
+    known = calibration_store.get(screen_key) if use_calibration else None
+    if known:
+        with metrics.recorder.span('get_board.calibration'):
+            found = all(marker_is_on_screen(marker, coords, marker_scale=known.marker_scale, skin=skin)
+                        for marker, coords in ((known.top_marker, known.dimensions[0]),
+                                               (known.bottom_marker, known.dimensions[1])))
+        if found:
+            try:
+                return Board(known.dimensions, flipped=known.flipped, grid=known.grid, skin=skin, **board_options)
+            except InvalidBoardError:
+                pass
+        print('Calibrated board no longer found, searching the screen')
+        metrics.recorder.count('calibration_misses')
+        # Otherwise it would be tried (and fail) again on every read until a board is found elsewhere
+        calibration_store.discard(screen_key)
+
+    location = None
+    if use_locator:
+        with metrics.recorder.span('get_board.locate'):
+            screen = imagesearch.to_grayscale(imagesearch.screen_grabber())
+            location = locate_board(screen, skin)
+    if location:
+        top = location.top_left[0] / scale, location.top_left[1] / scale
+        bottom = location.bottom_right[0] / scale, location.bottom_right[1] / scale
+        try:
+            board = Board((top, bottom), flipped=location.orientation == 'flipped',
+                          grid=fit_board_grid(screen, (top, bottom)), skin=skin, **board_options)
+            print('Located {}'.format(location))
+            calibration_store.put(screen_key, calibration.Calibration((top, bottom), location.orientation,
+                                                                      board.unit_pixels, location.top_marker,
+                                                                      location.bottom_marker, location.marker_scale,
+                                                                      board.get_origin()))
+            return board
+        except InvalidBoardError:
+            pass
+
     board = None
     for i, map in enumerate(marker_map):
         top_marker, bottom_marker, orientation = map
-        top, bottom = get_edges(top_marker, bottom_marker)
+        metrics.recorder.count('marker_sets_tried')
+        with metrics.recorder.span('get_board.markers'):
+            top, bottom = get_edges(top_marker, bottom_marker)
         print('Trying Marker Set {} - {}'.format(i + 1, orientation))
         try:
-            board = Board((top, bottom), flipped=orientation == 'flipped')
+            board = Board((top, bottom), flipped=orientation == 'flipped', skin=skin, **board_options)
             swap_marker_priorities(0, i)
             print('Used Marker Set {}'.format(i + 1))
+            calibration_store.put(screen_key, calibration.Calibration((top, bottom), orientation, board.unit_pixels,
+                                                                      top_marker, bottom_marker,
+                                                                      origin=board.get_origin()))
             break
         except InvalidBoardError:
             continue
@@ -148,11 +390,72 @@ class Board:
     EDGE_TOP_LEFT_CORRECT_X = 10
     EDGE_TOP_LEFT_CORRECT_Y = 7
 
-    def __init__(self, dimensions: typing.Tuple, flipped=False, save_sample_of_board=True):
+    # How many squares the markers are apart vertically (from the top of one to the top of the other)
+    MARKER_SPAN_SQUARES = 7.6
+
+    # The side (in pixels) squares are resampled to before recognition, whatever the zoom of the board; the piece
+    # templates are resampled to match, once (see TemplateBank.get_scaled_pieces)
+    RECOGNITION_SQUARE_PIXELS = 96
+
+    # How many squares are classified at once, as a single task of the executor ('batch' and 'model' recognition);
+    # 'template' recognition runs one task per square
+    CHUNK_SQUARES = 8
+
+    # 'frame' grabs the whole board once and slices the squares out of memory; 'square' grabs (and caches to disk)
+    # every square separately
+    CAPTURE_MODES = ('frame', 'square')
+
+    # 'template' matches each square against the piece templates one at a time, keeping the first hit; 'batch' scores
+    # all squares against all templates at once and keeps the best hit; 'model' has the learned SquareModel give the
+    # most likely content of all squares at once (both require the 'frame' capture mode)
+    RECOGNITION_MODES = ('template', 'batch', 'model')
+
+    def __init__(self, dimensions: typing.Tuple, flipped=False, save_sample_of_board=True, capture_mode='frame',
+                 recognition='template', reject_empty=True, screenshot: np.ndarray = None, screen_scale=None,
+                 square_pixels: typing.Optional[int] = RECOGNITION_SQUARE_PIXELS,
+                 executor: typing.Optional[concurrent.futures.Executor] = None,
+                 grid: typing.Optional[typing.Tuple[float, float, float]] = None, skin: typing.Optional['Skin'] = None,
+                 keep_frames=False):
         """
         :param dimensions: (x1, y1) of top left corner (x2, y2) of bottom right
+        :param capture_mode: One of Board.CAPTURE_MODES
+        :param recognition: One of Board.RECOGNITION_MODES
+        :param reject_empty: Skip recognition of the squares the EmptySquareDetector finds empty ('frame' capture mode)
+        :param screenshot: An RGB(A) array of a screenshot to read the board from, instead of the screen ('frame'
+                           capture mode)
+        :param screen_scale: The scale factor of the screen (or of the display the screenshot was taken on); defaults to
+                             the scale of the current screen
+        :param square_pixels: The side (in pixels) squares are resampled to before recognition ('frame' capture mode);
+                              None to recognize them at the size they are on the screen
+        :param executor: The executor (E.G a ThreadPoolExecutor) to recognize squares on in parallel ('frame' capture
+                         mode); defaults to square_executor, and squares are recognized one after the other if neither
+                         is set
+        :param grid: The (x, y) of the top left corner of the squares and the side of a square, in screen points, as
+                     fitted on the screen by fit_board_grid; derived from the dimensions (the markers) if None
+        :param skin: The skin the board is drawn in (see get_skin); defaults to default_skin
+        :param keep_frames: Keep the screenshot and the frame of the last evaluation (Board.frame and Board.frame_gray,
+                            E.G to watch the board or to look at its squares); otherwise they are let go of once the
+                            board is evaluated, leaving only its state, so that boards can be kept by the thousands
         """
+        if capture_mode not in Board.CAPTURE_MODES:
+            raise ValueError('Unknown capture mode: {}'.format(capture_mode))
+        if recognition not in Board.RECOGNITION_MODES:
+            raise ValueError('Unknown recognition mode: {}'.format(recognition))
+        if recognition in ('batch', 'model') and capture_mode != 'frame':
+            raise ValueError('{} recognition requires the frame capture mode'.format(recognition.capitalize()))
+        if screenshot is not None and capture_mode != 'frame':
+            raise ValueError('Reading a screenshot requires the frame capture mode')
+        self.screenshot = screenshot
+        self.keep_frames = keep_frames
+        self.skin = skin or default_skin
+        self.scale = screen_scale or scale
         self.save_sample_of_board = save_sample_of_board
+        self.capture_mode = capture_mode
+        self.recognition = recognition
+        self.reject_empty = reject_empty and capture_mode == 'frame'
+        self.square_pixels = square_pixels if capture_mode == 'frame' else None
+        # Squares captured one by one (and cached to disk) are never recognized in parallel
+        self.executor = (executor or square_executor) if capture_mode == 'frame' else None
         self.flipped = flipped
 
         # From whites POV (standard board orientation)
@@ -164,41 +467,167 @@ class Board:
             self.columns.reverse()
             self.rows.reverse()
         self.dimensions = dimensions
+        self.grid = grid
         self.unit_pixels = 0
-        self.white_to_move = True
-        self.last_move = None
-        self.a1, self.a2, self.a3, self.a4, self.a5, self.a6, self.a7, self.a8 = None, None, None, None, None, None, None, None
-        self.b1, self.b2, self.b3, self.b4, self.b5, self.b6, self.b7, self.b8 = None, None, None, None, None, None, None, None
-        self.c1, self.c2, self.c3, self.c4, self.c5, self.c6, self.c7, self.c8 = None, None, None, None, None, None, None, None
-        self.d1, self.d2, self.d3, self.d4, self.d5, self.d6, self.d7, self.d8 = None, None, None, None, None, None, None, None
-        self.e1, self.e2, self.e3, self.e4, self.e5, self.e6, self.e7, self.e8 = None, None, None, None, None, None, None, None
-        self.f1, self.f2, self.f3, self.f4, self.f5, self.f6, self.f7, self.f8 = None, None, None, None, None, None, None, None
-        self.g1, self.g2, self.g3, self.g4, self.g5, self.g6, self.g7, self.g8 = None, None, None, None, None, None, None, None
-        self.h1, self.h2, self.h3, self.h4, self.h5, self.h6, self.h7, self.h8 = None, None, None, None, None, None, None, None
+        self.frame = None
+        self.frame_gray = None
+        self.square_hashes = {}
+        self.changed_squares = set()
+        # Seconds spent on each stage of the last evaluation ('capture', 'classify' and 'last_move')
+        self.timings = {}
+        # The pieces found (and the side to move and last move), indexed like chess.SQUARES; the squares themselves
+        # (board.e4) are views into these, see SquareView
+        self.state = boardstate.BoardState()
+        self.geometry = [None] * 64
+        self.confidence = np.full(64, np.nan, dtype=np.float32)
+        self.highlight_pixels = np.zeros(64, dtype=np.int32)
+        # The fraction of every square covered by the last move highlight (when the whole frame is captured)
+        self.highlight_coverage = {}
         self.evaluate()
 
+    def __getattr__(self, name: str) -> 'SquareView':
+        # Only called for attributes not found otherwise: the squares, E.G board.e4
+        if name in boardstate.SQUARE_INDEXES:
+            return SquareView(self, boardstate.SQUARE_INDEXES[name])
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+
+    @property
+    def white_to_move(self) -> bool:
+        return self.state.white_to_move
+
+    @white_to_move.setter
+    def white_to_move(self, value: bool):
+        self.state.white_to_move = value
+
+    @property
+    def last_move(self) -> typing.Optional[typing.Tuple[str, str]]:
+        """
+        :return: The piece (E.G 'pawn (white)') and the square it landed on of the last move, None if not found
+        """
+        if self.state.last_move_to is None:
+            return None
+        return str(getattr(self, self.state.last_move_to).piece), self.state.last_move_to
+
+    @property
+    def last_move_from(self) -> typing.Optional[str]:
+        """
+        :return: The square the last move started from (only found when the whole frame is captured)
+        """
+        return self.state.last_move_from
+
     def eval_latest_move(self):
+        self.state.white_to_move = True
+        self.state.last_move_from = None
+        self.state.last_move_to = None
+        if self.frame is not None:
+            self.eval_latest_move_from_frame()
+            return
         most_matched_pixels = 0
         for row in self.rows:
             for column in self.columns:
-                position = getattr(self, row + column)
-                if position.piece and position.move_matched_pixels > most_matched_pixels:
-                    most_matched_pixels = position.move_matched_pixels
-                    # print(most_matched_pixels, position.position, str(position.piece)) # Debug
-                    self.last_move = (str(position.piece), position.position)
-                    if position.piece.color == 'black':
-                        self.white_to_move = True
-                    else:
-                        self.white_to_move = False
+                index = boardstate.SQUARE_INDEXES[row + column]
+                piece = boardstate.get_piece(int(self.state.pieces[index]))
+                if piece and self.highlight_pixels[index] > most_matched_pixels:
+                    most_matched_pixels = self.highlight_pixels[index]
+                    self.state.last_move_to = row + column
+                    self.state.white_to_move = piece[1] == 'black'
+
+    def eval_latest_move_from_frame(self):
+        """
+        Find both squares of the last move from the highlight coverage of every square, computed over the whole frame in
+        a single pass (see LastMoveDetector)
+        """
+        last_move_detector = self.skin.last_move_detector
+        mask = last_move_detector.get_mask(self.frame)
+        squares = [(row + column, i, j) for i, row in enumerate(self.rows) for j, column in enumerate(self.columns)]
+        masks = np.stack([self.get_square_view(mask, i, j) for _, i, j in squares])
+        coverage = last_move_detector.get_coverage(masks)
+        self.highlight_coverage = {position: float(value) for (position, _, _), value in zip(squares, coverage)}
+        indexes = [boardstate.SQUARE_INDEXES[position] for position, _, _ in squares]
+        self.highlight_pixels[indexes] = np.round(coverage * masks[0].size).astype(np.int32)
+        occupied = {chess.SQUARE_NAMES[index] for index in np.flatnonzero(self.state.pieces != boardstate.EMPTY)}
+        from_square, to_square = last_move_detector.detect(self.highlight_coverage, occupied)
+        self.state.last_move_from = from_square
+        if to_square is not None:
+            self.state.last_move_to = to_square
+            self.state.white_to_move = self.state.get_piece(to_square)[1] == 'black'
+
+    def get_origin(self) -> typing.Tuple[float, float]:
+        """
+        :return: The x, y coordinates (in screen points) of the top left corner of the squares
+        """
+        if self.grid:
+            return self.grid[0], self.grid[1]
+        return self.dimensions[0][0] + Board.EDGE_TOP_LEFT_CORRECT_X, \
+            self.dimensions[0][1] + Board.EDGE_TOP_LEFT_CORRECT_Y
+
+    def get_frame_region(self) -> typing.Tuple[int, int, int, int]:
+        """
+        :return: The region (x1, y1, x2, y2 in screen pixels) holding all 64 squares
+        """
+        x, y = (int(round(value * self.scale)) for value in self.get_origin())
+        # Large enough for every square sliced by Board.get_square_view to be complete
+        side = int(round(7 * self.unit_pixels * self.scale)) + int(round(self.unit_pixels * self.scale))
+        return x, y, x + side, y + side
+
+    def capture_frame(self) -> np.ndarray:
+        """
+        Grab the whole board (all 64 squares) from the screen (or the screenshot given) in a single screenshot
+        :return: An RGB(A) array of the board, in screen pixels
+        """
+        return self.capture_region(self.get_frame_region())
+
+    def capture_region(self, region: typing.Tuple[int, int, int, int], step=1) -> np.ndarray:
+        """
+        Grab a region of the screen (or of the screenshot given), at a fraction of its resolution
+        :param region: x1, y1, x2, y2 (in screen pixels)
+        :param step: Keep every step-th pixel of every step-th row; the rest is dropped right away (the screen can not
+                     be grabbed at a lower resolution), so nothing else ever runs at full resolution
+        :return: An RGB(A) array of the region
+        """
+        x, y, x2, y2 = region
+        if self.screenshot is None:
+            return np.asarray(imagesearch.region_grabber(region))[::step, ::step]
+        # Like a screen capture, parts of the region beyond the edges of the screenshot come out black
+        frame = np.zeros((-(-(y2 - y) // step), -(-(x2 - x) // step)) + self.screenshot.shape[2:],
+                         dtype=self.screenshot.dtype)
+        found = self.screenshot[y:y2:step, x:x2:step]
+        frame[:found.shape[0], :found.shape[1]] = found
+        return frame
+
+    def get_square_view(self, frame: np.ndarray, i: int, j: int) -> np.ndarray:
+        """
+        Slice a single square out of a board frame without copying it
+        :param frame: An array returned by Board.capture_frame (or its grayscale equivalent)
+        :param i: The index of the square within Board.rows
+        :param j: The index of the square within Board.columns
+        :return: A view of the square within the frame
+        """
+        size = int(round(self.unit_pixels * self.scale))
+        left, top = int(round(i * self.unit_pixels * self.scale)), int(round(j * self.unit_pixels * self.scale))
+        return frame[top:top + size, left:left + size]
 
-    def evaluate(self) -> None:
+    def map(self, function: typing.Callable, items: typing.Sequence) -> typing.List:
         """
-        Adjust the board so that every piece fits inside a unit by unit square; cache eache pieces png;
-        derive the value of unit (side [in pixels] of a single square)
+        :return: The outcome of a function for every item, in the order of the items, computed on the executor of the
+                 board if it has one
+        """
+        if self.executor is None or len(items) < 2:
+            return [function(item) for item in items]
+        return list(self.executor.map(function, items))
+
+    def evaluate(self, incremental=False, positions: typing.Optional[typing.Set[str]] = None) -> typing.Set[str]:
+        """
+        Adjust the board so that every piece fits inside a unit by unit square; capture each square (from a single
+        frame of the board, or one screenshot per square); derive the value of unit (side [in pixels] of a single square)
+        :param incremental: Only recognize the squares that changed since the previous evaluation ('frame' capture mode)
+        :param positions: Only recognize these squares (E.G those a legal move could change) of the ones that changed;
+                          ignored when every square changed (the board most likely moved)
+        :return: The positions of the squares that were (re)recognized
         """
         length_pixels = abs(self.dimensions[1][1] - self.dimensions[0][1])
         x1, y1, x2, y2 = self.dimensions[0][0], self.dimensions[0][1], self.dimensions[1][0], self.dimensions[1][1]
-        unit = length_pixels/7.6
+        unit = self.grid[2] if self.grid else length_pixels / Board.MARKER_SPAN_SQUARES
         """
         if self.save_sample_of_board:
             autopy.bitmap.capture_screen((
@@ -209,100 +638,130 @@ class Board:
         self.unit_pixels = unit
         if x1 < 0 or x2 < 0 or y1 < 0 or y2 < 0:
             raise InvalidBoardError(self.dimensions)
+        started = time.perf_counter()
+        if self.capture_mode == 'frame':
+            self.frame = self.capture_frame()
+            self.frame_gray = imagesearch.to_grayscale(self.frame)
+        captured = time.perf_counter()
+        squares = []
+        origin = self.get_origin()
         for i, row in enumerate(self.rows):
             for j, column in enumerate(self.columns):
-                coords = (self.dimensions[0][0] + Board.EDGE_TOP_LEFT_CORRECT_X + (i * self.unit_pixels)), \
-                         (self.dimensions[0][1] + Board.EDGE_TOP_LEFT_CORRECT_Y + (j * self.unit_pixels))
-                setattr(self, row + column, Position(coords[0], coords[1], self.unit_pixels, row + column))
+                coords = origin[0] + i * self.unit_pixels, origin[1] + j * self.unit_pixels
+                self.geometry[boardstate.SQUARE_INDEXES[row + column]] = \
+                    boardstate.SquareGeometry(coords[0], coords[1], self.unit_pixels)
+                image, image_gray = None, None
+                if self.capture_mode == 'frame':
+                    image = self.get_square_view(self.frame, i, j)
+                    image_gray = self.get_square_view(self.frame_gray, i, j)
+                squares.append((row + column, coords, image, image_gray))
+        hashes = {}
+        if self.capture_mode == 'frame':
+            hashes = {position: get_square_hash(image_gray) for position, _, _, image_gray in squares}
+        changed = [
+            index for index, (position, _, _, _) in enumerate(squares)
+            if not incremental or position not in self.square_hashes or self.square_hashes[position] != hashes[position]
+        ]
+        if positions is not None and len(changed) < len(squares):
+            skipped = [index for index in changed if squares[index][0] not in positions]
+            # Squares left out keep the hash of their last recognition, so that they still count as changed next time
+            for index in skipped:
+                position = squares[index][0]
+                if position in self.square_hashes:
+                    hashes[position] = self.square_hashes[position]
+                else:
+                    del hashes[position]
+            changed = [index for index in changed if squares[index][0] in positions]
+        classifications = {index: None for index in changed}
+        occupied = changed
+        if self.reject_empty and changed:
+            states = self.skin.empty_square_detector.detect(np.stack([squares[index][3] for index in changed]),
+                                                  [get_square_color(squares[index][0]) for index in changed])
+            occupied = []
+            for index, state in zip(changed, states):
+                if state == classifier.EmptySquareDetector.OCCUPIED:
+                    occupied.append(index)
+                else:
+                    classifications[index] = classifier.SquareClassification(None, None, 1.0)
+        if self.square_pixels:
+            for index in occupied:
+                position, coords, image, image_gray = squares[index]
+                squares[index] = position, coords, image, resample_square(image_gray, self.square_pixels)
+        if self.recognition in ('batch', 'model') and occupied:
+            recognizer = self.skin.batch_classifier if self.recognition == 'batch' else get_square_model()
+            # Chunked the same way with or without an executor, so that the outcome (down to the rounding of the
+            # confidences) never depends on how many threads there are
+            chunks = [occupied[start:start + Board.CHUNK_SQUARES]
+                      for start in range(0, len(occupied), Board.CHUNK_SQUARES)]
+            found = self.map(lambda chunk: recognizer.classify(np.stack([squares[index][3] for index in chunk])),
+                             chunks)
+            for chunk, chunk_found in zip(chunks, found):
+                for index, classification in zip(chunk, chunk_found):
+                    classifications[index] = classification
+
+        def recognize(index: int) -> Position:
+            position, coords, image, image_gray = squares[index]
+            return Position(coords[0], coords[1], self.unit_pixels, position, image=image, image_gray=image_gray,
+                            classification=classifications[index], count_highlight=self.capture_mode != 'frame',
+                            skin=self.skin)
+
+        # Only the outcome of each square is kept, not the square (and its pixels) itself
+        for index, square in zip(changed, self.map(recognize, changed)):
+            position = squares[index][0]
+            state_index = boardstate.SQUARE_INDEXES[position]
+            self.state.pieces[state_index] = boardstate.get_piece_code(square.piece.name, square.piece.color) \
+                if square.piece else boardstate.EMPTY
+            self.confidence[state_index] = square.confidence
+            self.highlight_pixels[state_index] = square.move_matched_pixels
+        self.square_hashes = hashes
+        self.changed_squares = {squares[index][0] for index in changed}
+        classified = time.perf_counter()
 
         self.eval_latest_move()
+        self.timings = {
+            'capture': captured - started,
+            'classify': classified - captured,
+            'last_move': time.perf_counter() - classified
+        }
+        for stage, seconds in self.timings.items():
+            metrics.recorder.observe('board.' + stage, seconds)
+        metrics.recorder.count('squares_recognized', len(changed))
+        metrics.recorder.count('squares_rejected_empty', len(changed) - len(occupied))
+        if not self.keep_frames:
+            self.screenshot, self.frame, self.frame_gray = None, None, None
+        return self.changed_squares
+
+    def update(self, positions: typing.Optional[typing.Set[str]] = None,
+               screenshot: np.ndarray = None) -> typing.Set[str]:
+        """
+        Re-read the board from the screen (same geometry), only recognizing the squares whose pixels changed since the
+        previous read; the other squares keep their pieces. Falls back to a full read in the 'square' capture mode.
+        :param positions: Only recognize these squares, if they changed (see Board.evaluate)
+        :param screenshot: An RGB(A) array of a new screenshot to read the board from, instead of the screen (E.G the
+                           next frame of a recording)
+        :return: The positions (E.G 'e2', 'e4') of the squares that changed
+        """
+        if screenshot is not None:
+            self.screenshot = screenshot
+        return self.evaluate(incremental=True, positions=positions)
 
     def white_can_castle_kingside(self):
-        if self.h1.piece and self.h1.piece.name == 'rook' and self.e1.piece and self.e1.piece.name == 'king':
-            return True
-        return False
+        return 'K' in self.state.castling_fen()
 
     def white_can_castle_queenside(self):
-        if self.a1.piece and self.a1.piece.name == 'rook' and self.e1.piece and self.e1.piece.name == 'king':
-            return True
-        return False
+        return 'Q' in self.state.castling_fen()
 
     def black_can_castle_kingside(self):
-        if self.h8.piece and self.h8.piece.name == 'rook' and self.e8.piece and self.e8.piece.name == 'king':
-            return True
-        return False
+        return 'k' in self.state.castling_fen()
 
     def black_can_castle_queenside(self):
-        if self.a8.piece and self.a8.piece.name == 'rook' and self.e8.piece and self.e8.piece.name == 'king':
-            return True
-        return False
+        return 'q' in self.state.castling_fen()
 
     def to_fen_string(self):
-        fen_name_map = {
-            'white': {
-                'rook': 'R',
-                'knight': 'N',
-                'bishop': 'B',
-                'queen': 'Q',
-                'king': 'K',
-                'pawn': 'P'
-            },
-            'black': {
-                'rook': 'r',
-                'knight': 'n',
-                'bishop': 'b',
-                'queen': 'q',
-                'king': 'k',
-                'pawn': 'p'
-            }
-        }
-        eval_rows = [
-            ['a8', 'b8', 'c8', 'd8', 'e8', 'f8', 'g8', 'h8'],
-            ['a7', 'b7', 'c7', 'd7', 'e7', 'f7', 'g7', 'h7'],
-            ['a6', 'b6', 'c6', 'd6', 'e6', 'f6', 'g6', 'h6'],
-            ['a5', 'b5', 'c5', 'd5', 'e5', 'f5', 'g5', 'h5'],
-            ['a4', 'b4', 'c4', 'd4', 'e4', 'f4', 'g4', 'h4'],
-            ['a3', 'b3', 'c3', 'd3', 'e3', 'f3', 'g3', 'h3'],
-            ['a2', 'b2', 'c2', 'd2', 'e2', 'f2', 'g2', 'h2'],
-            ['a1', 'b1', 'c1', 'd1', 'e1', 'f1', 'g1', 'h1'],
-        ]
-        fen_string = ''
-        for row in eval_rows:
-            row_string = ''
-            blank_count = 0
-            for pos in row:
-                position = getattr(self, pos)
-                if position.piece:
-                    if blank_count > 0:
-                        row_string += str(blank_count)
-                        blank_count = 0
-                    row_string += fen_name_map[position.piece.color][position.piece.name]
-                else:
-                    blank_count += 1
-            if blank_count > 0:
-                row_string += str(blank_count)
-            fen_string += row_string + '/'
-        if self.white_to_move:
-            fen_string = fen_string.strip('/') + ' w '
-        else:
-            fen_string = fen_string.strip('/') + ' b '
-        at_least_one_castle = False
-        if self.white_can_castle_kingside():
-            fen_string += 'K'
-            at_least_one_castle = True
-        if self.white_can_castle_queenside():
-            fen_string += 'Q'
-            at_least_one_castle = True
-        if self.black_can_castle_kingside():
-            fen_string += 'k'
-            at_least_one_castle = True
-        if self.black_can_castle_queenside():
-            fen_string += 'q'
-            at_least_one_castle = True
-        if not at_least_one_castle:
-            fen_string += '-'
-
-        return fen_string
+        return self.state.to_fen()
+
+    def to_chess_board(self) -> chess.Board:
+        return self.state.to_chess_board()
 
     def to_json(self) -> typing.List:
         """
@@ -339,50 +798,103 @@ class Piece:
         return '{} ({})'.format(self.name, self.color)
 
 
+class SquareView:
+    """
+    A single square of a Board (E.G board.e4), read from the board's state rather than kept as an object of its own
+    """
+    __slots__ = ('board', 'index')
+
+    def __init__(self, board: Board, index: int):
+        self.board = board
+        self.index = index
+
+    @property
+    def position(self) -> str:
+        return chess.SQUARE_NAMES[self.index]
+
+    @property
+    def x(self) -> float:
+        return self.board.geometry[self.index].x
+
+    @property
+    def y(self) -> float:
+        return self.board.geometry[self.index].y
+
+    @property
+    def size(self) -> float:
+        return self.board.geometry[self.index].size
+
+    @property
+    def piece(self) -> typing.Optional[Piece]:
+        piece = boardstate.get_piece(int(self.board.state.pieces[self.index]))
+        return Piece(*piece) if piece else None
+
+    @property
+    def confidence(self) -> typing.Optional[float]:
+        confidence = float(self.board.confidence[self.index])
+        return None if np.isnan(confidence) else confidence
+
+    @property
+    def move_matched_pixels(self) -> int:
+        return int(self.board.highlight_pixels[self.index])
+
+    def get_square_color(self) -> str:
+        return get_square_color(self.position)
+
+
 class Position:
     """
-    Represents a position on the board
+    Represents a position on the board, while it is being recognized (the board only keeps the outcome, see SquareView)
     """
-    def __init__(self, x, y, size, position_string):
+
+    # The last (measured on boards/board-a-flipped.png, see skinpack.measure_board) is the highlight of a dark square
+    LAST_MOVE_COLORS = [(246, 246, 145), (190, 202, 95), (222, 228, 96), (250, 250, 126), (186, 203, 74)]
+
+    def __init__(self, x, y, size, position_string, image: np.ndarray = None, image_gray: np.ndarray = None,
+                 classification: classifier.SquareClassification = None, count_highlight=True,
+                 skin: typing.Optional['Skin'] = None):
+        """
+        :param image: An RGB(A) array of the square already captured from the screen (E.G a view into a board frame);
+                      when omitted the square is captured on its own and cached to disk
+        :param image_gray: The grayscale equivalent of image, if already available
+        :param classification: The outcome of an already classified square (see BatchClassifier); when omitted the
+                               square is matched against the piece templates one at a time
+        :param count_highlight: Count the pixels of the last move highlight of an occupied square; not needed when the
+                                board finds the last move over its whole frame (see Board.eval_latest_move_from_frame)
+        :param skin: The skin to recognize the square with; defaults to default_skin
+        """
         self.x = x
         self.y = y
         self.size = size
         self.piece = None
+        self.confidence = None
         self.position = position_string
         self.move_matched_pixels = 0
-        cached_png = self.get_png()
-        cached_png.save('cache/{}.png'.format(self.position))
-        self.cached_png_path = 'cache/{}.png'.format(self.position)
-        self.cached_png = Image.open(self.cached_png_path)
-        self.eval_position()
+        self.count_highlight = count_highlight
+        self.skin = skin or default_skin
+        if image is None:
+            with metrics.recorder.span('position.capture'):
+                cached_png = self.get_png()
+                cached_png.save('cache/{}.png'.format(self.position))
+                self.cached_png_path = 'cache/{}.png'.format(self.position)
+                self.cached_png = Image.open(self.cached_png_path)
+        else:
+            self.cached_png_path = None
+            self.cached_png = image
+        self.image_gray = image_gray if image_gray is not None else imagesearch.to_grayscale(self.cached_png)
+        if classification is None:
+            self.eval_position()
+        else:
+            self.apply_classification(classification)
 
     def get_square_color(self) -> str:
         """
         Get the color of a square for a given chess coordinate (E.G a1, b1, h1, h8)
         :return: Either 'white' or 'black'
         """
-        row_map = {
-            'a': 1,
-            'b': 2,
-            'c': 3,
-            'd': 4,
-            'e': 5,
-            'f': 6,
-            'g': 7,
-            'h': 8
-        }
-        if row_map[self.position[0]] % 2 == 0:
-            if int(self.position[1]) % 2 == 0:
-                return 'black'
-            else:
-                return 'white'
-        else:
-            if int(self.position[1]) % 2 == 0:
-                return 'white'
-            else:
-                return 'black'
+        return get_square_color(self.position)
 
-    def get_png(self) -> autopy.bitmap.Bitmap:
+    def get_png(self) -> 'autopy.bitmap.Bitmap':
         """
         Gets the bitmap of the current position of the coordinates
         :return: A bitmap object representing the coordinates of the position
@@ -390,125 +902,90 @@ class Position:
         bitmap = autopy.bitmap.capture_screen(((self.x, self.y), (self.size, self.size)))
         return bitmap
 
+    def count_last_move_pixels(self) -> int:
+        """
+        Count the pixels of this square painted in one of the colors used to highlight the last move
+        :return: The number of highlighted pixels
+        """
+        colors = self.skin.last_move_detector.colors
+        if self.cached_png_path is None:
+            return sum(imagesearch.count_of_color(self.cached_png, color, .03) for color in colors)
+        bitmap = autopy.bitmap.Bitmap.open(self.cached_png_path)
+        return sum(bitmap.count_of_color(color, .03) for color in colors)
+
+    def apply_classification(self, classification: classifier.SquareClassification) -> None:
+        """
+        Associates the piece found by a classifier (if any) with the position
+        :param classification: The outcome of classifying this square
+        """
+        self.confidence = classification.confidence
+        if classification.name:
+            self.piece = Piece(classification.name, classification.color)
+            if self.count_highlight:
+                self.move_matched_pixels = self.count_last_move_pixels()
+
     def eval_position(self) -> None:
         """
         Evaluates the position; determines if any pieces exist on it; if so associates the piece with the position,
         storing the value in Position.piece
         """
-        maps = [
-            ('pawn', 'white', 'pieces/pawn-white-f.png'),
-            ('pawn', 'white', 'pieces/pawn-white-t.png'),
-            ('pawn', 'white', 'pieces/pawn-white-t2.png'),
-            ('pawn', 'white', 'pieces/pawn-white-t3.png'),
-            ('pawn', 'white', 'pieces/pawn-white-b.png'),
-            ('pawn', 'white', 'pieces/pawn-white-l.png'),
-            ('pawn', 'white', 'pieces/pawn-white-r.png'),
-            ('pawn', 'black', 'pieces/pawn-black-f.png'),
-            ('pawn', 'black', 'pieces/pawn-black-t.png'),
-            ('pawn', 'black', 'pieces/pawn-black-t2.png'),
-            ('pawn', 'black', 'pieces/pawn-black-b.png'),
-            ('pawn', 'black', 'pieces/pawn-black-l.png'),
-            ('pawn', 'black', 'pieces/pawn-black-r.png'),
-            ('rook', 'white', 'pieces/rook-white-f.png'),
-            ('rook', 'white', 'pieces/rook-white-t.png'),
-            ('rook', 'white', 'pieces/rook-white-t2.png'),
-            ('rook', 'white', 'pieces/rook-white-b.png'),
-            ('rook', 'white', 'pieces/rook-white-l.png'),
-            ('rook', 'white', 'pieces/rook-white-l2.png'),
-            ('rook', 'white', 'pieces/rook-white-r.png'),
-            ('rook', 'white', 'pieces/rook-white-r2.png'),
-            ('rook', 'black', 'pieces/rook-black-f.png'),
-            ('rook', 'black', 'pieces/rook-black-t.png'),
-            ('rook', 'black', 'pieces/rook-black-t2.png'),
-            ('rook', 'black', 'pieces/rook-black-b.png'),
-            ('rook', 'black', 'pieces/rook-black-l.png'),
-            ('rook', 'black', 'pieces/rook-black-r.png'),
-            ('knight', 'white', 'pieces/knight-white-f.png'),
-            ('knight', 'white', 'pieces/knight-white-t.png'),
-            ('knight', 'white', 'pieces/knight-white-t2.png'),
-            ('knight', 'white', 'pieces/knight-white-t3.png'),
-            ('knight', 'white', 'pieces/knight-white-b.png'),
-            ('knight', 'white', 'pieces/knight-white-b2.png'),
-            ('knight', 'white', 'pieces/knight-white-l.png'),
-            ('knight', 'white', 'pieces/knight-white-l2.png'),
-            ('knight', 'white', 'pieces/knight-white-r.png'),
-            ('knight', 'white', 'pieces/knight-white-r2.png'),
-            ('knight', 'black', 'pieces/knight-black-f.png'),
-            ('knight', 'black', 'pieces/knight-black-t.png'),
-            ('knight', 'black', 'pieces/knight-black-t2.png'),
-            ('knight', 'black', 'pieces/knight-black-b.png'),
-            ('knight', 'black', 'pieces/knight-black-b2.png'),
-            ('knight', 'black', 'pieces/knight-black-b3.png'),
-            ('knight', 'black', 'pieces/knight-black-l.png'),
-            ('knight', 'black', 'pieces/knight-black-r.png'),
-            ('knight', 'black', 'pieces/knight-black-r2.png'),
-            ('bishop', 'white', 'pieces/bishop-white-f.png'),
-            ('bishop', 'white', 'pieces/bishop-white-t.png'),
-            ('bishop', 'white', 'pieces/bishop-white-t2.png'),
-            ('bishop', 'white', 'pieces/bishop-white-t3.png'),
-            ('bishop', 'white', 'pieces/bishop-white-b.png'),
-            ('bishop', 'white', 'pieces/bishop-white-l.png'),
-            ('bishop', 'white', 'pieces/bishop-white-r.png'),
-            ('bishop', 'black', 'pieces/bishop-black-f.png'),
-            ('bishop', 'black', 'pieces/bishop-black-t.png'),
-            ('bishop', 'black', 'pieces/bishop-black-b.png'),
-            ('bishop', 'black', 'pieces/bishop-black-b2.png'),
-            ('bishop', 'black', 'pieces/bishop-black-b3.png'),
-            ('bishop', 'black', 'pieces/bishop-black-l.png'),
-            ('bishop', 'black', 'pieces/bishop-black-r.png'),
-            ('queen', 'white', 'pieces/queen-white-f.png'),
-            ('queen', 'white', 'pieces/queen-white-t.png'),
-            ('queen', 'white', 'pieces/queen-white-t2.png'),
-            ('queen', 'white', 'pieces/queen-white-t3.png'),
-            ('queen', 'white', 'pieces/queen-white-b.png'),
-            ('queen', 'white', 'pieces/queen-white-b2.png'),
-            ('queen', 'white', 'pieces/queen-white-b3.png'),
-            ('queen', 'white', 'pieces/queen-white-l.png'),
-            ('queen', 'white', 'pieces/queen-white-r.png'),
-            ('queen', 'white', 'pieces/queen-white-r2.png'),
-            ('queen', 'black', 'pieces/queen-black-f.png'),
-            ('queen', 'black', 'pieces/queen-black-t.png'),
-            ('queen', 'black', 'pieces/queen-black-t2.png'),
-            ('queen', 'black', 'pieces/queen-black-b.png'),
-            ('queen', 'black', 'pieces/queen-black-l.png'),
-            ('queen', 'black', 'pieces/queen-black-l2.png'),
-            ('queen', 'black', 'pieces/queen-black-r.png'),
-            ('king', 'white', 'pieces/king-white-f.png'),
-            ('king', 'white', 'pieces/king-white-t.png'),
-            ('king', 'white', 'pieces/king-white-t2.png'),
-            ('king', 'white', 'pieces/king-white-t3.png'),
-            ('king', 'white', 'pieces/king-white-b.png'),
-            ('king', 'white', 'pieces/king-white-b2.png'),
-            ('king', 'white', 'pieces/king-white-l.png'),
-            ('king', 'white', 'pieces/king-white-l2.png'),
-            ('king', 'white', 'pieces/king-white-r.png'),
-            ('king', 'white', 'pieces/king-white-r2.png'),
-            ('king', 'white', 'pieces/king-white-r3.png'),
-            ('king', 'black', 'pieces/king-black-f.png'),
-            ('king', 'black', 'pieces/king-black-t.png'),
-            ('king', 'black', 'pieces/king-black-t2.png'),
-            ('king', 'black', 'pieces/king-black-b.png'),
-            ('king', 'black', 'pieces/king-black-l.png'),
-            ('king', 'black', 'pieces/king-black-r.png')
-        ]
-        for map in maps:
-            name, color, path = map
-            try:
-                coords = imagesearch.imagesearcharea(path, 0, 0,
-                                                     self.size * scale, self.size * scale, precision=.8, im=self.cached_png)
-                if coords != [-1, -1]:
-                    self.piece = Piece(name, color)
-                    bitmap = autopy.bitmap.Bitmap.open(self.cached_png_path)
-                    last_move_color_match_1 = bitmap.count_of_color((246, 246, 145), .03)
-                    last_move_color_match_2 = bitmap.count_of_color((190, 202, 95), .03)
-                    last_move_color_match_3 = bitmap.count_of_color((222, 228, 96), .03)
-                    last_move_color_match_4 = bitmap.count_of_color((250, 250, 126), .03)
-                    self.move_matched_pixels = last_move_color_match_1 + last_move_color_match_2 + \
-                                               last_move_color_match_3 + last_move_color_match_4
-                    break
-            except Exception as e:
-                if 'matchTemplate' in str(e):
-                    continue
+        started = time.perf_counter()
+        best_value = -1.0
+        tried = 0
+        # Resampled to the size of the square (once per size), so that they fit whatever the zoom of the board
+        for template in self.skin.template_bank.get_scaled_pieces(self.image_gray.shape[0]):
+            name, color = template.name, template.color
+            # matchTemplate would swap a template larger than the square (in both dimensions) with the square itself
+            if template.image.shape[0] > self.image_gray.shape[0] or template.image.shape[1] > self.image_gray.shape[1]:
+                metrics.recorder.count('templates_too_large')
+                continue
+            tried += 1
+            value, _ = imagesearch.best_match(template.image, self.image_gray)
+            if value >= .8:
+                self.piece = Piece(name, color)
+                self.confidence = value
+                if self.count_highlight:
+                    self.move_matched_pixels = self.count_last_move_pixels()
+                break
+            best_value = max(best_value, value)
+        if self.piece is None:
+            self.confidence = best_value
+        metrics.recorder.count('templates_tried', tried)
+        metrics.recorder.count('squares_matched')
+        metrics.recorder.observe('position.eval', time.perf_counter() - started)
+
+
+class Skin:
+    """
+    Everything boards of a skin are located and recognized with, built from its templates
+    """
+
+    def __init__(self, bank: templates.TemplateBank):
+        """
+        :param bank: The templates of the skin (E.G a skinpack.SkinPack)
+        """
+        self.template_bank = bank
+        # Reordered by get_board, so that the marker set found last is tried first next time
+        self.marker_map = bank.marker_sets()
+        self.board_locator = locator.BoardLocator(bank)
+        self.batch_classifier = classifier.BatchClassifier(bank)
+        # Empty squares show a square (or highlight) color of the skin in their centre, when its pack measured them
+        self.empty_square_detector = classifier.EmptySquareDetector(
+            levels=imagesearch.to_gray_levels(list(bank.square_colors.values()) + list(bank.highlight_colors or []))
+            if bank.square_colors else None)
+        # Finds the last move over the whole board frame, and holds the colors Position counts square by square; those
+        # of the skin if it has any
+        self.last_move_detector = classifier.LastMoveDetector(bank.highlight_colors or Position.LAST_MOVE_COLORS)
+
+
+# Boards are read in this skin unless given another one
+default_skin = Skin(template_bank)
+marker_map = default_skin.marker_map
+board_locator = default_skin.board_locator
+last_move_detector = default_skin.last_move_detector
+
+# The other skins loaded by get_skin, by the absolute path of their pack
+skins = {}
 
 
 if __name__ == '__main__':
@@ -0,0 +1,184 @@
+import typing
+
+import chess
+import numpy as np
+
+# Piece codes are indexes into this string: 0 for an empty square, then the FEN symbols of the white and black pieces
+PIECE_SYMBOLS = '.PNBRQKpnbrqk'
+
+EMPTY = 0
+
+# The pieces in the order of their codes, that of python-chess' piece types (not the order templates.PIECE_NAMES tries
+# the piece templates in)
+CODE_PIECE_NAMES = chess.PIECE_NAMES[1:]
+
+# Square names (E.G 'e4') to indexes into BoardState.pieces, in the order of chess.SQUARES (a1, b1 ... h8)
+SQUARE_INDEXES = {name: index for index, name in enumerate(chess.SQUARE_NAMES)}
+
+# (king square, rook square, FEN castling flag) for every castling right a recognized board may still have
+CASTLING_SQUARES = [('e1', 'h1', 'K'), ('e1', 'a1', 'Q'), ('e8', 'h8', 'k'), ('e8', 'a8', 'q')]
+
+
+def get_piece_code(name: typing.Optional[str], color: typing.Optional[str]) -> int:
+    """
+    :param name: The name of a piece (E.G 'knight'), None for an empty square
+    :param color: Either 'white' or 'black'
+    :return: The code of the piece
+    """
+    if name is None:
+        return EMPTY
+    return 1 + CODE_PIECE_NAMES.index(name) + (0 if color == 'white' else len(CODE_PIECE_NAMES))
+
+
+def get_piece(code: int) -> typing.Optional[typing.Tuple[str, str]]:
+    """
+    :return: The (name, color) of the piece of a code, None for an empty square
+    """
+    if code == EMPTY:
+        return None
+    code -= 1
+    return CODE_PIECE_NAMES[code % len(CODE_PIECE_NAMES)], 'white' if code < len(CODE_PIECE_NAMES) else 'black'
+
+
+class SquareGeometry:
+    """
+    Where a square is on the screen
+    """
+    __slots__ = ('x', 'y', 'size')
+
+    def __init__(self, x: float, y: float, size: float):
+        """
+        :param x: The x coordinate (in screen points) of the top left corner of the square
+        :param y: The y coordinate (in screen points) of the top left corner of the square
+        :param size: The side (in screen points) of the square
+        """
+        self.x = x
+        self.y = y
+        self.size = size
+
+
+class BoardState:
+    """
+    The pieces on a recognized board, held as 64 one-byte piece codes (see PIECE_SYMBOLS) indexed like chess.SQUARES,
+    plus the side to move and the last move as seen on the screen; cheap to copy, compare and keep by the thousands.
+    """
+    __slots__ = ('pieces', 'white_to_move', 'last_move_from', 'last_move_to')
+
+    def __init__(self, pieces: np.ndarray = None, white_to_move=True, last_move_from: str = None,
+                 last_move_to: str = None):
+        """
+        :param pieces: 64 piece codes, a1 first; an empty board by default
+        :param white_to_move: Whether white is to move
+        :param last_move_from: The square (E.G 'e2') the last move started from, if known
+        :param last_move_to: The square (E.G 'e4') the last move landed on, if known
+        """
+        self.pieces = np.zeros(64, dtype=np.int8) if pieces is None else np.asarray(pieces, dtype=np.int8)
+        self.white_to_move = white_to_move
+        self.last_move_from = last_move_from
+        self.last_move_to = last_move_to
+
+    def get_code(self, square: str) -> int:
+        return int(self.pieces[SQUARE_INDEXES[square]])
+
+    def get_symbol(self, square: str) -> str:
+        """
+        :return: The FEN symbol of the piece on a square, '.' if the square is empty
+        """
+        return PIECE_SYMBOLS[self.pieces[SQUARE_INDEXES[square]]]
+
+    def get_piece(self, square: str) -> typing.Optional[typing.Tuple[str, str]]:
+        """
+        :return: The (name, color) of the piece on a square (E.G 'e4'), None if the square is empty
+        """
+        return get_piece(int(self.pieces[SQUARE_INDEXES[square]]))
+
+    def set_piece(self, square: str, name: typing.Optional[str], color: typing.Optional[str] = None) -> None:
+        self.pieces[SQUARE_INDEXES[square]] = get_piece_code(name, color)
+
+    def copy(self) -> 'BoardState':
+        return BoardState(self.pieces.copy(), self.white_to_move, self.last_move_from, self.last_move_to)
+
+    def diff(self, other: 'BoardState') -> typing.List[str]:
+        """
+        :return: The squares (E.G 'e4') holding a different piece (or none) on the other board, in chess.SQUARES order
+        """
+        return [chess.SQUARE_NAMES[index] for index in np.flatnonzero(self.pieces != other.pieces)]
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, BoardState) and np.array_equal(self.pieces, other.pieces) and \
+            self.white_to_move == other.white_to_move
+
+    def __ne__(self, other) -> bool:
+        return not self == other
+
+    def board_fen(self) -> str:
+        """
+        :return: The piece placement part of the FEN of the board
+        """
+        ranks = []
+        for rank in range(7, -1, -1):
+            rank_string, blank_count = '', 0
+            for code in self.pieces[rank * 8:rank * 8 + 8]:
+                if code == EMPTY:
+                    blank_count += 1
+                    continue
+                if blank_count > 0:
+                    rank_string += str(blank_count)
+                    blank_count = 0
+                rank_string += PIECE_SYMBOLS[code]
+            if blank_count > 0:
+                rank_string += str(blank_count)
+            ranks.append(rank_string)
+        return '/'.join(ranks)
+
+    def castling_fen(self) -> str:
+        """
+        :return: The castling rights of the board, assuming a king and rook still on their starting squares never moved
+        """
+        rights = ''
+        for king, rook, flag in CASTLING_SQUARES:
+            color = 'white' if flag.isupper() else 'black'
+            if self.get_code(king) == get_piece_code('king', color) and \
+                    self.get_code(rook) == get_piece_code('rook', color):
+                rights += flag
+        return rights or '-'
+
+    def to_fen(self) -> str:
+        """
+        :return: The FEN of the board without the en passant square and move counters (E.G
+                 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq'), as Board.to_fen_string
+        """
+        return '{} {} {}'.format(self.board_fen(), 'w' if self.white_to_move else 'b', self.castling_fen())
+
+    def to_chess_board(self) -> chess.Board:
+        return chess.Board(self.to_fen())
+
+    @classmethod
+    def from_chess_board(cls, board: chess.Board) -> 'BoardState':
+        """
+        :param board: A python-chess board; its last move (if any) becomes the last move of the state
+        """
+        pieces = np.zeros(64, dtype=np.int8)
+        for square, piece in board.piece_map().items():
+            pieces[square] = PIECE_SYMBOLS.index(piece.symbol())
+        last_move = board.peek() if board.move_stack else None
+        return cls(pieces, board.turn == chess.WHITE,
+                   chess.SQUARE_NAMES[last_move.from_square] if last_move else None,
+                   chess.SQUARE_NAMES[last_move.to_square] if last_move else None)
+
+    @classmethod
+    def from_fen(cls, fen: str) -> 'BoardState':
+        """
+        :param fen: A FEN, or just its piece placement part (white to move)
+        """
+        parts = fen.split(' ')
+        pieces = np.zeros(64, dtype=np.int8)
+        for rank_index, rank in enumerate(parts[0].split('/')):
+            file = 0
+            for symbol in rank:
+                if symbol.isdigit():
+                    file += int(symbol)
+                else:
+                    pieces[(7 - rank_index) * 8 + file] = PIECE_SYMBOLS.index(symbol)
+                    file += 1
+        return cls(pieces, len(parts) < 2 or parts[1] == 'w')
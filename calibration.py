@@ -0,0 +1,113 @@
+import json
+import os
+import typing
+
+
+class Calibration:
+    """
+    The geometry of a board found on the screen, as detected by board.get_board
+    """
+    def __init__(self, dimensions: typing.Tuple, orientation: str, unit_pixels: float, top_marker: str,
+                 bottom_marker: str, marker_scale=1.0, origin: typing.Optional[typing.Tuple[float, float]] = None):
+        """
+        :param dimensions: (x1, y1) of the top left marker (x2, y2) of the bottom right marker, in screen points
+        :param orientation: Either 'normal' or 'flipped'
+        :param unit_pixels: The side (in screen points) of a single square
+        :param top_marker: The path of the top left marker PNG the board was found with
+        :param bottom_marker: The path of the bottom right marker PNG the board was found with
+        :param marker_scale: The factor the marker PNGs were scaled by to match the board
+        :param origin: The x, y coordinates (in screen points) of the top left corner of the squares (None for
+                       calibrations stored before it was)
+        """
+        self.dimensions = (tuple(dimensions[0]), tuple(dimensions[1]))
+        self.orientation = orientation
+        self.unit_pixels = unit_pixels
+        self.top_marker = top_marker
+        self.bottom_marker = bottom_marker
+        self.marker_scale = marker_scale
+        self.origin = tuple(origin) if origin is not None else None
+
+    @property
+    def flipped(self) -> bool:
+        return self.orientation == 'flipped'
+
+    @property
+    def grid(self) -> typing.Optional[typing.Tuple[float, float, float]]:
+        """
+        :return: The grid of squares to recreate the board with (see board.Board), None if it was not stored
+        """
+        if self.origin is None:
+            return None
+        return self.origin[0], self.origin[1], self.unit_pixels
+
+    def to_json(self) -> typing.Dict:
+        """
+        :return: A JSON serializable representation of the calibration
+        """
+        return {
+            'dimensions': self.dimensions,
+            'orientation': self.orientation,
+            'unit_pixels': self.unit_pixels,
+            'top_marker': self.top_marker,
+            'bottom_marker': self.bottom_marker,
+            'marker_scale': self.marker_scale,
+            'origin': self.origin
+        }
+
+    @classmethod
+    def from_json(cls, data: typing.Dict) -> 'Calibration':
+        return cls(data['dimensions'], data['orientation'], data['unit_pixels'], data['top_marker'],
+                   data['bottom_marker'], data.get('marker_scale', 1.0), data.get('origin'))
+
+
+class CalibrationStore:
+    """
+    Calibrations persisted to disk, one per screen setup (resolution and scale)
+    """
+
+    def __init__(self, path='cache/calibration.json'):
+        """
+        :param path: The JSON file the calibrations are kept in
+        """
+        self.path = path
+        self.calibrations = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.calibrations = {key: Calibration.from_json(data) for key, data in json.load(f).items()}
+            except (ValueError, KeyError, TypeError):
+                # A corrupt or outdated file only costs a full search for the board
+                self.calibrations = {}
+
+    @staticmethod
+    def get_key(screen_size: typing.Tuple, screen_scale: float) -> str:
+        """
+        :param screen_size: The (width, height) of the screen
+        :param screen_scale: The scale factor of the screen (E.G 2.0 on retina displays)
+        :return: The key the calibration of that screen setup is stored under
+        """
+        return '{}x{}@{}'.format(int(screen_size[0]), int(screen_size[1]), float(screen_scale))
+
+    def get(self, key: str) -> typing.Optional[Calibration]:
+        return self.calibrations.get(key)
+
+    def put(self, key: str, calibration: Calibration) -> None:
+        """
+        Store (and persist) the calibration of a screen setup
+        """
+        self.calibrations[key] = calibration
+        self.save()
+
+    def discard(self, key: str) -> None:
+        """
+        Forget (and persist forgetting) the calibration of a screen setup
+        """
+        if self.calibrations.pop(key, None) is not None:
+            self.save()
+
+    def save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.path, 'w') as f:
+            json.dump({key: calibration.to_json() for key, calibration in self.calibrations.items()}, f, indent=2)
@@ -0,0 +1,450 @@
+import typing
+
+import cv2
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+import boardstate
+import templates
+
+
+class SquareClassification:
+    """
+    The outcome of classifying a single square
+    """
+    def __init__(self, name: typing.Optional[str], color: typing.Optional[str], confidence: float,
+                 template: typing.Optional[templates.PieceTemplate] = None, probabilities: np.ndarray = None):
+        """
+        :param name: The name of the piece found on the square, or None if the square is empty
+        :param color: The color of the piece found on the square, or None if the square is empty
+        :param confidence: How confident the classifier is; for template matching the normalized cross-correlation of
+                           the best matching template [-1, 1], for a SquareModel the probability of its outcome [0, 1]
+        :param template: The best matching template
+        :param probabilities: The probability of every possible outcome, indexed like boardstate.PIECE_SYMBOLS (for a
+                              SquareModel)
+        """
+        self.name = name
+        self.color = color
+        self.confidence = confidence
+        self.template = template
+        self.probabilities = probabilities
+
+    def __str__(self):
+        if not self.name:
+            return 'empty ({:.2f})'.format(self.confidence)
+        return '{} ({}) ({:.2f})'.format(self.name, self.color, self.confidence)
+
+
+class BatchClassifier:
+    """
+    Classifies a whole stack of squares against every piece template of a TemplateBank at once.
+
+    Squares and templates are downsampled by the same factor; the normalized cross-correlation of every template against
+    every window of every square is then computed as one matrix product per template shape, and each square is assigned
+    the best scoring template (rather than the first one passing the threshold).
+    """
+
+    def __init__(self, bank: templates.TemplateBank, patch_size=48, precision=.8):
+        """
+        :param bank: The templates to classify against
+        :param patch_size: The side (in pixels) squares are downsampled to before matching; much smaller and the
+                           partial templates (a few pixels across) match the texture of empty squares nearly as well as
+                           pieces
+        :param precision: The minimum correlation for a square to be considered occupied
+        """
+        self.bank = bank
+        self.patch_size = patch_size
+        self.precision = precision
+        self._groups_by_square_size = {}
+
+    def _get_groups(self, square_pixels: int) -> typing.List[typing.Tuple[typing.Tuple[int, int], np.ndarray,
+                                                                            typing.List[int]]]:
+        """
+        Downsample, mean-centre and normalize the templates for squares of a given size; grouping them by shape
+        :param square_pixels: The side (in screen pixels) of the squares being classified
+        :return: A list of (shape, matrix, indexes into bank.pieces); the matrix holds the unit length templates of the
+                 group laid out as (template column, template row * template) for BatchClassifier.score
+        """
+        if square_pixels in self._groups_by_square_size:
+            return self._groups_by_square_size[square_pixels]
+        factor = self.patch_size / square_pixels
+        templates_by_shape = {}
+        # Resampled to the size of the squares first, so that they keep fitting them whatever the zoom of the board
+        for index, template in enumerate(self.bank.get_scaled_pieces(square_pixels)):
+            height, width = template.image.shape
+            # A template larger than a square can never match it (matchTemplate refuses those outright)
+            if height > square_pixels or width > square_pixels:
+                continue
+            shape = max(1, int(round(height * factor))), max(1, int(round(width * factor)))
+            small = cv2.resize(template.image, (shape[1], shape[0]), interpolation=cv2.INTER_AREA).astype(np.float64)
+            small -= small.mean()
+            norm = np.linalg.norm(small)
+            if norm == 0:
+                continue
+            smalls, indexes = templates_by_shape.setdefault(shape, ([], []))
+            smalls.append(small / norm)
+            indexes.append(index)
+        groups = []
+        for (height, width), (smalls, indexes) in templates_by_shape.items():
+            matrix = np.stack(smalls, axis=2).transpose(1, 0, 2).reshape(width, height * len(indexes))
+            groups.append(((height, width), matrix.astype(np.float32), indexes))
+        self._groups_by_square_size[square_pixels] = groups
+        return groups
+
+    def score(self, squares: np.ndarray) -> np.ndarray:
+        """
+        Score every square against every piece template
+        :param squares: A (N, side, side) stack of grayscale squares
+        :return: A (N, len(bank.pieces)) matrix of correlations; -1 for templates which can not fit a square
+        """
+        squares = np.asarray(squares)
+        count, square_pixels = squares.shape[0], squares.shape[1]
+        small = np.stack([
+            cv2.resize(square, (self.patch_size, self.patch_size), interpolation=cv2.INTER_AREA) for square in squares
+        ]).astype(np.float32)
+        # Summed area tables (in double precision) of the pixels and their squares give every window's energy cheaply
+        sums_table = self._summed_area_table(small)
+        squares_table = self._summed_area_table(small.astype(np.float64) ** 2)
+        scores = np.full((count, len(self.bank.pieces)), -1.0, dtype=np.float32)
+        for (height, width), matrix, indexes in self._get_groups(square_pixels):
+            pixels = height * width
+            # Correlate every horizontal run of pixels with every template row in a single matrix product, then add up
+            # the rows of each window; much less copying than laying out every full window
+            runs = self._get_runs(small, width)
+            products = (runs.reshape(-1, width) @ matrix).reshape(count, self.patch_size, runs.shape[2], height, -1)
+            offsets = self.patch_size - height + 1
+            dot_products = products[:, :offsets, :, 0].copy()
+            for row in range(1, height):
+                dot_products += products[:, row:row + offsets, :, row]
+            # The templates are mean-centred, so correlating against the raw windows equals correlating against the
+            # mean-centred windows; only the window norms need centring. Flat windows (less than one gray level of
+            # deviation per pixel) can not correlate with anything and score 0
+            sums = self._window_totals(sums_table, (height, width))
+            energy = self._window_totals(squares_table, (height, width)) - sums * sums / pixels
+            norms = np.sqrt(np.maximum(energy, pixels)).astype(np.float32)
+            correlations = dot_products / norms[..., None]
+            scores[:, indexes] = correlations.reshape(count, -1, len(indexes)).max(axis=1)
+        return scores
+
+    @staticmethod
+    def _get_runs(images: np.ndarray, width: int) -> np.ndarray:
+        """
+        :param images: A (N, height, side) stack of images
+        :return: A read-only (N, height, side - width + 1, width) view of every horizontal run of width pixels
+        """
+        images = np.ascontiguousarray(images)
+        count, height, side = images.shape
+        strides = images.strides
+        return as_strided(images, (count, height, side - width + 1, width), strides + (strides[2],), writeable=False)
+
+    @staticmethod
+    def _summed_area_table(images: np.ndarray) -> np.ndarray:
+        table = np.zeros((images.shape[0], images.shape[1] + 1, images.shape[2] + 1))
+        table[:, 1:, 1:] = images.cumsum(axis=1, dtype=np.float64).cumsum(axis=2)
+        return table
+
+    @staticmethod
+    def _window_totals(table: np.ndarray, shape: typing.Tuple[int, int]) -> np.ndarray:
+        height, width = shape
+        return table[:, height:, width:] - table[:, :-height, width:] - table[:, height:, :-width] + \
+            table[:, :-height, :-width]
+
+    def classify(self, squares: np.ndarray) -> typing.List[SquareClassification]:
+        """
+        Find the best matching piece for every square
+        :param squares: A (N, side, side) stack of grayscale squares
+        :return: One SquareClassification per square, in the same order
+        """
+        classifications = []
+        if not self.bank.pieces:
+            return [SquareClassification(None, None, -1.0) for _ in squares]
+        scores = self.score(squares)
+        best = scores.argmax(axis=1)
+        for square_index, template_index in enumerate(best):
+            confidence = float(scores[square_index, template_index])
+            template = self.bank.pieces[template_index]
+            if confidence < self.precision:
+                classifications.append(SquareClassification(None, None, confidence))
+            else:
+                classifications.append(SquareClassification(template.name, template.color, confidence, template))
+        return classifications
+
+
+class SquareModel:
+    """
+    A small learned classifier telling the 13 possible contents of a square (empty, or one of the 12 pieces) apart, at a
+    cost that does not grow with the number of templates (or skins) it was trained on.
+
+    Squares are shrunk to tiny grayscale patches and contrast normalized, then projected on the principal components of
+    the training patches (PCA); a single hidden layer (ReLU) and a softmax layer turn the projections into the
+    probability of every outcome. A whole stack of squares is classified with three matrix products. Trained offline
+    (see train.py) and saved as a compact .npz file.
+    """
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, hidden_weights: np.ndarray, hidden_bias: np.ndarray,
+                 weights: np.ndarray, bias: np.ndarray, patch_size=24, min_deviation=8.0):
+        """
+        :param mean: The mean patch (patch_size * patch_size) of the training squares
+        :param components: The principal components the patches are projected on (patch_size * patch_size, K), each
+                           scaled so that the projections of the training squares have unit variance
+        :param hidden_weights: The weights of the hidden layer (K, H)
+        :param hidden_bias: The biases of the hidden layer (H)
+        :param weights: The weights of the softmax layer (H, 13), one column per outcome
+        :param bias: The biases of the softmax layer (13)
+        :param patch_size: The side (in pixels) squares are shrunk to
+        :param min_deviation: The gray level deviation patches are normalized by at the least, so that the noise of a
+                              flat (empty) square is not blown up to look like a piece
+        """
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)
+        self.hidden_weights = np.asarray(hidden_weights, dtype=np.float32)
+        self.hidden_bias = np.asarray(hidden_bias, dtype=np.float32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.patch_size = int(patch_size)
+        self.min_deviation = float(min_deviation)
+
+    @staticmethod
+    def get_patches(squares: np.ndarray, patch_size: int, min_deviation: float) -> np.ndarray:
+        """
+        :param squares: A (N, side, side) stack of grayscale squares
+        :return: The contrast normalized patches of the squares (N, patch_size * patch_size)
+        """
+        patches = np.stack([
+            cv2.resize(square, (patch_size, patch_size), interpolation=cv2.INTER_AREA) for square in squares
+        ]).reshape(len(squares), -1).astype(np.float32)
+        patches -= patches.mean(axis=1, keepdims=True)
+        patches /= np.maximum(patches.std(axis=1, keepdims=True), min_deviation)
+        return patches
+
+    @staticmethod
+    def softmax(scores: np.ndarray) -> np.ndarray:
+        exponentials = np.exp(scores - scores.max(axis=1, keepdims=True))
+        return exponentials / exponentials.sum(axis=1, keepdims=True)
+
+    def get_features(self, squares: np.ndarray) -> np.ndarray:
+        """
+        :return: The activations of the hidden layer for a (N, side, side) stack of grayscale squares
+        """
+        projections = (self.get_patches(squares, self.patch_size, self.min_deviation) - self.mean) @ self.components
+        return np.maximum(projections @ self.hidden_weights + self.hidden_bias, 0)
+
+    def predict_proba(self, squares: np.ndarray) -> np.ndarray:
+        """
+        :param squares: A (N, side, side) stack of grayscale squares
+        :return: The probability of every outcome for every square (N, 13), indexed like boardstate.PIECE_SYMBOLS
+        """
+        return self.softmax(self.get_features(squares) @ self.weights + self.bias)
+
+    def classify(self, squares: np.ndarray) -> typing.List[SquareClassification]:
+        """
+        Find the most likely content of every square
+        :param squares: A (N, side, side) stack of grayscale squares
+        :return: One SquareClassification per square, in the same order
+        """
+        classifications = []
+        for probabilities in self.predict_proba(np.asarray(squares)):
+            code = int(probabilities.argmax())
+            piece = boardstate.get_piece(code)
+            name, color = piece if piece else (None, None)
+            classifications.append(SquareClassification(name, color, float(probabilities[code]),
+                                                        probabilities=probabilities))
+        return classifications
+
+    @classmethod
+    def fit(cls, squares: np.ndarray, labels: np.ndarray, patch_size=24, component_count=96, hidden_size=128,
+            epochs=60, batch_size=128, learning_rate=1e-3, regularization=1e-4, min_deviation=8.0,
+            seed=0) -> 'SquareModel':
+        """
+        Train a model, with mini-batch gradient descent (Adam) on the cross-entropy of its outcomes
+        :param squares: A (N, side, side) stack of grayscale squares
+        :param labels: The content of every square, as a piece code (see boardstate.PIECE_SYMBOLS)
+        :param component_count: How many principal components to keep
+        :param hidden_size: How many units the hidden layer has
+        :param epochs: How many times to go through the squares
+        :param regularization: The weight of the L2 penalty of the weights
+        :param seed: The seed of the initial weights and of the order of the batches
+        :return: The trained model
+        """
+        patches = cls.get_patches(squares, patch_size, min_deviation)
+        mean = patches.mean(axis=0)
+        centred = patches - mean
+        _, singular_values, basis = np.linalg.svd(centred, full_matrices=False)
+        component_count = min(component_count, basis.shape[0])
+        deviations = singular_values[:component_count] / np.sqrt(max(1, len(patches) - 1))
+        components = basis[:component_count].T / np.maximum(deviations, 1e-6)
+        projections = (centred @ components).astype(np.float32)
+        targets = np.eye(len(boardstate.PIECE_SYMBOLS), dtype=np.float32)[np.asarray(labels, dtype=np.int64)]
+
+        rng = np.random.RandomState(seed)
+        parameters = [
+            (rng.randn(component_count, hidden_size) * np.sqrt(2 / component_count)).astype(np.float32),
+            np.zeros(hidden_size, dtype=np.float32),
+            (rng.randn(hidden_size, targets.shape[1]) * np.sqrt(1 / hidden_size)).astype(np.float32),
+            np.zeros(targets.shape[1], dtype=np.float32)
+        ]
+        moments = [np.zeros_like(parameter) for parameter in parameters]
+        velocities = [np.zeros_like(parameter) for parameter in parameters]
+        step = 0
+        for _ in range(epochs):
+            order = rng.permutation(len(projections))
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                hidden_weights, hidden_bias, weights, bias = parameters
+                hidden = np.maximum(projections[batch] @ hidden_weights + hidden_bias, 0)
+                errors = (cls.softmax(hidden @ weights + bias) - targets[batch]) / len(batch)
+                hidden_errors = (errors @ weights.T) * (hidden > 0)
+                gradients = [
+                    projections[batch].T @ hidden_errors + regularization * hidden_weights, hidden_errors.sum(axis=0),
+                    hidden.T @ errors + regularization * weights, errors.sum(axis=0)
+                ]
+                step += 1
+                for parameter, gradient, moment, velocity in zip(parameters, gradients, moments, velocities):
+                    moment *= .9
+                    moment += .1 * gradient
+                    velocity *= .999
+                    velocity += .001 * gradient * gradient
+                    parameter -= learning_rate * (moment / (1 - .9 ** step)) / \
+                        (np.sqrt(velocity / (1 - .999 ** step)) + 1e-8)
+        return cls(mean, components, *parameters, patch_size=patch_size, min_deviation=min_deviation)
+
+    def save(self, path: str) -> None:
+        np.savez_compressed(path, mean=self.mean, components=self.components, hidden_weights=self.hidden_weights,
+                            hidden_bias=self.hidden_bias, weights=self.weights, bias=self.bias,
+                            patch_size=self.patch_size, min_deviation=self.min_deviation)
+
+    @classmethod
+    def load(cls, path: str) -> 'SquareModel':
+        with np.load(path) as data:
+            return cls(data['mean'], data['components'], data['hidden_weights'], data['hidden_bias'], data['weights'],
+                       data['bias'], int(data['patch_size']), float(data['min_deviation']))
+
+
+class EmptySquareDetector:
+    """
+    A cheap pre-classifier telling empty squares apart from occupied ones, so that only the latter need template
+    matching.
+
+    The centre of an empty square is a flat patch of the square's color, while a piece always puts outlines and shading
+    in the centre of its square; so a square is considered empty when the gray levels of its centre barely deviate, and
+    (when the colors of the skin are known) sit close to the level of a square or highlight color.
+
+    The centres of the empty squares of the sample boards, light, dark and highlighted alike, deviate by 0 gray levels
+    (the skin paints squares flat) and those of occupied squares by 19 or more; max_deviation sits in between, leaving
+    room for the noise of a scaled or compressed screenshot.
+    """
+
+    EMPTY_LIGHT = 'empty-light'
+    EMPTY_DARK = 'empty-dark'
+    OCCUPIED = 'occupied'
+
+    def __init__(self, max_deviation=8.0, margin=.25, levels: typing.Optional[typing.Sequence[float]] = None,
+                 max_level_distance=16.0):
+        """
+        :param max_deviation: The highest standard deviation (in gray levels) of the centre of an empty square
+        :param margin: The fraction of the square, on each side, left out of its centre (rank/file labels and
+                       neighbouring squares live there)
+        :param levels: The gray levels of the colors an empty square may show (those of the light and dark squares and
+                       of the highlights of the skin); None to accept any flat centre
+        :param max_level_distance: How far (in gray levels) the mean of the centre of an empty square may be from the
+                                   closest of the levels (screenshots of the same skin differ by a few)
+        """
+        self.max_deviation = max_deviation
+        self.margin = margin
+        self.levels = np.array(levels, dtype=np.float32) if levels else None
+        self.max_level_distance = max_level_distance
+
+    def detect(self, squares: np.ndarray, square_colors: typing.List[str]) -> typing.List[str]:
+        """
+        Tell which squares are empty
+        :param squares: A (N, side, side) stack of grayscale squares
+        :param square_colors: The color of each square on the board ('white' or 'black', see Position.get_square_color)
+        :return: One of EMPTY_LIGHT, EMPTY_DARK or OCCUPIED per square, in the same order
+        """
+        squares = np.asarray(squares)
+        side = squares.shape[1]
+        start, stop = int(side * self.margin), side - int(side * self.margin)
+        centres = squares[:, start:stop, start:stop].reshape(squares.shape[0], -1).astype(np.float32)
+        empty = centres.std(axis=1) <= self.max_deviation
+        if self.levels is not None:
+            # A piece large enough to fill the centre flat (E.G the body of a plain piece) is not the color of a square
+            distances = np.abs(centres.mean(axis=1)[:, None] - self.levels[None, :]).min(axis=1)
+            empty &= distances <= self.max_level_distance
+        return [
+            (self.EMPTY_LIGHT if square_color == 'white' else self.EMPTY_DARK) if is_empty else self.OCCUPIED
+            for is_empty, square_color in zip(empty, square_colors)
+        ]
+
+
+class LastMoveDetector:
+    """
+    Finds the squares highlighted as the last move over a whole board frame at once, rather than counting the pixels of
+    every highlight color square by square.
+
+    A table of all 2^24 RGB colors flags those within the tolerance of any of the highlight colors (the same tolerance
+    semantics as imagesearch.count_of_color); looking every pixel of the frame up in it gives the mask of highlighted
+    pixels in a single pass, and the fraction of each square covered by the mask tells which squares are highlighted.
+    """
+
+    def __init__(self, colors: typing.Sequence[typing.Tuple[int, int, int]], tolerance=.03, min_coverage=.15):
+        """
+        :param colors: The (r, g, b) colors the last move may be highlighted with
+        :param tolerance: The allowed euclidean distance to a highlight color, as a fraction of the largest possible
+                          distance between two colors
+        :param min_coverage: The fraction of a square that must be highlighted for the square to be part of the move
+                             (a piece standing on the square hides part of the highlight)
+        """
+        self.colors = [tuple(color) for color in colors]
+        self.tolerance = tolerance
+        self.min_coverage = min_coverage
+        self._table = None
+
+    def _get_table(self) -> np.ndarray:
+        if self._table is not None:
+            return self._table
+        table = np.zeros(1 << 24, dtype=bool)
+        limit = (self.tolerance ** 2) * 3 * 255 ** 2
+        reach = int(np.ceil(np.sqrt(limit)))
+        for color in self.colors:
+            red, green, blue = np.meshgrid(*(np.arange(max(0, value - reach), min(256, value + reach + 1))
+                                             for value in color), indexing='ij')
+            near = (red - color[0]) ** 2 + (green - color[1]) ** 2 + (blue - color[2]) ** 2 <= limit
+            table[(red[near] << 16) | (green[near] << 8) | blue[near]] = True
+        self._table = table
+        return table
+
+    def get_mask(self, frame: np.ndarray) -> np.ndarray:
+        """
+        :param frame: An RGB(A) array (E.G of the whole board)
+        :return: Which pixels of the frame are painted in a highlight color
+        """
+        pixels = np.asarray(frame)
+        keys = (pixels[..., 0].astype(np.uint32) << 16) | (pixels[..., 1].astype(np.uint32) << 8) | pixels[..., 2]
+        return self._get_table()[keys]
+
+    def get_coverage(self, masks: np.ndarray) -> np.ndarray:
+        """
+        :param masks: A (N, side, side) stack of the masks of squares (views into get_mask's outcome)
+        :return: The fraction of each square painted in a highlight color
+        """
+        masks = np.asarray(masks)
+        return masks.reshape(masks.shape[0], -1).mean(axis=1)
+
+    def detect(self, coverage: typing.Dict[str, float],
+               occupied: typing.Set[str]) -> typing.Tuple[typing.Optional[str], typing.Optional[str]]:
+        """
+        Tell the squares the last move started from and landed on
+        :param coverage: The highlight coverage of every square (E.G 'e4')
+        :param occupied: The squares holding a piece
+        :return: (from square, to square); either is None if it could not be told
+        """
+        highlighted = sorted((square for square, value in coverage.items() if value >= self.min_coverage),
+                             key=lambda square: coverage[square], reverse=True)[:2]
+        # The piece that moved stands on one of the two squares, hiding part of its highlight, while the other one is
+        # empty; should both hold a piece, the one hiding more of its highlight is taken
+        landed = [square for square in highlighted if square in occupied]
+        if not landed:
+            return (highlighted[0] if highlighted else None), None
+        to_square = min(landed, key=lambda square: coverage[square])
+        from_square = next((square for square in highlighted if square != to_square), None)
+        return from_square, to_square
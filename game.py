@@ -1,17 +1,59 @@
+import os
 import time
-import random
 import chess.engine
 import pyautogui
 import board
+import metrics
+import movecache
+import tablebase
+import timemanager
+import tracking
+import uci
+import watcher
 pyautogui.FAILSAFE = False
 
 
 class Game:
 
-    def __init__(self):
+    def __init__(self, engine_path=uci.ENGINE_PATH, engine_options=None, ponder=True, time_manager=None,
+                 clock_reader=None, opening_book=None, move_cache=None, tablebase_dir='syzygy', metrics_dir='metrics',
+                 board_watcher=None, recognition_threads=os.cpu_count(), color=None, max_timeouts=5):
         self.board = None
+        # The side we play (chess.WHITE or chess.BLACK); when None, the side at the bottom of the board once it is first
+        # read (black if the board is flipped)
+        self.color = color
         self.position_cache = {}
         self.virtual_board = None
+        self.engine_path = engine_path
+        self.engine_options = engine_options
+        self.ponder = ponder
+        self.engine = None
+        self.ponder_search = None
+        # The position right after our last move, and (board part of the FEN) after the reply pondered on
+        self.played_board = None
+        self.expected_board_fen = None
+        self.time_manager = time_manager or timemanager.TimeManager()
+        # Returns the seconds left on our clock (E.G read from the screen next to the board), or None if unknown; when
+        # not set the time manager keeps track of the clock itself
+        self.clock_reader = clock_reader
+        self.opening_book = opening_book or movecache.OpeningBook()
+        self.move_cache = move_cache or movecache.MoveCache()
+        self.tablebase = tablebase.Tablebase(tablebase_dir)
+        # The game as actually played, move by move
+        self.tracker = tracking.GameTracker()
+        # Every move is recorded (stage latencies and counters) to metrics_dir/moves.jsonl, and the histograms of every
+        # stage kept up to date in metrics_dir/chess.prom for Prometheus
+        self.metrics = metrics.recorder
+        # Tells when the opponent moved, instead of sleeping for a while and reading the whole board again
+        self.board_watcher = board_watcher or watcher.BoardWatcher()
+        # How many times in a row the watcher may give up (see BoardWatcher.timeout) with no move from the opponent
+        # before the game is left: they most likely resigned, flagged or disconnected
+        self.max_timeouts = max_timeouts
+        self.timeouts = 0
+        if metrics_dir:
+            self.metrics.set_outputs(os.path.join(metrics_dir, 'moves.jsonl'), os.path.join(metrics_dir, 'chess.prom'))
+        # The squares of every read are recognized on a pool of this many threads
+        board.set_recognition_threads(recognition_threads)
 
     def cache_positions(self):
         columns = [
@@ -23,15 +65,203 @@ class Game:
                 position = getattr(self.board, row + column)
                 self.position_cache[row+column] = position.x, position.y
 
+    def read_board(self):
+        # Once the board is located only the squares that changed since the last read are recognized again; if every
+        # square changed the board was most likely moved or resized, so locate it from scratch
+        if self.board is not None:
+            # Once the game is followed only the squares a legal move could change need confirming
+            squares = self.tracker.get_touched_squares() if self.tracker.board is not None else None
+            with self.metrics.span('game.update_board'):
+                changed = self.board.update(squares)
+            if len(changed) < 64:
+                return
+        with self.metrics.span('get_board'):
+            # The frame of every read is kept, for the watcher to compare the board with
+            self.board = board.get_board(keep_frames=True)
+        if self.board is None:
+            print('No board found')
+
     def create_virtual_board(self):
-        self.virtual_board = chess.Board(self.board.to_fen_string())
+        # The opponent's move is found among the legal moves, so that the engine gets the game with its history
+        # (castling rights, en passant, repetitions) rather than a FEN guessed from a single read; a read no legal move
+        # leads to is read again in full, and if it still does not follow the game is picked up from the read
+        if self.tracker.board is None:
+            if self.color is None:
+                self.color = chess.BLACK if self.board.flipped else chess.WHITE
+            self.tracker.reset(self.board.to_fen_string())
+        elif self.tracker.follow(self.board.state.board_fen()) is None:
+            self.metrics.count('misreads')
+            self.board.evaluate()
+            if self.tracker.follow(self.board.state.board_fen()) is None:
+                print('Board does not follow from the game, starting over from it')
+                self.metrics.count('resyncs')
+                self.tracker.reset(self.board.to_fen_string())
+        self.virtual_board = self.tracker.board.copy()
 
-    def get_next_move(self):
-        engine = chess.engine.SimpleEngine.popen_uci('engines/stockfish-10-64')
-        move = str(engine.play(self.virtual_board, chess.engine.Limit(time=2.00)).move)
-        engine.quit()
+    def read_position(self):
+        # Whether a board was found
+        self.read_board()
+        if self.board is None:
+            return False
+        self.cache_positions()
+        self.create_virtual_board()
+        return True
+
+    def print_position(self):
+        # The position as followed, which the engine searches (rather than the castling rights and side to move guessed
+        # from the read)
+        color_to_play = 'white'
+        if self.virtual_board.turn == chess.BLACK:
+            color_to_play = 'black'
+        print('Last Move: {}'.format(self.board.last_move))
+        print('Board State [{}]: {}'.format(color_to_play, self.virtual_board.fen()))
+
+    def get_engine(self):
+        # One engine process for the whole game; its hash table (and ponder search) carries over from move to move
+        if self.engine is None:
+            with self.metrics.span('engine.start'):
+                self.engine = uci.open_engine(self.engine_path, self.engine_options)
+        return self.engine
+
+    def close_engine(self):
+        self.stop_pondering()
+        if self.engine is not None:
+            self.engine.quit()
+            self.engine = None
+
+    def stop_pondering(self):
+        if self.ponder_search is not None:
+            try:
+                self.ponder_search.stop()
+                self.ponder_search.wait()
+            except chess.engine.EngineTerminatedError:
+                pass
+            self.ponder_search = None
+
+    def start_pondering(self, reply):
+        # Search the position expected after the opponent's reply until they actually move; if they do play it, the
+        # next search starts from a warm hash table
+        expected = self.played_board.copy(stack=False)
+        expected.push(reply)
+        self.expected_board_fen = expected.board_fen()
+        if self.ponder:
+            self.ponder_search = self.get_engine().analysis(expected, game=self)
+
+    def get_captured_square(self):
+        # The square the opponent just took one of our pieces on, if they did
+        if self.played_board is None or not self.board.last_move:
+            return None
+        square = chess.SQUARE_NAMES.index(self.board.last_move[1])
+        if self.played_board.color_at(square) == self.virtual_board.turn:
+            return square
+        return None
+
+    def get_known_move(self):
+        # Opening book first, then endgame tablebases and positions searched before; the engine is only asked about
+        # anything else
+        return self.opening_book.get(self.virtual_board) or self.tablebase.get(self.virtual_board) or \
+            self.move_cache.get(self.virtual_board)
+
+    def search(self, think_time):
+        self.time_manager.start_search()
+        best_move, reply, best_info = None, None, {}
+        started = time.time()
+        with self.get_engine().analysis(self.virtual_board, chess.engine.Limit(time=think_time), game=self) as search:
+            for info in search:
+                pv = info.get('pv')
+                if pv:
+                    best_move, reply, best_info = pv[0], pv[1] if len(pv) > 1 else None, info
+                if self.time_manager.should_stop(info, time.time() - started, think_time):
+                    break
+        if best_move is None:
+            result = self.get_engine().play(self.virtual_board, chess.engine.Limit(time=self.time_manager.min_time),
+                                            game=self)
+            return result.move, result.ponder
+        self.remember_search(best_move, best_info)
+        return best_move, reply
+
+    def remember_search(self, best_move, best_info):
+        score = best_info['score'].relative if 'score' in best_info else None
+        self.move_cache.put(self.virtual_board, best_move, best_info.get('depth'),
+                            score.score() if score is not None else None, score.mate() if score is not None else None)
+
+    def prepare_move(self):
+        if self.clock_reader is not None:
+            remaining = self.clock_reader()
+            if remaining is not None:
+                self.time_manager.update_clock(remaining)
+        if self.expected_board_fen is not None and self.virtual_board.board_fen() == self.expected_board_fen:
+            print('Ponder hit')
+            self.metrics.count('ponder_hits')
+        self.expected_board_fen = None
+
+    def commit_move(self, best_move):
+        self.played_board = self.virtual_board.copy(stack=False)
+        self.played_board.push(best_move)
+        self.tracker.push(best_move)
+        move = best_move.uci()
         return move[0] + str(move[1]), move[2] + str(move[3])
 
+    def get_next_move(self):
+        self.prepare_move()
+        with self.metrics.span('engine.stop_pondering'):
+            self.stop_pondering()
+        with self.metrics.span('game.known_move'):
+            known_move = self.get_known_move()
+        if known_move is not None:
+            print('Known Move: {}'.format(known_move))
+            self.metrics.count('known_moves_' + known_move.source)
+            best_move, reply = known_move.move, None
+        else:
+            think_time = self.time_manager.allocate(self.virtual_board, self.get_captured_square())
+            if think_time == 0:
+                best_move, reply = self.time_manager.get_forced_move(self.virtual_board), None
+            else:
+                try:
+                    with self.metrics.span('engine.search'):
+                        best_move, reply = self.search(think_time)
+                except chess.engine.EngineTerminatedError:
+                    self.engine = None
+                    self.metrics.count('engine_restarts')
+                    with self.metrics.span('engine.search'):
+                        best_move, reply = self.search(think_time)
+        squares = self.commit_move(best_move)
+        if reply is not None:
+            self.start_pondering(reply)
+        return squares
+
+    def wait_for_opponent(self):
+        # Only the squares the opponent can move from or to are watched, minus those our own move changed; they are
+        # compared with the board as read before our move, so that a move premoved during our move's animation is not
+        # taken for the board settling
+        if self.played_board is None or self.played_board.is_game_over():
+            return True
+        squares = tracking.get_move_squares(self.played_board) - \
+            tracking.get_played_squares(self.virtual_board, self.played_board.peek())
+        return self.board_watcher.wait_for_change(self.board, squares, self.board.frame_gray)
+
+    def wait_for_turn(self):
+        # The board was read while the opponent is still to move in the game as followed (our move was not on screen
+        # yet, or the opponent has not replied): wait for them to change the board, compared with the read, rather
+        # than search a move for them
+        if self.tracker.board.is_game_over():
+            return True
+        squares = tracking.get_move_squares(self.tracker.board)
+        return self.board_watcher.wait_for_change(self.board, squares, self.board.frame_gray)
+
+    def opponent_left(self, moved):
+        # The board is read again after the watcher gives up all the same (it may have missed the move), until it gave
+        # up max_timeouts times in a row
+        if moved:
+            self.timeouts = 0
+            return False
+        self.timeouts += 1
+        self.metrics.count('watcher_timeouts')
+        if self.timeouts < self.max_timeouts:
+            return False
+        print('No move from the opponent, leaving the game')
+        return True
+
     def move(self, start_pos, dest_pos):
         center_of_start_pos = self.position_cache[start_pos][0] + self.board.unit_pixels/2, \
                               self.position_cache[start_pos][1] + self.board.unit_pixels/2
@@ -42,23 +272,53 @@ class Game:
         pyautogui.click()
         pyautogui.dragTo(center_of_dest_pos, duration=.1, tween=pyautogui.linear)
 
+    def send_move(self, start_pos, dest_pos):
+        with self.metrics.span('game.move'):
+            self.move(start_pos, dest_pos)
+            time.sleep(.01)
+            pyautogui.click()
+
+    def close(self):
+        self.opening_book.close()
+        self.move_cache.close()
+        self.tablebase.close()
+        board.set_recognition_threads(None)
+
     def start(self):
+        try:
+            self.play()
+        finally:
+            self.close_engine()
+            self.close()
+
+    def play(self):
         while True:
-            self.board = board.get_board()
-            self.cache_positions()
-            self.create_virtual_board()
-            color_to_play = 'white'
-            if not self.board.white_to_move:
-                color_to_play = 'black'
-            print('Last Move: {}'.format(self.board.last_move))
-            print('Board State [{}]: {}'.format(color_to_play, self.board.to_fen_string()))
-            start, dest = self.get_next_move()
+            self.metrics.start_move()
+            if not self.read_position() or self.virtual_board.is_game_over():
+                break
+            if self.virtual_board.turn != self.color:
+                print('Waiting for the opponent to move')
+                self.metrics.count('reads_before_our_turn')
+                with self.metrics.span('game.wait_for_opponent'):
+                    moved = self.wait_for_turn()
+                if self.opponent_left(moved):
+                    break
+                continue
+            turn_started = time.time()
+            self.print_position()
+            with self.metrics.span('game.get_next_move'):
+                start, dest = self.get_next_move()
             print('Moving: {} to {}'.format(str(getattr(self.board, start).piece), dest))
-            self.move(start, dest)
-            time.sleep(.01)
-            pyautogui.click()
-            time.sleep(random.randint(1, random.randint(5, 9)))
-            if self.virtual_board.is_checkmate() or self.virtual_board.is_stalemate():
+            self.send_move(start, dest)
+            self.metrics.finish_move(fen=self.virtual_board.fen(), move=start + dest)
+            if self.clock_reader is None:
+                self.time_manager.spend(time.time() - turn_started)
+            # Our move ended the game (virtual_board is the position before it)
+            if self.played_board.is_game_over():
+                break
+            with self.metrics.span('game.wait_for_opponent'):
+                moved = self.wait_for_opponent()
+            if self.opponent_left(moved):
                 break
 
 
@@ -1,7 +1,11 @@
 import cv2
 import numpy as np
-import pyautogui
 import random
+try:
+    import pyautogui
+except Exception:
+    # No display (E.G a headless server); only images already captured can be searched
+    pyautogui = None
 import time
 
 
@@ -24,19 +28,31 @@ def region_grabber(region):
     return pyautogui.screenshot(region=(x1,y1,width,height))
 
 
+'''
+
+grabs the whole screen
+
+output : a PIL image of the screen.
+
+'''
+def screen_grabber():
+    return pyautogui.screenshot()
+
+
 '''
 
 Searchs for an image within an area
 
 input :
 
-image : path to the image file (see opencv imread for supported types)
+image : path to the image file (see opencv imread for supported types) or an already decoded grayscale numpy array
 x1 : top left x value
 y1 : top left y value
 x2 : bottom right x value
 y2 : bottom right y value
 precision : the higher, the lesser tolerant and fewer false positives are found default is 0.8
-im : a PIL image, usefull if you intend to search the same unchanging region for several elements
+im : a PIL image or numpy array, usefull if you intend to search the same unchanging region for several elements
+     (2D grayscale arrays are searched as-is, without a color conversion)
 
 returns :
 the top left corner coordinates of the element if found as an array [x,y] or [-1,-1] if not
@@ -47,9 +63,8 @@ def imagesearcharea(image, x1,y1,x2,y2, precision=0.8, im=None) :
         im = region_grabber(region=(x1, y1, x2, y2))
         im.save('testarea.png')#\ usefull for debugging purposes, this will save the captured region as "testarea.png"
 
-    img_rgb = np.array(im)
-    img_gray = cv2.cvtColor(img_rgb, cv2.COLOR_BGR2GRAY)
-    template = cv2.imread(image, 0)
+    img_gray = to_grayscale(im)
+    template = load_template(image)
 
     res = cv2.matchTemplate(img_gray, template, cv2.TM_CCOEFF_NORMED)
     min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
@@ -58,6 +73,91 @@ def imagesearcharea(image, x1,y1,x2,y2, precision=0.8, im=None) :
     return max_loc
 
 
+'''
+
+finds the best match of an image within an already captured image
+
+input :
+
+image : path to the image file (see opencv imread for supported types) or an already decoded grayscale numpy array
+im : a PIL image or numpy array to search (2D grayscale arrays are searched as-is, without a color conversion)
+
+returns :
+the normalized correlation of the best match [-1, 1] and its top left corner coordinates [x,y]
+
+'''
+def best_match(image, im):
+    res = cv2.matchTemplate(to_grayscale(im), load_template(image), cv2.TM_CCOEFF_NORMED)
+    min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(res)
+    return max_val, max_loc
+
+
+'''
+
+loads a template to search for
+
+input :
+
+image : path to the image file (see opencv imread for supported types) or an already decoded grayscale numpy array
+
+returns :
+the template as a 2D numpy array
+
+'''
+def load_template(image):
+    if isinstance(image, str):
+        return cv2.imread(image, 0)
+    return image
+
+
+'''
+
+converts an image to the grayscale array the searches work on
+
+input :
+
+im : a PIL image or numpy array; 2D arrays are assumed to already be grayscale and are returned untouched
+
+returns :
+a 2D numpy array
+
+'''
+def to_grayscale(im):
+    img = np.asarray(im)
+    if img.ndim == 2:
+        return img
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+def to_gray_levels(colors):
+    """
+    :param colors: (r, g, b) colors
+    :return: The gray level each color turns into through to_grayscale
+    """
+    return [float(level) for level in to_grayscale(np.array([colors], dtype=np.uint8))[0]]
+
+
+'''
+
+counts the pixels of an image that match a color, using the same tolerance semantics as autopy's
+Bitmap.count_of_color (0 for an exact match, 1 for any color)
+
+input :
+
+im : a PIL image or RGB(A) numpy array
+color : the (r, g, b) color to look for
+tolerance : the allowed euclidean distance, as a fraction of the largest possible distance between two colors
+
+returns :
+the number of matching pixels
+
+'''
+def count_of_color(im, color, tolerance=0.0):
+    img = np.asarray(im)[..., :3].astype(np.int32)
+    distance = ((img - np.asarray(color, dtype=np.int32)) ** 2).sum(axis=-1)
+    return int(np.count_nonzero(distance <= (tolerance ** 2) * 3 * 255 ** 2))
+
+
 '''
 
 click on the center of an image with a bit of random.
@@ -87,7 +187,7 @@ Searchs for an image on the screen
 
 input :
 
-image : path to the image file (see opencv imread for supported types)
+image : path to the image file (see opencv imread for supported types) or an already decoded grayscale numpy array
 precision : the higher, the lesser tolerant and fewer false positives are found default is 0.8
 im : a PIL image, usefull if you intend to search the same unchanging region for several elements
 
@@ -100,7 +200,7 @@ def imagesearch(image, precision=0.8):
     #im.save('testarea.png') usefull for debugging purposes, this will save the captured region as "testarea.png"
     img_rgb = np.array(im)
     img_gray = cv2.cvtColor(img_rgb, cv2.COLOR_BGR2GRAY)
-    template = cv2.imread(image, 0)
+    template = load_template(image)
     template.shape[::-1]
 
     res = cv2.matchTemplate(img_gray, template, cv2.TM_CCOEFF_NORMED)
@@ -196,7 +296,7 @@ def imagesearch_count(image, precision=0.9):
     img_rgb = pyautogui.screenshot()
     img_rgb = np.array(img_rgb)
     img_gray = cv2.cvtColor(img_rgb, cv2.COLOR_BGR2GRAY)
-    template = cv2.imread(image, 0)
+    template = load_template(image)
     w, h = template.shape[::-1]
     res = cv2.matchTemplate(img_gray, template, cv2.TM_CCOEFF_NORMED)
     loc = np.where(res >= precision)
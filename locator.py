@@ -0,0 +1,238 @@
+import typing
+
+import cv2
+import numpy as np
+
+import templates
+
+
+class BoardLocation:
+    """
+    A board found on a screenshot, by the position of its corner markers
+    """
+    def __init__(self, top_left: typing.Tuple[int, int], bottom_right: typing.Tuple[int, int], orientation: str,
+                 confidence: float, marker_scale: float, top_marker: str, bottom_marker: str):
+        """
+        :param top_left: The x, y coordinates (in pixels) of the top left corner of the top left marker
+        :param bottom_right: The x, y coordinates (in pixels) of the top left corner of the bottom right marker
+        :param orientation: Either 'normal' or 'flipped'
+        :param confidence: The mean correlation of the two markers [-1, 1]
+        :param marker_scale: The factor the marker PNGs were scaled by to match the board
+        :param top_marker: The path of the top left marker PNG
+        :param bottom_marker: The path of the bottom right marker PNG
+        """
+        self.top_left = top_left
+        self.bottom_right = bottom_right
+        self.orientation = orientation
+        self.confidence = confidence
+        self.marker_scale = marker_scale
+        self.top_marker = top_marker
+        self.bottom_marker = bottom_marker
+
+    def __str__(self):
+        return '{} board {} - {} (scale {:.2f}, confidence {:.2f})'.format(
+            self.orientation, self.top_left, self.bottom_right, self.marker_scale, self.confidence)
+
+
+class BoardLocator:
+    """
+    Finds a board of any size on a single screenshot.
+
+    The markers of every orientation are scaled on the fly over a range of sizes and all searched for on a downscaled
+    copy of the screenshot; only the best pair is then refined, at full resolution and within a small region.
+    """
+
+    def __init__(self, bank: templates.TemplateBank, min_scale=.5, max_scale=2.0, scale_step=1.12, coarse_factor=.25,
+                 precision=.9, refined_candidates=6):
+        """
+        :param bank: The marker templates to search for (the first set of each orientation is used), and the sample
+                     boards telling how far apart they are
+        :param min_scale: The smallest factor the markers are scaled by
+        :param max_scale: The largest factor the markers are scaled by
+        :param scale_step: The ratio between two consecutive scale factors
+        :param coarse_factor: The factor the screenshot is downscaled by for the coarse search
+        :param precision: The lowest correlation accepted for each refined marker
+        :param refined_candidates: How many of the best pairs found on the downscaled screenshot are refined
+        """
+        self.precision = precision
+        self.refined_candidates = refined_candidates
+        self.coarse_factor = coarse_factor
+        self.scale_step = scale_step
+        # Geometric steps, always including the size the markers were captured at
+        self.scales = [1.0]
+        while self.scales[0] / scale_step >= min_scale:
+            self.scales.insert(0, self.scales[0] / scale_step)
+        while self.scales[-1] * scale_step <= max_scale:
+            self.scales.append(self.scales[-1] * scale_step)
+        self.bank = bank
+        self._reference_offsets = None
+        self.marker_sets = []
+        for orientation in ('normal', 'flipped'):
+            markers = sorted((marker for marker in bank.markers if marker.orientation == orientation),
+                             key=lambda marker: marker.marker_set)
+            top = next((marker for marker in markers if marker.corner == 'top-left'), None)
+            bottom = next((marker for marker in markers if marker.corner == 'bottom-right'), None)
+            if top and bottom:
+                self.marker_sets.append((top, bottom, orientation))
+
+    @staticmethod
+    def _best_match(image: np.ndarray, template: np.ndarray) -> typing.Tuple[float, typing.Tuple[int, int]]:
+        if template.shape[0] > image.shape[0] or template.shape[1] > image.shape[1]:
+            return -1.0, (-1, -1)
+        result = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        return max_val, max_loc
+
+    @staticmethod
+    def _is_board_shaped(top_left: typing.Tuple, bottom_right: typing.Tuple) -> bool:
+        width, height = bottom_right[0] - top_left[0], bottom_right[1] - top_left[1]
+        return width > 0 and height > 0 and abs(width - height) <= .2 * height
+
+    def _refine(self, screen: np.ndarray, template: np.ndarray, marker_scale: float,
+                coarse_loc: typing.Tuple[int, int]) -> typing.Tuple[float, typing.Tuple[int, int], float]:
+        """
+        Search a marker at full resolution around its coarse position, fine tuning its scale
+        :return: The correlation, x, y coordinates and scale of the best match
+        """
+        best = (-1.0, (-1, -1), marker_scale)
+        margin = int(round(2 / self.coarse_factor)) + 2
+        quarter_step = self.scale_step ** .25
+        for factor in [marker_scale * quarter_step ** step for step in range(-2, 3)]:
+            scaled = templates.scale_template(template, factor)
+            x = max(0, int(round(coarse_loc[0] / self.coarse_factor)) - margin)
+            y = max(0, int(round(coarse_loc[1] / self.coarse_factor)) - margin)
+            region = screen[y:y + scaled.shape[0] + 2 * margin, x:x + scaled.shape[1] + 2 * margin]
+            value, loc = self._best_match(region, scaled)
+            if value > best[0]:
+                best = (value, (x + loc[0], y + loc[1]), factor)
+        return best
+
+    def _get_reference_offsets(self) -> typing.Dict[str, typing.Tuple[int, int]]:
+        """
+        Measure, on the sample boards of the skin, how far apart the two markers of each orientation are when the
+        markers are at their captured size; a board found with markers scaled by a factor is then expected to have its
+        markers that many times further apart
+        :return: The (dx, dy) offset of the bottom right marker from the top left one, per orientation
+        """
+        if self._reference_offsets is None:
+            self._reference_offsets = {}
+            for top, bottom, orientation in self.marker_sets:
+                best = None
+                for sample in self.bank.boards.values():
+                    top_value, top_loc = self._best_match(sample, top.image)
+                    bottom_value, bottom_loc = self._best_match(sample, bottom.image)
+                    value = min(top_value, bottom_value)
+                    if value >= self.precision and self._is_board_shaped(top_loc, bottom_loc) and \
+                            (best is None or value > best[0]):
+                        best = (value, (bottom_loc[0] - top_loc[0], bottom_loc[1] - top_loc[1]))
+                if best:
+                    self._reference_offsets[orientation] = best[1]
+        return self._reference_offsets
+
+    def _find_pair(self, coarse: np.ndarray, top: np.ndarray, bottom: np.ndarray,
+                   offset: typing.Optional[typing.Tuple[int, int]]) -> typing.Optional[typing.Tuple]:
+        """
+        Find the best top left/bottom right pair of (scaled) markers on the coarse screenshot
+        :param offset: The expected offset of the bottom right marker from the top left one, if known
+        :return: The score, top left and bottom right coordinates of the pair, or None if the markers do not pair up
+        """
+        if top.shape[0] > coarse.shape[0] or top.shape[1] > coarse.shape[1] or \
+                bottom.shape[0] > coarse.shape[0] or bottom.shape[1] > coarse.shape[1]:
+            return None
+        top_result = cv2.matchTemplate(coarse, top, cv2.TM_CCOEFF_NORMED)
+        bottom_result = cv2.matchTemplate(coarse, bottom, cv2.TM_CCOEFF_NORMED)
+        if offset is None:
+            top_loc, bottom_loc = cv2.minMaxLoc(top_result)[3], cv2.minMaxLoc(bottom_result)[3]
+            if not self._is_board_shaped(top_loc, bottom_loc):
+                return None
+            return min(top_result[top_loc[1], top_loc[0]], bottom_result[bottom_loc[1], bottom_loc[0]]), top_loc, \
+                bottom_loc
+        # Score both markers together: every top left position plus the best bottom right position found (within some
+        # slack) at the expected offset from it
+        dx, dy = offset
+        # The true scale of the board lies somewhere between two of the scales tried
+        slack = max(1, int(round((self.scale_step - 1) * max(dx, dy))))
+        height, width = min(top_result.shape[0], bottom_result.shape[0] - dy), \
+            min(top_result.shape[1], bottom_result.shape[1] - dx)
+        if height <= 0 or width <= 0:
+            return None
+        bottom_best = cv2.dilate(bottom_result, np.ones((2 * slack + 1, 2 * slack + 1), np.uint8))
+        joint = top_result[:height, :width] + bottom_best[dy:dy + height, dx:dx + width]
+        y, x = np.unravel_index(np.argmax(joint), joint.shape)
+        window_x, window_y = max(0, x + dx - slack), max(0, y + dy - slack)
+        window = bottom_result[window_y:y + dy + slack + 1, window_x:x + dx + slack + 1]
+        window_loc = cv2.minMaxLoc(window)[3]
+        return float(joint[y, x]) / 2, (int(x), int(y)), (window_x + window_loc[0], window_y + window_loc[1])
+
+    def locate(self, screen: np.ndarray) -> typing.Optional[BoardLocation]:
+        """
+        Find the board on a screenshot
+        :param screen: The grayscale screenshot
+        :return: The location of the board, or None if no board was found
+        """
+        coarse = cv2.resize(screen, None, fx=self.coarse_factor, fy=self.coarse_factor, interpolation=cv2.INTER_AREA)
+        reference_offsets = self._get_reference_offsets()
+        candidates = []
+        for top, bottom, orientation in self.marker_sets:
+            for marker_scale in self.scales:
+                factor = marker_scale * self.coarse_factor
+                offset = None
+                if orientation in reference_offsets:
+                    offset = tuple(int(round(value * factor)) for value in reference_offsets[orientation])
+                pair = self._find_pair(coarse, templates.scale_template(top.image, factor),
+                                       templates.scale_template(bottom.image, factor), offset)
+                if pair:
+                    candidates.append((pair[0], marker_scale, top, bottom, orientation, pair[1], pair[2]))
+        # Markers also match the corners of smaller boards (made of inner squares) and boards of the other orientation
+        # fairly well at low resolution; so the best few pairs are refined, and the refined correlations decide
+        best = None
+        for score, marker_scale, top, bottom, orientation, top_loc, bottom_loc in \
+                sorted(candidates, key=lambda c: c[0], reverse=True)[:self.refined_candidates]:
+            top_value, top_left, top_scale = self._refine(screen, top.image, marker_scale, top_loc)
+            bottom_value, bottom_right, _ = self._refine(screen, bottom.image, marker_scale, bottom_loc)
+            if min(top_value, bottom_value) < self.precision or not self._is_board_shaped(top_left, bottom_right):
+                continue
+            confidence = (top_value + bottom_value) / 2
+            if best is None or confidence > best.confidence:
+                best = BoardLocation(top_left, bottom_right, orientation, confidence, top_scale, top.path, bottom.path)
+        return best
+
+
+def fit_grid(screen: np.ndarray, origin: typing.Tuple[float, float], side: float, max_shift=.25,
+             max_stretch=.08) -> typing.Tuple[typing.Tuple[float, float], float]:
+    """
+    Snap an estimated grid of 8x8 squares onto the edges between the (light and dark) squares of a board; the corner
+    markers only tell roughly where a board is, and a square side off by a few pixels adds up to a large part of a
+    square by the last rank
+    :param screen: The grayscale screenshot holding the board
+    :param origin: The estimated x, y coordinates (in pixels) of the top left corner of the squares
+    :param side: The estimated side (in pixels) of a square
+    :param max_shift: How far (as a part of a square) the corner may be off
+    :param max_stretch: How far (as a part of the side) the side may be off
+    :return: The fitted origin and side, or the estimated ones if the board shows no edges to fit
+    """
+    sides = np.arange(side * (1 - max_stretch), side * (1 + max_stretch), .25)
+    shifts = np.arange(-int(side * max_shift), int(side * max_shift) + 1)
+    pixels = screen.astype(np.float32)
+    scores = np.zeros(len(sides))
+    fitted = []
+    for axis in (0, 1):
+        # The (x or y) profile of the edges, taken across the rough extent of the board only
+        start, end = (max(0, int(origin[1 - axis])), max(0, int(origin[1 - axis] + 8 * side)))
+        across = pixels[start:end] if axis == 0 else pixels[:, start:end]
+        profile = np.abs(np.diff(across, axis=1 - axis)).sum(axis=axis)
+        if profile.size < 3 or not profile.any():
+            return origin, side
+        # Edges blurred over two pixels count fully wherever the grid line falls
+        profile = np.maximum(profile, np.maximum(np.roll(profile, 1), np.roll(profile, -1)))
+        # The 7 inner lines of the grid (the outer border of a board may not show against its background), for every
+        # shift and side tried; the edge between pixels i and i + 1 is at index i of the profile
+        lines = origin[axis] + shifts[:, None, None] + sides[None, :, None] * np.arange(1, 8)[None, None, :]
+        indexes = np.round(lines).astype(int) - 1
+        inside = (indexes >= 0) & (indexes < profile.size)
+        totals = np.where(inside, profile[np.clip(indexes, 0, profile.size - 1)], 0).sum(axis=2)
+        best_shifts = totals.argmax(axis=0)
+        scores += totals.max(axis=0)
+        fitted.append(best_shifts)
+    best = int(scores.argmax())
+    return (float(origin[0] + shifts[fitted[0][best]]), float(origin[1] + shifts[fitted[1][best]])), float(sides[best])
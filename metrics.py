@@ -0,0 +1,176 @@
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+import typing
+
+# Upper bounds (in seconds) of the latency histogram buckets; from a single template match up to a long engine search
+DEFAULT_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """
+    The distribution of the latencies of a single stage, in Prometheus histogram form (cumulative buckets, sum, count)
+    """
+
+    def __init__(self, buckets: typing.Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # One more bucket than bounds, for +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def get_cumulative_counts(self) -> typing.List[typing.Tuple[str, int]]:
+        """
+        :return: (le label, number of observations less than or equal to the bound) pairs, ending with +Inf
+        """
+        cumulative, total = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            cumulative.append(('+Inf' if bound == float('inf') else repr(bound), total))
+        return cumulative
+
+
+class Metrics:
+    """
+    Latency spans and counters of the stages of reading the board and playing a move.
+
+    Stages are timed with Metrics.span and events counted with Metrics.count anywhere in the code; everything recorded
+    between Metrics.start_move and Metrics.finish_move makes up the record of that move, appended as a JSON line to
+    json_path. Histograms of every stage and totals of every counter accumulate over the process and are (atomically)
+    rewritten to textfile_path in the Prometheus text format, for the node_exporter textfile collector.
+    """
+
+    def __init__(self, json_path: str = None, textfile_path: str = None, buckets: typing.Sequence[float] = DEFAULT_BUCKETS,
+                 prefix='chess'):
+        """
+        :param json_path: The file every move record is appended to (None to not write any)
+        :param textfile_path: The Prometheus textfile to keep up to date (None to not write any)
+        :param buckets: The upper bounds (in seconds) of the latency histogram buckets
+        :param prefix: The prefix of the Prometheus metric names
+        """
+        self.json_path = json_path
+        self.textfile_path = textfile_path
+        self.buckets = buckets
+        self.prefix = prefix
+        self.histograms = {}
+        self.counters = {}
+        self.move_spans = {}
+        self.move_counters = {}
+        self.move_started = None
+        # Squares may be recognized on several threads
+        self.lock = threading.Lock()
+
+    def set_outputs(self, json_path: str = None, textfile_path: str = None) -> None:
+        for path in (json_path, textfile_path):
+            if path and os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.json_path = json_path
+        self.textfile_path = textfile_path
+
+    def observe(self, stage: str, seconds: float) -> None:
+        """
+        Record how long a stage took
+        :param stage: The name of the stage (E.G 'board.classify')
+        :param seconds: How long it took
+        """
+        with self.lock:
+            if stage not in self.histograms:
+                self.histograms[stage] = Histogram(self.buckets)
+            self.histograms[stage].observe(seconds)
+            # A stage run several times during a move (E.G one per square) adds up
+            calls, total = self.move_spans.get(stage, (0, 0.0))
+            self.move_spans[stage] = calls + 1, total + seconds
+
+    @contextlib.contextmanager
+    def span(self, stage: str) -> typing.Iterator[None]:
+        """
+        Time the code run within the context as a stage (even when it raises)
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def count(self, event: str, amount=1) -> None:
+        """
+        Count an event (E.G a template tried on a square, a marker set attempted)
+        """
+        with self.lock:
+            self.counters[event] = self.counters.get(event, 0) + amount
+            self.move_counters[event] = self.move_counters.get(event, 0) + amount
+
+    def start_move(self) -> None:
+        """
+        Start recording a new move; whatever was recorded since the last move finished is discarded from its record
+        (not from the histograms and counters)
+        """
+        with self.lock:
+            self.move_spans = {}
+            self.move_counters = {}
+            self.move_started = time.perf_counter()
+
+    def finish_move(self, **fields) -> typing.Dict:
+        """
+        Finish recording a move, then write its record and the Prometheus textfile
+        :param fields: JSON serializable fields to add to the record (E.G the FEN and the move played)
+        :return: The record of the move: the time and duration of the move, then per stage the number of calls and
+                 seconds spent, and per event its count
+        """
+        finished = time.perf_counter()
+        with self.lock:
+            record = dict(fields)
+            record['time'] = time.time()
+            record['seconds'] = finished - self.move_started if self.move_started is not None else None
+            record['stages'] = {stage: {'calls': calls, 'seconds': seconds}
+                                for stage, (calls, seconds) in sorted(self.move_spans.items())}
+            record['counters'] = dict(sorted(self.move_counters.items()))
+            self.move_started = None
+        if record['seconds'] is not None:
+            self.observe('move', record['seconds'])
+        if self.json_path:
+            with open(self.json_path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        if self.textfile_path:
+            self.write_textfile(self.textfile_path)
+        return record
+
+    def to_prometheus(self) -> str:
+        """
+        :return: Every histogram and counter in the Prometheus text exposition format
+        """
+        seconds, events = '{}_stage_seconds'.format(self.prefix), '{}_events_total'.format(self.prefix)
+        lines = [
+            '# HELP {} Seconds spent in each stage of reading the board and playing a move.'.format(seconds),
+            '# TYPE {} histogram'.format(seconds)
+        ]
+        with self.lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                for bound, count in histogram.get_cumulative_counts():
+                    lines.append('{}_bucket{{stage="{}",le="{}"}} {}'.format(seconds, stage, bound, count))
+                lines.append('{}_sum{{stage="{}"}} {!r}'.format(seconds, stage, histogram.sum))
+                lines.append('{}_count{{stage="{}"}} {}'.format(seconds, stage, histogram.count))
+            lines.append('# HELP {} Events counted while reading the board and playing a move.'.format(events))
+            lines.append('# TYPE {} counter'.format(events))
+            for event, count in sorted(self.counters.items()):
+                lines.append('{}{{event="{}"}} {}'.format(events, event, count))
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path: str) -> None:
+        # Written next to the file then renamed over it, so the collector never reads half a file
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary, 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(temporary, path)
+
+
+# Shared by every module taking part in reading the board and playing moves
+recorder = Metrics()
@@ -0,0 +1,138 @@
+import os
+import sqlite3
+import time
+import typing
+
+import chess
+import chess.polyglot
+
+
+class KnownMove:
+    """
+    A move found without searching (in the opening book, the endgame tablebases or the move cache)
+    """
+    def __init__(self, move: chess.Move, source: str, depth: typing.Optional[int] = None,
+                 score: typing.Optional[int] = None, mate: typing.Optional[int] = None):
+        """
+        :param move: The move
+        :param source: Either 'book', 'tablebase' or 'cache'
+        :param depth: The depth the move was searched to, for cached moves
+        :param score: The score (centipawns, from the side to move's point of view) the search ended with, if any
+        :param mate: The moves to mate (negative when getting mated) the search ended with, if any
+        """
+        self.move = move
+        self.source = source
+        self.depth = depth
+        self.score = score
+        self.mate = mate
+
+    def __str__(self):
+        if self.source != 'cache':
+            return '{} ({})'.format(self.move, self.source)
+        return '{} (cache, depth {})'.format(self.move, self.depth)
+
+
+class OpeningBook:
+    """
+    A Polyglot opening book; optional, positions are simply never found when the book file does not exist
+    """
+
+    def __init__(self, path='books/book.bin', minimum_weight=1):
+        """
+        :param path: The Polyglot .bin file
+        :param minimum_weight: The lowest weight of a book move to be played
+        """
+        self.path = path
+        self.minimum_weight = minimum_weight
+        self.reader = chess.polyglot.open_reader(path) if os.path.exists(path) else None
+
+    def get(self, board: chess.Board) -> typing.Optional[KnownMove]:
+        """
+        :return: The highest weighted book move of the position, or None if the position is not in the book
+        """
+        if self.reader is None:
+            return None
+        try:
+            entry = self.reader.find(board, minimum_weight=self.minimum_weight)
+        except IndexError:
+            return None
+        return KnownMove(entry.move, 'book')
+
+    def close(self) -> None:
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+
+class MoveCache:
+    """
+    Moves found by the engine, persisted to an SQLite database and keyed by the normalized position (the EPD: pieces,
+    side to move, castling rights and a legal en passant square; move counters left out).
+
+    The cache holds at most max_entries positions; the least recently used ones are evicted first.
+    """
+
+    def __init__(self, path='cache/moves.sqlite', max_entries=100000, min_depth=10):
+        """
+        :param path: The SQLite database file
+        :param max_entries: How many positions to keep
+        :param min_depth: The lowest search depth worth caching (and replaying)
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.min_depth = min_depth
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS moves (position TEXT PRIMARY KEY, move TEXT NOT NULL, '
+                                'depth INTEGER NOT NULL, score INTEGER, mate INTEGER, used REAL NOT NULL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS moves_used ON moves (used)')
+        self.connection.commit()
+
+    @staticmethod
+    def get_key(board: chess.Board) -> str:
+        return board.epd()
+
+    def get(self, board: chess.Board) -> typing.Optional[KnownMove]:
+        """
+        :return: The cached move of the position, or None if it was never searched deep enough (or is now illegal)
+        """
+        key = self.get_key(board)
+        row = self.connection.execute('SELECT move, depth, score, mate FROM moves WHERE position = ? AND depth >= ?',
+                                      (key, self.min_depth)).fetchone()
+        if row is None:
+            return None
+        move = chess.Move.from_uci(row[0])
+        if move not in board.legal_moves:
+            return None
+        self.connection.execute('UPDATE moves SET used = ? WHERE position = ?', (time.time(), key))
+        self.connection.commit()
+        return KnownMove(move, 'cache', row[1], row[2], row[3])
+
+    def put(self, board: chess.Board, move: chess.Move, depth: typing.Optional[int], score: typing.Optional[int] = None,
+            mate: typing.Optional[int] = None) -> None:
+        """
+        Remember the move the engine found for a position; shallower searches never replace deeper ones
+        :param depth: The depth the search reached
+        :param score: The score (centipawns, from the side to move's point of view) the search ended with, if any
+        :param mate: The moves to mate the search ended with, if any
+        """
+        if depth is None or depth < self.min_depth:
+            return
+        self.connection.execute('INSERT INTO moves (position, move, depth, score, mate, used) VALUES (?, ?, ?, ?, ?, ?) '
+                                'ON CONFLICT (position) DO UPDATE SET move = excluded.move, depth = excluded.depth, '
+                                'score = excluded.score, mate = excluded.mate, used = excluded.used '
+                                'WHERE excluded.depth >= moves.depth',
+                                (self.get_key(board), move.uci(), depth, score, mate, time.time()))
+        self.evict()
+        self.connection.commit()
+
+    def evict(self) -> None:
+        count = self.connection.execute('SELECT COUNT(*) FROM moves').fetchone()[0]
+        if count > self.max_entries:
+            self.connection.execute('DELETE FROM moves WHERE position IN '
+                                    '(SELECT position FROM moves ORDER BY used LIMIT ?)', (count - self.max_entries,))
+
+    def close(self) -> None:
+        self.connection.close()
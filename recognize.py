@@ -0,0 +1,116 @@
+import argparse
+import functools
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+import typing
+
+import cv2
+
+import board
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def list_images(sources: typing.Iterable[str]) -> typing.List[str]:
+    """
+    :param sources: Directories (searched recursively), glob patterns or paths of screenshots
+    :return: The paths of every PNG/JPEG screenshot found, in a stable order
+    """
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            for directory, _, names in sorted(os.walk(source)):
+                paths.extend(os.path.join(directory, name) for name in sorted(names)
+                             if name.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            paths.extend(path for path in sorted(glob.glob(source, recursive=True))
+                         if path.lower().endswith(IMAGE_EXTENSIONS))
+    return paths
+
+
+def recognize_file(path: str, screen_scale=2.0, recognition='template',
+                   skin_pack: typing.Optional[str] = None) -> typing.Dict:
+    """
+    Read the board of a single screenshot
+    :param path: The path of the screenshot
+    :param screen_scale: The scale factor of the display the screenshot was taken on
+    :param recognition: One of Board.RECOGNITION_MODES
+    :param skin_pack: The path of the pack of the skin the board is drawn in (see skinpack.py); None for the default
+                      skin
+    :return: A JSON serializable dict of the file, FEN (None if no board was found), pieces (see Board.to_json),
+             per-square confidence and the seconds spent on each stage
+    """
+    started = time.time()
+    result = {'file': path, 'fen': None}
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    loaded = time.time()
+    if image is None:
+        result['error'] = 'Could not decode image'
+    else:
+        # Screen captures are RGB, which the square colors (E.G of the last move highlight) are defined in
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        found = board.read_board_from_image(image, screen_scale, recognition=recognition,
+                                            skin=board.get_skin(skin_pack))
+        if found is None:
+            result['error'] = 'No board found'
+        else:
+            result['fen'] = found.to_fen_string()
+            result['flipped'] = found.flipped
+            result['last_move'] = found.last_move
+            result['last_move_from'] = found.last_move_from
+            result['pieces'] = found.to_json()
+            result['confidence'] = {
+                row + column: getattr(found, row + column).confidence for row in found.rows for column in found.columns
+            }
+    finished = time.time()
+    result['timing'] = {'load': loaded - started, 'recognize': finished - loaded, 'total': finished - started}
+    return result
+
+
+def recognize_files(paths: typing.Iterable[str], processes: typing.Optional[int] = None, screen_scale=2.0,
+                    recognition='template', threads=1,
+                    skin_pack: typing.Optional[str] = None) -> typing.Iterator[typing.Dict]:
+    """
+    Read the boards of many screenshots on a pool of processes
+    :param paths: The paths of the screenshots
+    :param processes: How many processes to run, one per core by default
+    :param threads: How many threads each process recognizes the squares of a board on (see
+                    board.set_recognition_threads); E.G a single process with one thread per core reads every screenshot
+                    as fast as possible, rather than many of them at once
+    :param skin_pack: The path of the pack of the skin the boards are drawn in (loaded once per process)
+    :return: The results of recognize_file, yielded in the same order as the paths as soon as each one is done
+    """
+    recognize = functools.partial(recognize_file, screen_scale=screen_scale, recognition=recognition,
+                                  skin_pack=skin_pack)
+    with multiprocessing.Pool(processes, initializer=board.set_recognition_threads, initargs=(threads,)) as pool:
+        for result in pool.imap(recognize, paths, chunksize=4):
+            yield result
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Read the boards of screenshots (without a display) and print one '
+                                                 'JSON result per screenshot')
+    parser.add_argument('sources', nargs='+', help='Directories, glob patterns or paths of PNG/JPEG screenshots')
+    parser.add_argument('--processes', type=int, default=None, help='Processes to run (defaults to one per core)')
+    parser.add_argument('--scale', type=float, default=2.0,
+                        help='Scale factor of the display the screenshots were taken on (2 on retina displays)')
+    parser.add_argument('--recognition', choices=board.Board.RECOGNITION_MODES, default='template')
+    parser.add_argument('--threads', type=int, default=1, help='Threads each process recognizes squares on')
+    parser.add_argument('--skin', default=None,
+                        help='Pack of the skin the boards are drawn in (see skinpack.py; defaults to the bundled skin)')
+    args = parser.parse_args(argv)
+
+    paths = list_images(args.sources)
+    if not paths:
+        print('No screenshots found', file=sys.stderr)
+        sys.exit(1)
+    for result in recognize_files(paths, args.processes, args.scale, args.recognition, args.threads, args.skin):
+        print(json.dumps(result), flush=True)
+
+
+if __name__ == '__main__':
+    main()
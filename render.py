@@ -0,0 +1,218 @@
+import random
+import typing
+
+import chess
+import cv2
+import numpy as np
+
+import board
+
+PIECE_NAMES = {
+    chess.PAWN: 'pawn',
+    chess.KNIGHT: 'knight',
+    chess.BISHOP: 'bishop',
+    chess.ROOK: 'rook',
+    chess.QUEEN: 'queen',
+    chess.KING: 'king'
+}
+
+# The highlight painted on the light and dark squares of the last move (see Position.LAST_MOVE_COLORS)
+HIGHLIGHT_COLORS = {
+    'white': (246, 246, 145),
+    'black': (190, 202, 95)
+}
+
+
+def load_rgb(path: str) -> np.ndarray:
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        raise IOError('Could not decode image: {}'.format(path))
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def random_position(rng: random.Random, max_plies=60) -> chess.Board:
+    """
+    :return: The position after a random number of random legal moves from the start (the last one still on the move
+             stack, for its highlight)
+    """
+    position = chess.Board()
+    for _ in range(rng.randint(1, max_plies)):
+        moves = list(position.legal_moves)
+        if not moves:
+            break
+        position.push(rng.choice(moves))
+    return position
+
+
+def get_piece_key(piece: chess.Piece) -> typing.Tuple[str, str]:
+    return PIECE_NAMES[piece.piece_type], 'white' if piece.color == chess.WHITE else 'black'
+
+
+class SampleBoard:
+    """
+    A sample board PNG and the squares actually drawn on it.
+
+    The squares are found from the colors of the board itself (along a rank and a file which are empty at the start),
+    rather than from the geometry recognition uses, so that pieces are cut and drawn exactly within their squares.
+    """
+
+    def __init__(self, path: str, screen_scale=2.0, tolerance=40):
+        """
+        :param path: The sample board PNG; ranks 3 to 6 must be (mostly) empty
+        :param screen_scale: The scale factor the sample board was captured at
+        :param tolerance: How far (euclidean RGB distance) a pixel may be from a square's color to be part of the square
+        """
+        self.image = load_rgb(path)
+        self.tolerance = tolerance
+        geometry = board.read_board_from_image(self.image, screen_scale, keep_frames=True)
+        if geometry is None:
+            raise ValueError('No board found on {}'.format(path))
+        self.flipped = geometry.flipped
+        self.files, self.ranks = geometry.rows, geometry.columns
+        self.colors = {}
+        for color, square in (('white', 'e4'), ('black', 'd4')):
+            view = geometry.get_square_view(geometry.frame, geometry.rows.index(square[0]),
+                                            geometry.columns.index(square[1]))
+            side = view.shape[0]
+            self.colors[color] = np.median(view[side // 4:-side // 4, side // 4:-side // 4].reshape(-1, 3), axis=0)
+        # A rank in the middle of the board, then a file just inside one of the columns (pieces never reach the edges
+        # of their squares, but a highlighted square breaks the file)
+        middle = geometry.get_frame_region()[1] + int(round(3.5 * geometry.unit_pixels * geometry.scale))
+        self.x_edges = self.find_edges(self.image[middle])
+        self.y_edges = None
+        for x in self.x_edges[1:-1]:
+            try:
+                self.y_edges = self.find_edges(self.image[:, x + 3])
+                break
+            except ValueError:
+                continue
+        if self.y_edges is None:
+            raise ValueError('No file of {} crosses all 8 squares'.format(path))
+
+    def get_distance(self, pixels: np.ndarray, color: str) -> np.ndarray:
+        return np.sqrt(((pixels[..., :3].astype(np.float32) - self.colors[color]) ** 2).sum(axis=-1))
+
+    def find_edges(self, line: np.ndarray) -> typing.List[int]:
+        """
+        :param line: A row or column of pixels crossing all 8 squares
+        :return: The 9 coordinates along the line where a square starts (and the last one ends)
+        """
+        light = self.get_distance(line, 'white') <= self.tolerance
+        dark = self.get_distance(line, 'black') <= self.tolerance
+        classes = np.where(light, 0, np.where(dark, 1, -1))
+        # The longest stretch of square colored pixels is the board; a couple of blended pixels between two squares
+        # (boards drawn at fractional scales) do not break it
+        indexes = np.nonzero(classes >= 0)[0]
+        if not len(indexes):
+            raise ValueError('Found no square edges')
+        stretches = np.split(indexes, np.nonzero(np.diff(indexes) > 3)[0] + 1)
+        stretch = max(stretches, key=lambda pixels: pixels[-1] - pixels[0])
+        values = classes[stretch]
+        changes = stretch[1:][values[1:] != values[:-1]]
+        edges = [int(stretch[0])] + [int(change) for change in changes] + [int(stretch[-1]) + 1]
+        if len(edges) != 9:
+            raise ValueError('Found {} square edges instead of 9'.format(len(edges)))
+        return edges
+
+    def get_cell(self, square: str) -> typing.Tuple[int, int, int, int]:
+        """
+        :return: The region (x1, y1, x2, y2 in pixels) of a square as drawn
+        """
+        i, j = self.files.index(square[0]), self.ranks.index(square[1])
+        return self.x_edges[i], self.y_edges[j], self.x_edges[i + 1], self.y_edges[j + 1]
+
+    def get_label_mask(self, square: str, pixels: np.ndarray, label_tolerance=20) -> np.ndarray:
+        """
+        :return: The pixels of the rank/file labels of a square: drawn in the color of the other squares, in the top
+                 left corner of the first column (ranks) or the bottom right corner of the last row (files)
+        """
+        mask = np.zeros(pixels.shape[:2], dtype=bool)
+        other = 'black' if board.get_square_color(square) == 'white' else 'white'
+        near = self.get_distance(pixels, other) <= label_tolerance
+        height, width = mask.shape
+        if self.files.index(square[0]) == 0:
+            mask[:height // 3, :width // 3] = near[:height // 3, :width // 3]
+        if self.ranks.index(square[1]) == 7:
+            mask[-height // 3:, -width // 3:] = near[-height // 3:, -width // 3:]
+        return mask
+
+
+class BoardRenderer:
+    """
+    Draws arbitrary positions the way they look on screen, by moving pieces around a sample board.
+
+    Each piece is cut out of a sample board showing the start position (its silhouette being everything its square's
+    color does not reach from the square's border); the board drawn on keeps its markers, frame and labels, with its
+    squares repainted in their flat colors.
+    """
+
+    def __init__(self, base_path='boards/board-a.png', sprites_path='boards/board-a.png', screen_scale=2.0):
+        """
+        :param base_path: The sample board drawn on (normal or flipped orientation)
+        :param sprites_path: A sample board showing the start position, to cut pieces from
+        :param screen_scale: The scale factor the sample boards were captured at
+        """
+        self.base = SampleBoard(base_path, screen_scale)
+        sprites = self.base if sprites_path == base_path else SampleBoard(sprites_path, screen_scale)
+        self.sprites = {}
+        for square, piece in chess.Board().piece_map().items():
+            key = get_piece_key(piece)
+            name = chess.SQUARE_NAMES[square]
+            # Pieces away from the labels when possible
+            if key in self.sprites and (sprites.files.index(name[0]) == 0 or sprites.ranks.index(name[1]) == 7):
+                continue
+            x1, y1, x2, y2 = sprites.get_cell(name)
+            image = sprites.image[y1:y2, x1:x2, :3].copy()
+            self.sprites[key] = (image, self.get_silhouette(sprites, name, image))
+
+    @staticmethod
+    def get_silhouette(sample: SampleBoard, square: str, image: np.ndarray) -> np.ndarray:
+        background = (sample.get_distance(image, board.get_square_color(square)) <= sample.tolerance).astype(np.uint8)
+        background[sample.get_label_mask(square, image)] = 1
+        # Flood the background from the border of the square; whatever it does not reach is the piece
+        padded = np.pad(background, 1, constant_values=1)
+        flood = np.zeros((padded.shape[0] + 2, padded.shape[1] + 2), dtype=np.uint8)
+        cv2.floodFill(padded, flood, (0, 0), 2)
+        silhouette = (padded[1:-1, 1:-1] != 2).astype(np.uint8)
+        # Only the piece itself, not the stray (anti-aliased) pixels of a label
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(silhouette)
+        if count <= 1:
+            return silhouette > 0
+        return labels == 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+
+    def draw_square(self, image: np.ndarray, square: str, piece: typing.Optional[typing.Tuple[str, str]],
+                    highlighted: bool) -> None:
+        x1, y1, x2, y2 = self.base.get_cell(square)
+        cell = image[y1:y2, x1:x2, :3]
+        labels = self.base.get_label_mask(square, cell)
+        label_pixels = cell[labels].copy()
+        square_color = board.get_square_color(square)
+        cell[:] = HIGHLIGHT_COLORS[square_color] if highlighted else self.base.colors[square_color]
+        cell[labels] = label_pixels
+        if piece is not None:
+            sprite, silhouette = self.sprites[piece]
+            shape = (cell.shape[1], cell.shape[0])
+            if sprite.shape[:2] != cell.shape[:2]:
+                sprite = cv2.resize(sprite, shape, interpolation=cv2.INTER_AREA)
+                silhouette = cv2.resize(silhouette.astype(np.uint8), shape, interpolation=cv2.INTER_NEAREST) > 0
+            cell[silhouette] = sprite[silhouette]
+
+    def render(self, position: chess.Board, highlight=True, scale=1.0) -> np.ndarray:
+        """
+        Draw a position
+        :param position: The position; its last move (if any) is highlighted
+        :param highlight: Whether to highlight the last move
+        :param scale: The factor the whole drawing is resized by
+        :return: An RGB array of the drawing
+        """
+        image = self.base.image.copy()
+        last_move = position.peek() if highlight and position.move_stack else None
+        highlighted = {last_move.from_square, last_move.to_square} if last_move else set()
+        for square in chess.SQUARES:
+            piece = position.piece_at(square)
+            self.draw_square(image, chess.SQUARE_NAMES[square], get_piece_key(piece) if piece else None,
+                             square in highlighted)
+        if scale != 1:
+            image = cv2.resize(image, None, fx=scale, fy=scale,
+                               interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+        return image
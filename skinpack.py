@@ -0,0 +1,309 @@
+import argparse
+import json
+import os
+import typing
+
+import cv2
+import numpy as np
+
+import templates
+
+MAGIC = b'CHSKIN01'
+
+# Bumped whenever what a pack holds changes, so packs compiled by an older version get decoded from the PNGs again
+PACK_VERSION = 3
+
+# Every image of a pack starts on a multiple of this many bytes (of the file), so that views of it stay aligned
+ALIGNMENT = 64
+
+DEFAULT_PACK_PATH = 'skins/default.pack'
+
+THEME_FILENAME = 'theme.json'
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class PackWriter:
+    """
+    Lays out grayscale images one after the other (aligned) and remembers where each one went
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def add(self, image: np.ndarray) -> typing.Dict:
+        """
+        :param image: A 2D uint8 array
+        :return: The entry describing the image within the pack (offset into the data and shape)
+        """
+        offset = _align(self.size)
+        if offset > self.size:
+            self.chunks.append(bytes(offset - self.size))
+        data = np.ascontiguousarray(image, dtype=np.uint8).tobytes()
+        self.chunks.append(data)
+        self.size = offset + len(data)
+        return {'offset': offset, 'shape': list(image.shape)}
+
+    def write(self, path: str, header: typing.Dict) -> None:
+        encoded = json.dumps(header, sort_keys=True).encode('utf-8')
+        data_offset = _align(len(MAGIC) + 8 + len(encoded))
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written next to the pack then renamed over it, so a process loading it never sees half a pack
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary, 'wb') as f:
+            f.write(MAGIC)
+            f.write(len(encoded).to_bytes(8, 'little'))
+            f.write(encoded)
+            f.write(bytes(data_offset - len(MAGIC) - 8 - len(encoded)))
+            for chunk in self.chunks:
+                f.write(chunk)
+        os.replace(temporary, path)
+
+
+def read_header(path: str) -> typing.Tuple[typing.Dict, int]:
+    """
+    :param path: The path of a pack
+    :return: The header of the pack and the offset (in bytes) of its data within the file
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a skin pack'.format(path))
+        length = int.from_bytes(f.read(8), 'little')
+        header = json.loads(f.read(length).decode('utf-8'))
+    if header.get('version') != PACK_VERSION:
+        raise ValueError('{} was compiled by another version (recompile it with skinpack.py)'.format(path))
+    return header, _align(len(MAGIC) + 8 + length)
+
+
+class SkinPack(templates.TemplateBank):
+    """
+    A TemplateBank loaded from a pack compiled by compile_pack: every image is a read-only view into a memory map of the
+    pack file, so nothing is decoded at startup and every process loading the same pack shares one copy of its pages.
+    """
+
+    def __init__(self, path: str = DEFAULT_PACK_PATH):
+        """
+        :param path: The path of the pack
+        """
+        super(SkinPack, self).__init__(pieces_dir=None, markers_dir=None, boards_dir=None)
+        self.path = path
+        header, data_offset = read_header(path)
+        self.data = np.memmap(path, dtype=np.uint8, mode='r', offset=data_offset)
+        metadata = header['metadata']
+        self.name = metadata.get('name')
+        self.native_square_pixels = metadata.get('native_square_pixels')
+        self.highlight_colors = [tuple(color) for color in metadata['highlight_colors']] \
+            if metadata.get('highlight_colors') else None
+        self.square_colors = {name: tuple(color) for name, color in metadata['square_colors'].items()} \
+            if metadata.get('square_colors') else None
+        for entry in header['pieces']:
+            image = self._get_view(entry)
+            self.images[entry['path']] = image
+            self.pieces.append(templates.PieceTemplate(entry['name'], entry['color'], entry['variant'], entry['path'],
+                                                       image))
+        for size, entries in header['scaled_pieces'].items():
+            self.scaled_pieces[int(size)] = [
+                templates.PieceTemplate(template.name, template.color, template.variant, template.path,
+                                        self._get_view(entry))
+                for template, entry in zip(self.pieces, entries)
+            ]
+        for entry in header['markers']:
+            image = self._get_view(entry)
+            self.images[entry['path']] = image
+            self.markers.append(templates.MarkerTemplate(entry['corner'], entry['orientation'], entry['marker_set'],
+                                                         entry['path'], image))
+        for entry in header['boards']:
+            image = self._get_view(entry)
+            self.images[entry['path']] = image
+            self.boards[entry['name']] = image
+
+    def _get_view(self, entry: typing.Dict) -> np.ndarray:
+        height, width = entry['shape']
+        return self.data[entry['offset']:entry['offset'] + height * width].reshape(height, width)
+
+
+def _is_near(color: typing.Sequence[int], other: typing.Sequence[int], tolerance: float) -> bool:
+    """
+    :return: Whether two colors are within a tolerance of each other (the semantics of classifier.LastMoveDetector)
+    """
+    return sum((int(a) - int(b)) ** 2 for a, b in zip(color, other)) <= (tolerance ** 2) * 3 * 255 ** 2
+
+
+def measure_board(bank: templates.TemplateBank, theme_dir: str, screen_scale: float) -> typing.Dict:
+    """
+    Read the sample boards of a skin to find the colors of its empty squares and the colors its last move is
+    highlighted with
+    :param bank: The templates of the skin
+    :param theme_dir: The directory holding the pieces, markers and boards directories of the skin
+    :param screen_scale: The scale factor of the display the sample boards were captured on
+    :return: The square_colors and highlight_colors (only those found) metadata, empty if no sample board could be read
+    """
+    # Reading boards needs the recognition code (which imports this module)
+    import board
+    # The boards are located, and their pieces recognized, with the templates of the skin itself
+    skin = board.Skin(bank)
+    metadata = {}
+    found_boards = []
+    for path in sorted(bank.boards):
+        image = cv2.imread(os.path.join(theme_dir, 'boards', path + '.png'), cv2.IMREAD_COLOR)
+        if image is None:
+            continue
+        found = board.read_board_from_image(cv2.cvtColor(image, cv2.COLOR_BGR2RGB), screen_scale, skin=skin,
+                                            keep_frames=True)
+        if found is not None:
+            found_boards.append(found)
+    for found in found_boards:
+        colors = {'white': [], 'black': []}
+        for i, row in enumerate(found.rows):
+            for j, column in enumerate(found.columns):
+                if found.state.get_code(row + column) != 0:
+                    continue
+                view = found.get_square_view(found.frame, i, j)
+                quarter = view.shape[0] // 4
+                # The middle of the square, away from pieces sticking out of its neighbours
+                colors[board.get_square_color(row + column)].append(
+                    view[quarter:-quarter, quarter:-quarter, :3].reshape(-1, 3))
+        if not colors['white'] or not colors['black']:
+            continue
+        metadata = {
+            'square_colors': {name: [int(value) for value in np.median(np.concatenate(pixels), axis=0)]
+                              for name, pixels in colors.items()}
+        }
+        break
+    if not metadata:
+        return metadata
+    # A square mostly painted in neither of the square colors is highlighted (a piece on it hides part of it only)
+    detector = skin.last_move_detector
+    highlight_colors = []
+    for found in found_boards:
+        for i, row in enumerate(found.rows):
+            for j, column in enumerate(found.columns):
+                pixels = found.get_square_view(found.frame, i, j)[..., :3].reshape(-1, 3)
+                values, counts = np.unique(pixels, axis=0, return_counts=True)
+                color = [int(value) for value in values[counts.argmax()]]
+                if counts.max() < detector.min_coverage * len(pixels) or \
+                        any(_is_near(color, known, detector.tolerance)
+                            for known in list(metadata['square_colors'].values()) + highlight_colors):
+                    continue
+                highlight_colors.append(color)
+    if highlight_colors:
+        metadata['highlight_colors'] = highlight_colors
+    return metadata
+
+
+def compile_pack(theme_dir: str, pack_path: str, square_sizes: typing.Optional[typing.Iterable[int]] = None,
+                 screen_scale=2.0) -> typing.Dict:
+    """
+    Compile the PNGs of a skin into a single pack
+    :param theme_dir: The directory holding the pieces, markers and boards directories of the skin, and optionally a
+                      theme.json overriding any of the metadata (E.G {"highlight_colors": [[246, 246, 145]]})
+    :param pack_path: The path of the pack to write
+    :param square_sizes: The square sides (in screen pixels) to pre-scale the piece templates to; defaults to the
+                         side squares are resampled to before recognition (board.Board.RECOGNITION_SQUARE_PIXELS), the
+                         only one used unless boards are read with another square_pixels
+    :param screen_scale: The scale factor of the display the sample boards were captured on
+    :return: The metadata of the pack
+    """
+    bank = templates.TemplateBank(os.path.join(theme_dir, 'pieces'), os.path.join(theme_dir, 'markers'),
+                                  os.path.join(theme_dir, 'boards'))
+
+    # Stored under the paths the skin is loaded from by default (E.G 'pieces/pawn-white-f.png')
+    def relative(path):
+        return os.path.relpath(path, theme_dir)
+
+    theme_path = os.path.join(theme_dir, THEME_FILENAME)
+    theme = {}
+    if os.path.exists(theme_path):
+        with open(theme_path) as f:
+            theme = json.load(f)
+    metadata = {'name': os.path.basename(os.path.abspath(theme_dir))}
+    import board
+    if 'square_colors' not in theme or 'highlight_colors' not in theme:
+        metadata.update(measure_board(bank, theme_dir, theme.get('screen_scale', screen_scale)))
+    if 'highlight_colors' not in theme:
+        # The colors found on the sample boards (only those showing a last move have any), after the usual ones
+        defaults = [list(color) for color in board.Position.LAST_MOVE_COLORS]
+        measured = [color for color in metadata.get('highlight_colors', [])
+                    if not any(_is_near(color, default, board.last_move_detector.tolerance) for default in defaults)]
+        metadata['highlight_colors'] = defaults + measured
+    # Not measured: the pieces of the bundled skin match best taken as cut from 157 pixel squares, while the squares
+    # of its sample boards are 162 pixels; so only a theme.json tells
+    metadata['native_square_pixels'] = bank.native_square_pixels
+    metadata.update(theme)
+    bank.native_square_pixels = metadata.get('native_square_pixels')
+    if square_sizes is None:
+        square_sizes = [board.Board.RECOGNITION_SQUARE_PIXELS]
+    metadata['square_sizes'] = sorted(set(square_sizes)) if bank.native_square_pixels else []
+
+    writer = PackWriter()
+    header = {'version': PACK_VERSION, 'metadata': metadata, 'pieces': [], 'scaled_pieces': {}, 'markers': [],
+              'boards': []}
+    for template in bank.pieces:
+        entry = writer.add(template.image)
+        entry.update(name=template.name, color=template.color, variant=template.variant,
+                     path=relative(template.path))
+        header['pieces'].append(entry)
+    for size in metadata['square_sizes']:
+        header['scaled_pieces'][str(size)] = [writer.add(template.image) for template in bank.get_scaled_pieces(size)]
+    for marker in bank.markers:
+        entry = writer.add(marker.image)
+        entry.update(corner=marker.corner, orientation=marker.orientation, marker_set=marker.marker_set,
+                     path=relative(marker.path))
+        header['markers'].append(entry)
+    for name, image in sorted(bank.boards.items()):
+        entry = writer.add(image)
+        entry.update(name=name, path=os.path.join('boards', name + '.png'))
+        header['boards'].append(entry)
+    writer.write(pack_path, header)
+    return metadata
+
+
+def _newest_png(directories: typing.Iterable[str]) -> float:
+    newest = 0.0
+    for directory in directories:
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.endswith('.png'):
+                    newest = max(newest, os.path.getmtime(os.path.join(directory, name)))
+    return newest
+
+
+def load_template_bank(pack_path=DEFAULT_PACK_PATH, pieces_dir='pieces', markers_dir='markers',
+                       boards_dir='boards') -> templates.TemplateBank:
+    """
+    Load the skin from its compiled pack, unless there is none or a PNG changed since it was compiled, in which case
+    the PNGs are decoded
+    :param pack_path: The path of the pack
+    :return: The templates of the skin
+    """
+    if os.path.exists(pack_path) and \
+            os.path.getmtime(pack_path) >= _newest_png((pieces_dir, markers_dir, boards_dir)):
+        try:
+            return SkinPack(pack_path)
+        except (ValueError, KeyError, OSError) as e:
+            print('Could not load skin pack {}: {}'.format(pack_path, e))
+    return templates.TemplateBank(pieces_dir, markers_dir, boards_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile the PNGs of a skin into a single memory mapped pack')
+    parser.add_argument('theme_dir', nargs='?', default='.',
+                        help='Directory holding the pieces, markers and boards directories of the skin')
+    parser.add_argument('pack_path', nargs='?', default=DEFAULT_PACK_PATH, help='Path of the pack to write')
+    parser.add_argument('--sizes', type=int, nargs='+', default=None,
+                        help='Square sides (in screen pixels) to pre-scale the piece templates to (defaults to the '
+                             'side squares are recognized at)')
+    parser.add_argument('--scale', type=float, default=2.0,
+                        help='Scale factor of the display the sample boards were captured on')
+    args = parser.parse_args()
+    metadata = compile_pack(args.theme_dir, args.pack_path, args.sizes, args.scale)
+    print('Wrote {} ({} bytes)'.format(args.pack_path, os.path.getsize(args.pack_path)))
+    print(json.dumps(metadata, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
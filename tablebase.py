@@ -0,0 +1,81 @@
+import functools
+import os
+import typing
+
+import chess
+import chess.syzygy
+
+import movecache
+
+
+class Tablebase:
+    """
+    Local Syzygy endgame tablebases; optional, positions are simply never found when the directory holds no tables.
+
+    The best move of a position is the one keeping the best outcome (win, cursed win, draw, blessed loss, loss) and,
+    when winning, zeroing the fifty-move counter or getting closest to doing so (DTZ); when losing, staying away from
+    it the longest. Best moves are memoized per position, least recently used first out.
+    """
+
+    def __init__(self, directory='syzygy', cache_size=4096):
+        """
+        :param directory: The directory of the .rtbw (WDL) and .rtbz (DTZ) files
+        :param cache_size: How many positions' best moves to memoize
+        """
+        self.directory = directory
+        self.tablebase = None
+        self.max_pieces = 0
+        if os.path.isdir(directory):
+            tablebase = chess.syzygy.open_tablebase(directory)
+            if tablebase.wdl and tablebase.dtz:
+                self.tablebase = tablebase
+                # Table names look like KQvKR
+                self.max_pieces = max(len(key.replace('v', '')) for key in tablebase.wdl)
+            else:
+                tablebase.close()
+        self._get_best_move = functools.lru_cache(maxsize=cache_size)(self._probe_best_move)
+
+    def covers(self, board: chess.Board) -> bool:
+        return self.tablebase is not None and chess.popcount(board.occupied) <= self.max_pieces
+
+    def get(self, board: chess.Board) -> typing.Optional[movecache.KnownMove]:
+        """
+        :return: The tablebase move of the position, or None if the position has too many pieces or a table is missing
+        """
+        if not self.covers(board):
+            return None
+        move = self._get_best_move(board.epd())
+        return movecache.KnownMove(chess.Move.from_uci(move), 'tablebase') if move else None
+
+    def _probe_best_move(self, epd: str) -> typing.Optional[str]:
+        board, _ = chess.Board.from_epd(epd)
+        # Endgames with castling rights left are not in the tables; by this stage the rights are almost always stale
+        # (recognition can only guess them from where the king and rooks stand)
+        board.castling_rights = chess.BB_EMPTY
+        best, best_key = None, None
+        for move in board.legal_moves:
+            zeroing = board.is_zeroing(move)
+            board.push(move)
+            try:
+                if board.is_checkmate():
+                    return move.uci()
+                wdl, dtz = self.tablebase.get_wdl(board), self.tablebase.get_dtz(board)
+            finally:
+                board.pop()
+            if wdl is None or dtz is None:
+                return None
+            wdl, dtz = -wdl, abs(dtz)
+            if wdl > 0:
+                key = (wdl, -(0 if zeroing else dtz))
+            elif wdl < 0:
+                key = (wdl, dtz)
+            else:
+                key = (wdl, 0)
+            if best_key is None or key > best_key:
+                best, best_key = move, key
+        return best.uci() if best else None
+
+    def close(self) -> None:
+        if self.tablebase is not None:
+            self.tablebase.close()
+            self.tablebase = None
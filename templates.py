@@ -0,0 +1,193 @@
+import os
+import re
+import threading
+import typing
+
+import cv2
+import numpy as np
+
+PIECE_NAMES = ['pawn', 'rook', 'knight', 'bishop', 'queen', 'king']
+PIECE_COLORS = ['white', 'black']
+
+# Full piece first, then the partial (top, bottom, left, right) crops; any other variant is tried last
+PIECE_VARIANT_ORDER = ['f', 't', 'b', 'l', 'r']
+
+# The pieces directory also holds lighter and darker copies of the pieces and a few other crops; recognizing with them
+# makes more squares match loosely, so by default only these variants (optionally numbered, E.G 't2') are loaded...
+DEFAULT_PIECE_VARIANTS = ('f', 't', 'b', 'l', 'r')
+# ...minus the files of those variants left out of the hand picked set the recognition was tuned with
+DEFAULT_EXCLUDED_PIECES = ('queen-white-l2.png',)
+
+# The side (in screen pixels) of the squares the bundled piece PNGs were cut from (a retina screen)
+DEFAULT_NATIVE_SQUARE_PIXELS = 157
+
+PIECE_FILENAME = re.compile(r'^(?P<name>[a-z]+)-(?P<color>white|black)-(?P<variant>[a-z]+?)(?P<number>\d*)\.png$')
+MARKER_FILENAME = re.compile(
+    r'^edge-(?P<corner>top-left|bottom-right)(?P<flipped>-flipped)?(?:-(?P<number>\d+))?\.png$')
+
+
+def scale_template(template: np.ndarray, factor: float) -> np.ndarray:
+    """
+    Resample a template by a given factor
+    :param template: The grayscale template
+    :param factor: The scale factor
+    :return: The resampled template (at least 1x1 pixels)
+    """
+    if factor == 1:
+        return template
+    size = max(1, int(round(template.shape[1] * factor))), max(1, int(round(template.shape[0] * factor)))
+    interpolation = cv2.INTER_AREA if factor < 1 else cv2.INTER_LINEAR
+    return cv2.resize(template, size, interpolation=interpolation)
+
+
+class PieceTemplate:
+    """
+    A decoded piece PNG (E.G pieces/knight-white-t2.png)
+    """
+    def __init__(self, name: str, color: str, variant: str, path: str, image: np.ndarray):
+        self.name = name
+        self.color = color
+        self.variant = variant
+        self.path = path
+        self.image = image
+
+    def __str__(self):
+        return '{} ({}) [{}]'.format(self.name, self.color, self.variant)
+
+
+class MarkerTemplate:
+    """
+    A decoded board edge marker PNG (E.G markers/edge-top-left-flipped-3.png)
+    """
+    def __init__(self, corner: str, orientation: str, marker_set: int, path: str, image: np.ndarray):
+        self.corner = corner
+        self.orientation = orientation
+        self.marker_set = marker_set
+        self.path = path
+        self.image = image
+
+
+class TemplateBank:
+    """
+    Every PNG of a skin (pieces, markers and boards), decoded to grayscale once and kept in memory
+    """
+
+    def __init__(self, pieces_dir='pieces', markers_dir='markers', boards_dir='boards',
+                 native_square_pixels: typing.Optional[int] = DEFAULT_NATIVE_SQUARE_PIXELS,
+                 piece_variants: typing.Optional[typing.Iterable[str]] = DEFAULT_PIECE_VARIANTS,
+                 excluded_pieces: typing.Iterable[str] = DEFAULT_EXCLUDED_PIECES):
+        """
+        :param pieces_dir: Directory of <piece>-<color>-<variant>.png files
+        :param markers_dir: Directory of edge-<corner>[-flipped][-<set>].png files
+        :param boards_dir: Directory of sample board PNGs (any directory may be None to leave it out)
+        :param native_square_pixels: The side (in screen pixels) of the squares the pieces were cut from (None if
+                                     unknown, to never resize them)
+        :param piece_variants: The variants (without their number) of the pieces to load (None for every variant)
+        :param excluded_pieces: Filenames of pieces not to load
+        """
+        self.images = {}
+        self.pieces = []
+        self.markers = []
+        self.boards = {}
+        self.native_square_pixels = native_square_pixels
+        # The colors of the skin, when known (see skinpack.SkinPack)
+        self.highlight_colors = None
+        self.square_colors = None
+        self.scaled_pieces = {}
+        # Squares may be recognized on several threads, all asking for the same size at first
+        self.scaled_pieces_lock = threading.Lock()
+        piece_variants = set(piece_variants) if piece_variants is not None else None
+        excluded_pieces = set(excluded_pieces)
+        for path in self._list_pngs(pieces_dir):
+            match = PIECE_FILENAME.match(os.path.basename(path))
+            if not match or match.group('name') not in PIECE_NAMES or os.path.basename(path) in excluded_pieces or \
+                    (piece_variants is not None and match.group('variant') not in piece_variants):
+                continue
+            image = self.load(path)
+            if image is None:
+                continue
+            self.pieces.append(PieceTemplate(match.group('name'), match.group('color'),
+                                             match.group('variant') + match.group('number'), path, image))
+        self.pieces.sort(key=self._piece_sort_key)
+        for path in self._list_pngs(markers_dir):
+            match = MARKER_FILENAME.match(os.path.basename(path))
+            image = self.load(path)
+            if not match or image is None:
+                continue
+            orientation = 'flipped' if match.group('flipped') else 'normal'
+            self.markers.append(MarkerTemplate(match.group('corner'), orientation, int(match.group('number') or 1),
+                                               path, image))
+        for path in self._list_pngs(boards_dir):
+            image = self.load(path)
+            if image is not None:
+                self.boards[os.path.splitext(os.path.basename(path))[0]] = image
+
+    def __getitem__(self, path: str) -> np.ndarray:
+        """
+        :param path: The path of a PNG, as passed to cv2.imread
+        :return: The grayscale image, decoding (and keeping) it if it was not part of the skin directories
+        """
+        image = self.load(path)
+        if image is None:
+            raise KeyError(path)
+        return image
+
+    @staticmethod
+    def _list_pngs(directory: str) -> typing.List[str]:
+        if not directory or not os.path.isdir(directory):
+            return []
+        return [os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.endswith('.png')]
+
+    @staticmethod
+    def _piece_sort_key(template: PieceTemplate) -> typing.Tuple:
+        match = re.match(r'^([a-z]+?)(\d*)$', template.variant)
+        base, number = match.group(1), int(match.group(2) or 1)
+        base_rank = PIECE_VARIANT_ORDER.index(base) if base in PIECE_VARIANT_ORDER else len(PIECE_VARIANT_ORDER)
+        return (PIECE_NAMES.index(template.name), PIECE_COLORS.index(template.color), base_rank, base, number)
+
+    def load(self, path: str) -> typing.Optional[np.ndarray]:
+        """
+        Decode a PNG to grayscale, at most once
+        :param path: The path of the PNG
+        :return: The grayscale image or None if it could not be decoded
+        """
+        if path not in self.images:
+            image = cv2.imread(path, 0)
+            if image is None:
+                return None
+            self.images[path] = image
+        return self.images[path]
+
+    def get_scaled_pieces(self, square_pixels: int) -> typing.List[PieceTemplate]:
+        """
+        Resize the piece templates to match squares of a given size, at most once per size
+        :param square_pixels: The side (in screen pixels) of the squares the pieces are searched on
+        :return: The piece templates, in the same order as TemplateBank.pieces; unchanged if the size the pieces were
+                 cut at is unknown
+        """
+        if not self.native_square_pixels or square_pixels == self.native_square_pixels:
+            return self.pieces
+        if square_pixels not in self.scaled_pieces:
+            with self.scaled_pieces_lock:
+                if square_pixels not in self.scaled_pieces:
+                    factor = square_pixels / self.native_square_pixels
+                    self.scaled_pieces[square_pixels] = [
+                        PieceTemplate(template.name, template.color, template.variant, template.path,
+                                      scale_template(template.image, factor))
+                        for template in self.pieces
+                    ]
+        return self.scaled_pieces[square_pixels]
+
+    def marker_sets(self) -> typing.List[typing.Tuple[str, str, str]]:
+        """
+        Pair up the top left and bottom right markers of the same set and orientation
+        :return: A list of (top left path, bottom right path, orientation), normal orientation first
+        """
+        corners = {}
+        for marker in self.markers:
+            corners.setdefault((marker.orientation != 'normal', marker.marker_set), {})[marker.corner] = marker.path
+        return [
+            (paths['top-left'], paths['bottom-right'], 'flipped' if flipped else 'normal')
+            for (flipped, _), paths in sorted(corners.items())
+            if 'top-left' in paths and 'bottom-right' in paths
+        ]
@@ -0,0 +1,133 @@
+import typing
+
+import chess
+
+
+class TimeManager:
+    """
+    Decides how long the engine may think about each move, given the clock.
+
+    Without a clock every move gets a fixed time (the historical 2 seconds). With one, the remaining time is spread over
+    the moves expected to be left in the game, most of the increment is spent on top, and a fixed overhead per move is
+    held back for recognizing the board and dragging the piece. Forced moves are played without searching, recaptures
+    after a very short search, and a search is cut short once its best move has stopped changing.
+    """
+
+    def __init__(self, remaining: typing.Optional[float] = None, increment=0.0,
+                 moves_to_go: typing.Optional[int] = None, default_time=2.0, overhead=.5, min_time=.05, quick_time=.1,
+                 panic_time=10.0, stable_depths=4, min_depth=6, min_fraction=.3):
+        """
+        :param remaining: The seconds left on our clock, or None to play every move in default_time
+        :param increment: The seconds added to our clock after each of our moves
+        :param moves_to_go: The moves left until the next time control, or None for sudden death
+        :param default_time: The seconds per move when the clock is unknown
+        :param overhead: The seconds held back per move for recognition, moving the piece and lag
+        :param min_time: The shortest search
+        :param quick_time: The search time of recaptures (and of every move once the clock is nearly out)
+        :param panic_time: Below this many seconds on the clock, every move gets quick_time
+        :param stable_depths: How many consecutive depths the best move must survive to stop the search early
+        :param min_depth: The depth below which the search is never stopped early
+        :param min_fraction: The fraction of the allocated time that is always searched
+        """
+        self.remaining = remaining
+        self.increment = increment
+        self.moves_to_go = moves_to_go
+        self.default_time = default_time
+        self.overhead = overhead
+        self.min_time = min_time
+        self.quick_time = quick_time
+        self.panic_time = panic_time
+        self.stable_depths = stable_depths
+        self.min_depth = min_depth
+        self.min_fraction = min_fraction
+        self._best_move = None
+        self._best_move_depth = 0
+        self._stable_since = 0
+
+    def update_clock(self, remaining: float, increment: typing.Optional[float] = None) -> None:
+        """
+        Set the clock, as read from the screen (or any other source)
+        """
+        self.remaining = remaining
+        if increment is not None:
+            self.increment = increment
+
+    def spend(self, seconds: float) -> None:
+        """
+        Account for one of our moves having taken some time, when the clock is kept track of locally
+        :param seconds: The wall time from the opponent's move being seen to ours being played
+        """
+        if self.remaining is None:
+            return
+        self.remaining = max(0.0, self.remaining - seconds) + self.increment
+        if self.moves_to_go:
+            self.moves_to_go -= 1
+
+    @staticmethod
+    def get_forced_move(board: chess.Board) -> typing.Optional[chess.Move]:
+        """
+        :return: The only legal move, or None if there is a choice
+        """
+        moves = iter(board.legal_moves)
+        move = next(moves, None)
+        return move if next(moves, None) is None else None
+
+    @staticmethod
+    def is_recapture(board: chess.Board, captured_on: typing.Optional[int]) -> bool:
+        """
+        :param captured_on: The square the opponent just captured one of our pieces on, if they did
+        :return: Whether we can take back on that square
+        """
+        if captured_on is None:
+            return False
+        return any(move.to_square == captured_on for move in board.generate_legal_captures())
+
+    def allocate(self, board: chess.Board, captured_on: typing.Optional[int] = None) -> float:
+        """
+        Decide how long to search a position
+        :param board: The position, with us to move
+        :param captured_on: The square the opponent just captured one of our pieces on, if they did
+        :return: The seconds to search for; 0 if the move is forced (no search needed)
+        """
+        if self.get_forced_move(board):
+            return 0.0
+        if self.remaining is None:
+            allocated = self.default_time
+        elif self.remaining <= self.panic_time:
+            return min(self.quick_time, max(self.min_time, self.remaining / 20))
+        else:
+            if self.moves_to_go:
+                moves_left = self.moves_to_go
+            else:
+                # Assume games last about 60 moves, but never less than 20 more
+                moves_left = max(20, 60 - board.fullmove_number)
+            allocated = self.remaining / moves_left + self.increment * .8 - self.overhead
+            # Never bet more than a fifth of the clock on a single move
+            allocated = min(allocated, self.remaining / 5 - self.overhead)
+        if self.is_recapture(board, captured_on):
+            allocated = min(allocated, self.quick_time)
+        return max(self.min_time, allocated)
+
+    def start_search(self) -> None:
+        self._best_move = None
+        self._best_move_depth = 0
+        self._stable_since = 0
+
+    def should_stop(self, info: typing.Dict, elapsed: float, allocated: float) -> bool:
+        """
+        Follow a search as the engine reports on it
+        :param info: The latest info reported by the engine
+        :param elapsed: The seconds since the search started
+        :param allocated: The seconds allocated to the search
+        :return: Whether the search can be stopped already
+        """
+        depth, pv = info.get('depth'), info.get('pv')
+        if depth and pv and depth > self._best_move_depth:
+            if pv[0] != self._best_move:
+                self._best_move = pv[0]
+                self._stable_since = depth
+            self._best_move_depth = depth
+        if elapsed >= allocated:
+            return True
+        return elapsed >= allocated * self.min_fraction and self._best_move_depth >= self.min_depth and \
+            self._best_move_depth - self._stable_since >= self.stable_depths
@@ -0,0 +1,122 @@
+import typing
+
+import chess
+
+
+def get_move_squares(position: chess.Board) -> typing.Set[str]:
+    """
+    :param position: A position (E.G right after our move)
+    :return: Every square a legal move of the side to move starts from or lands on
+    """
+    squares = set()
+    for move in position.legal_moves:
+        squares.add(chess.SQUARE_NAMES[move.from_square])
+        squares.add(chess.SQUARE_NAMES[move.to_square])
+    return squares
+
+
+def get_played_squares(position: chess.Board, move: chess.Move) -> typing.Set[str]:
+    """
+    :param position: The position before the move
+    :param move: A legal move of the position
+    :return: The squares the move changes on screen: where it starts and lands, the rook's squares when castling and the
+             captured pawn's square when capturing en passant
+    """
+    squares = {move.from_square, move.to_square}
+    if position.is_castling(move):
+        rank = chess.square_rank(move.from_square)
+        kingside = chess.square_file(move.to_square) > chess.square_file(move.from_square)
+        squares.add(chess.square(7 if kingside else 0, rank))
+        squares.add(chess.square(5 if kingside else 3, rank))
+        # Chess 960 style castling (the king "captures" its rook)
+        squares.add(chess.square(6 if kingside else 2, rank))
+    elif position.is_en_passant(move):
+        squares.add(chess.square(chess.square_file(move.to_square), chess.square_rank(move.from_square)))
+    return {chess.SQUARE_NAMES[square] for square in squares}
+
+
+def find_moves(position: chess.Board, board_fen: str, max_plies=2) -> typing.Optional[typing.List[chess.Move]]:
+    """
+    Find the legal moves leading from a position to a recognized piece placement
+    :param position: The position before the moves (left unchanged)
+    :param board_fen: The recognized piece placement (the first field of a FEN, E.G from Board.to_fen_string)
+    :param max_plies: How many moves may have been missed in between (E.G both sides moved between two reads)
+    :return: The shortest sequence of moves reaching the placement; empty if the placement did not change, None if no
+             sequence of up to max_plies legal moves reaches it
+    """
+    if position.board_fen() == board_fen:
+        return []
+    frontier = [(position.copy(stack=False), [])]
+    for ply in range(max_plies):
+        next_frontier = []
+        for board, moves in frontier:
+            for move in board.legal_moves:
+                board.push(move)
+                if board.board_fen() == board_fen:
+                    return moves + [move]
+                if ply + 1 < max_plies:
+                    next_frontier.append((board.copy(stack=False), moves + [move]))
+                board.pop()
+        frontier = next_frontier
+    return None
+
+
+class GameTracker:
+    """
+    Follows a game read off the screen move by move, as a python-chess board carrying the whole move history, rather
+    than starting from a FEN guessed from a single read every time: castling rights, en passant squares, move counters
+    and repetitions all come from the moves actually played.
+
+    Every new read is matched against the legal moves of the position; a read no sequence of legal moves leads to is a
+    misread (or a board that is not part of the game).
+    """
+
+    def __init__(self, max_plies=2):
+        """
+        :param max_plies: How many moves may happen between two reads
+        """
+        self.max_plies = max_plies
+        self.board = None
+        # The squares changed by the moves pushed since the last read, which still have to be seen on screen
+        self.pushed_squares = set()
+
+    def reset(self, fen: str) -> None:
+        """
+        Start following a game (again) from a position
+        :param fen: The FEN of the position, E.G read from the screen
+        """
+        self.board = chess.Board(fen)
+        self.pushed_squares = set()
+
+    def push(self, move: chess.Move) -> None:
+        """
+        Record a move known to be played (E.G ours)
+        """
+        self.pushed_squares |= get_played_squares(self.board, move)
+        self.board.push(move)
+
+    def follow(self, board_fen: str) -> typing.Optional[typing.List[chess.Move]]:
+        """
+        Catch up with a new read of the board
+        :param board_fen: The recognized piece placement
+        :return: The moves played since the last read (empty if none), None if no legal moves lead to the placement (or
+                 no game is followed yet)
+        """
+        if self.board is None:
+            return None
+        moves = find_moves(self.board, board_fen, self.max_plies)
+        if moves is not None:
+            self.pushed_squares = set()
+        for move in moves or []:
+            self.board.push(move)
+        return moves
+
+    def get_touched_squares(self) -> typing.Set[str]:
+        """
+        :return: Every square a legal move of the side to move changes on screen, and those the moves pushed since the
+                 last read changed; only those need recognizing again to tell which move was played
+        """
+        squares = set(self.pushed_squares)
+        for move in self.board.legal_moves:
+            squares |= get_played_squares(self.board, move)
+        return squares
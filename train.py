@@ -0,0 +1,144 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import typing
+
+import chess
+import cv2
+import numpy as np
+
+import board
+import boardstate
+import classifier
+import imagesearch
+import render
+import templates
+
+# Full pieces only; the partial crops (E.G pieces cut at the top of their square) are not what a square looks like
+FULL_PIECE_VARIANTS = ('f', 'light', 'dark')
+
+
+def is_aligned(found: board.Board, position: chess.Board) -> bool:
+    """
+    :return: Whether the squares of a board read from a render are where they were drawn: the highlight of the last move
+             of the position must show on the squares of the move (a misplaced grid would label the squares wrong)
+    """
+    if not position.move_stack:
+        return True
+    move = position.peek()
+    return all(found.highlight_coverage.get(chess.SQUARE_NAMES[square], 0.0) >= board.last_move_detector.min_coverage
+               for square in (move.from_square, move.to_square))
+
+
+def get_board_samples(renderer: render.BoardRenderer, positions: typing.List[chess.Board],
+                      scales: typing.Sequence[float], screen_scale: float,
+                      rng: random.Random) -> typing.Tuple[typing.List[np.ndarray], typing.List[int]]:
+    """
+    Render positions (their last move highlighted, each at a random scale) and cut every square out of them, the way
+    Board.evaluate does; renders whose squares are not found where they were drawn are left out
+    :return: The grayscale squares (resampled to Board.RECOGNITION_SQUARE_PIXELS) and the piece code of each
+    """
+    squares, labels = [], []
+    for position in positions:
+        scale = rng.choice(scales)
+        image = renderer.render(position, scale=scale)
+        location = board.board_locator.locate(imagesearch.to_grayscale(image))
+        found = board.get_board_from_location(location, image, screen_scale * scale, recognition='batch',
+                                              keep_frames=True) \
+            if location else None
+        if found is None or not is_aligned(found, position):
+            continue
+        for i, row in enumerate(found.rows):
+            for j, column in enumerate(found.columns):
+                square = found.get_square_view(found.frame_gray, i, j)
+                squares.append(board.resample_square(square, board.Board.RECOGNITION_SQUARE_PIXELS))
+                piece = position.piece_at(chess.SQUARE_NAMES.index(row + column))
+                labels.append(boardstate.PIECE_SYMBOLS.index(piece.symbol()) if piece else boardstate.EMPTY)
+    return squares, labels
+
+
+def get_template_samples(bank) -> typing.Tuple[typing.List[np.ndarray], typing.List[int]]:
+    """
+    Turn the full piece templates of a skin into squares, by extending their background to the size of the squares
+    they were cut from
+    :return: The grayscale squares (resampled to Board.RECOGNITION_SQUARE_PIXELS) and the piece code of each
+    """
+    squares, labels = [], []
+    side = bank.native_square_pixels
+    for template in bank.pieces:
+        height, width = template.image.shape
+        if template.variant not in FULL_PIECE_VARIANTS or not side or height > side or width > side:
+            continue
+        top, left = (side - height) // 2, (side - width) // 2
+        square = cv2.copyMakeBorder(template.image, top, side - height - top, left, side - width - left,
+                                    cv2.BORDER_REPLICATE)
+        squares.append(board.resample_square(square, board.Board.RECOGNITION_SQUARE_PIXELS))
+        labels.append(boardstate.get_piece_code(template.name, template.color))
+    return squares, labels
+
+
+def train(samples=200, seed=1, scales=(.6, .8, 1.0, 1.25, 1.5),
+          bases=('boards/board-a.png', 'boards/board-a-flipped.png'), sprites_path='boards/board-a.png',
+          screen_scale=2.0, **model_options) -> typing.Tuple[classifier.SquareModel, typing.Dict]:
+    """
+    Train a SquareModel on the piece templates of the skin and on random legal positions drawn on its sample boards
+    :param samples: How many positions to render per sample board
+    :param seed: The seed of the random positions (benchmark.py uses 0, so keep it apart)
+    :param scales: The factors the renders are resized by (one picked at random per position)
+    :param bases: The sample boards drawn on
+    :param sprites_path: The sample board (start position, normal orientation) pieces are cut from
+    :param screen_scale: The scale factor the sample boards were captured at
+    :param model_options: Passed on to SquareModel.fit
+    :return: The model and a JSON serializable report of its training
+    """
+    rng = random.Random(seed)
+    # Every variant, the lighter and darker copies of the pieces included (the recognition itself leaves them out)
+    bank = templates.TemplateBank(markers_dir=None, boards_dir=None, piece_variants=None, excluded_pieces=())
+    squares, labels = get_template_samples(bank)
+    for base in bases:
+        renderer = render.BoardRenderer(base, sprites_path, screen_scale)
+        positions = [render.random_position(rng) for _ in range(samples)]
+        board_squares, board_labels = get_board_samples(renderer, positions, scales, screen_scale, rng)
+        squares.extend(board_squares)
+        labels.extend(board_labels)
+    squares, labels = np.stack(squares), np.array(labels)
+    started = time.perf_counter()
+    model = classifier.SquareModel.fit(squares, labels, **model_options)
+    trained = time.perf_counter()
+    predicted = model.predict_proba(squares).argmax(axis=1)
+    report = {
+        'squares': len(labels),
+        'classes': {symbol: int((labels == code).sum()) for code, symbol in enumerate(boardstate.PIECE_SYMBOLS)},
+        'training_accuracy': float((predicted == labels).mean()),
+        'seconds': trained - started
+    }
+    return model, report
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Train the learned square classifier (recognition mode "model")')
+    parser.add_argument('--output', default=board.SQUARE_MODEL_PATH, help='File to save the model to')
+    parser.add_argument('--samples', type=int, default=200, help='Positions rendered per sample board')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--scales', type=float, nargs='+', default=[.6, .8, 1.0, 1.25, 1.5],
+                        help='Factors the renders are resized by')
+    parser.add_argument('--bases', nargs='+', default=['boards/board-a.png', 'boards/board-a-flipped.png'],
+                        help='Sample boards to draw on')
+    parser.add_argument('--components', type=int, default=96, help='Principal components kept')
+    parser.add_argument('--hidden', type=int, default=128, help='Units of the hidden layer')
+    args = parser.parse_args(argv)
+
+    model, report = train(args.samples, args.seed, args.scales, args.bases, component_count=args.components,
+                          hidden_size=args.hidden)
+    if os.path.dirname(args.output):
+        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    model.save(args.output)
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+import asyncio
+import typing
+
+import chess.engine
+
+ENGINE_PATH = 'engines/stockfish-10-64'
+
+# UCI options the engine is configured with (Ponder and MultiPV are managed by python-chess itself)
+DEFAULT_ENGINE_OPTIONS = {
+    'Hash': 128,
+    'Threads': 1
+}
+
+
+def open_engine(engine_path=ENGINE_PATH, engine_options: typing.Optional[typing.Dict] = None) -> \
+        chess.engine.SimpleEngine:
+    """
+    Start a UCI engine process and configure it
+    :param engine_path: The path of the engine binary
+    :param engine_options: UCI options overriding DEFAULT_ENGINE_OPTIONS
+    :return: The engine session; the caller is responsible for quitting it
+    """
+    engine = chess.engine.SimpleEngine.popen_uci(engine_path)
+    engine.configure(dict(DEFAULT_ENGINE_OPTIONS, **(engine_options or {})))
+    return engine
+
+
+async def open_engine_async(engine_path=ENGINE_PATH, engine_options: typing.Optional[typing.Dict] = None) -> \
+        typing.Tuple[asyncio.SubprocessTransport, chess.engine.UciProtocol]:
+    """
+    Start a UCI engine process and configure it, on the running asyncio event loop
+    :param engine_path: The path of the engine binary
+    :param engine_options: UCI options overriding DEFAULT_ENGINE_OPTIONS
+    :return: The transport and protocol of the engine session; the caller is responsible for quitting it
+    """
+    transport, engine = await chess.engine.popen_uci(engine_path)
+    await engine.configure(dict(DEFAULT_ENGINE_OPTIONS, **(engine_options or {})))
+    return transport, engine
@@ -0,0 +1,177 @@
+import argparse
+import os
+import sys
+import typing
+
+import chess
+import chess.pgn
+import cv2
+import numpy as np
+
+import board
+import recognize
+import tracking
+
+
+def read_frames(source: str, step=1, fps=30.0) -> typing.Iterator[typing.Tuple[float, np.ndarray]]:
+    """
+    Read the frames of a video file, or of a directory of screenshots (taken in file name order)
+    :param source: The path of the video or of the directory
+    :param step: Only read every step-th frame
+    :param fps: The frame rate of a directory of screenshots (videos carry their own)
+    :return: (seconds since the start, RGB frame) tuples
+    """
+    if os.path.isdir(source):
+        for index, path in enumerate(recognize.list_images([source])):
+            if index % step == 0:
+                image = cv2.imread(path, cv2.IMREAD_COLOR)
+                if image is not None:
+                    yield index / fps, cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        return
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise IOError('Could not open video: {}'.format(source))
+    fps = capture.get(cv2.CAP_PROP_FPS) or fps
+    index = 0
+    try:
+        while True:
+            # grab() skips decoding the frames stepped over
+            if not capture.grab():
+                break
+            if index % step == 0:
+                ok, image = capture.retrieve()
+                if ok:
+                    yield index / fps, cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            index += 1
+    finally:
+        capture.release()
+
+
+class ChangeGate:
+    """
+    Tells, from a tiny grayscale thumbnail of the board region, whether a frame is worth recognizing: the board must
+    differ from the last recognized one, and have stopped changing (no piece being dragged, no move animating).
+
+    Thumbnails are compared square by square, so that a single piece moving stands out as much as the whole board
+    changing.
+    """
+
+    def __init__(self, threshold=8.0, settle_frames=2, size=64):
+        """
+        :param threshold: The mean absolute difference (in gray levels) of a square of two thumbnails for them to
+                          differ
+        :param settle_frames: How many consecutive frames must show the same board before it is recognized
+        :param size: The side (in pixels) of the thumbnails, a multiple of 8
+        """
+        self.threshold = threshold
+        self.settle_frames = settle_frames
+        self.size = size
+        self.reference = None
+        self.previous = None
+        self.stable_frames = 0
+
+    def get_thumbnail(self, region: np.ndarray) -> np.ndarray:
+        gray = cv2.cvtColor(region, cv2.COLOR_RGB2GRAY) if region.ndim == 3 else region
+        return cv2.resize(gray, (self.size, self.size), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def differs(self, a: typing.Optional[np.ndarray], b: np.ndarray) -> bool:
+        if a is None:
+            return True
+        cell = self.size // 8
+        return float(np.abs(a - b).reshape(8, cell, 8, cell).mean(axis=(1, 3)).max()) > self.threshold
+
+    def feed(self, region: np.ndarray) -> bool:
+        """
+        :param region: The board region of the next frame
+        :return: Whether the board changed since it was last recognized and has now settled
+        """
+        thumbnail = self.get_thumbnail(region)
+        self.stable_frames = 0 if self.differs(self.previous, thumbnail) else self.stable_frames + 1
+        self.previous = thumbnail
+        return self.stable_frames + 1 >= self.settle_frames and self.differs(self.reference, thumbnail)
+
+    def accept(self) -> None:
+        """
+        Mark the board of the last frame fed as recognized
+        """
+        self.reference = self.previous
+
+
+def format_timestamp(seconds: float) -> str:
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return '{}:{:02d}:{:04.1f}'.format(hours, minutes, seconds)
+
+
+def follow_game(frames: typing.Iterable[typing.Tuple[float, np.ndarray]], screen_scale=2.0, gate: ChangeGate = None,
+                max_plies=2) -> typing.Iterator[typing.Tuple[float, typing.Optional[chess.Board], chess.Move]]:
+    """
+    Follow a game through the frames of a recording, recognizing the board only when it visibly changed
+    :param frames: (seconds, RGB frame) tuples, see read_frames
+    :param screen_scale: The scale factor of the display the recording was made on
+    :param gate: Decides which frames are recognized
+    :param max_plies: How many moves may happen between two recognized frames
+    :return: (seconds, starting position, None) once the board is first found, then a (seconds, None, move) tuple per
+             move played
+    """
+    gate = gate or ChangeGate()
+    found = None
+    tracker = tracking.GameTracker(max_plies)
+    for seconds, frame in frames:
+        if found is None:
+            found = board.read_board_from_image(frame, screen_scale)
+            if found is None:
+                continue
+            tracker.reset(found.to_fen_string())
+            x1, y1, x2, y2 = found.get_frame_region()
+            gate.feed(frame[y1:y2, x1:x2])
+            gate.accept()
+            yield seconds, tracker.board.copy(stack=False), None
+            continue
+        if not gate.feed(frame[y1:y2, x1:x2]):
+            continue
+        found.update(screenshot=frame)
+        gate.accept()
+        # Anything but legal moves is a misread (or a board that is not part of the game); it is ignored until the next
+        # change
+        for move in tracker.follow(found.state.board_fen()) or []:
+            yield seconds, None, move
+
+
+def to_pgn(events: typing.Iterable[typing.Tuple[float, typing.Optional[chess.Board], chess.Move]],
+           event='?') -> chess.pgn.Game:
+    """
+    Build a PGN game of the moves followed by follow_game, each move commented with when it was seen
+    """
+    game = chess.pgn.Game()
+    game.headers['Event'] = event
+    node = game
+    for seconds, start, move in events:
+        if start is not None:
+            if start.board_fen() != chess.STARTING_BOARD_FEN or start.turn != chess.WHITE:
+                game.setup(start)
+            node = game
+            continue
+        node = node.add_variation(move)
+        node.comment = format_timestamp(seconds)
+    return game
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Follow a game through a screen recording (or a directory of frames) '
+                                                 'and print it as PGN')
+    parser.add_argument('source', help='Video file or directory of frames')
+    parser.add_argument('--scale', type=float, default=2.0,
+                        help='Scale factor of the display the recording was made on (2 on retina displays)')
+    parser.add_argument('--step', type=int, default=1, help='Only look at every step-th frame')
+    parser.add_argument('--fps', type=float, default=30.0, help='Frame rate of a directory of frames')
+    parser.add_argument('--threshold', type=float, default=8.0,
+                        help='Mean gray level difference of a square for a frame to count as changed')
+    args = parser.parse_args(argv)
+
+    events = follow_game(read_frames(args.source, args.step, args.fps), args.scale, ChangeGate(args.threshold))
+    print(to_pgn(events, os.path.basename(args.source)), file=sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+import time
+import typing
+
+import cv2
+import numpy as np
+
+import imagesearch
+import metrics
+
+
+class BoardWatcher:
+    """
+    Waits for the board on screen to change, by sampling only the squares watched at a fixed rate and comparing cheap
+    perceptual hashes of them, instead of reading the whole board again blindly.
+
+    Every sample covers the smallest rectangle of squares holding those watched, keeping only every few pixels of it as
+    it is captured (see Board.capture_region), and is shrunk to a tiny grayscale thumbnail (size / 8 pixels per
+    square); each square of the thumbnail is hashed into the bits telling which of its pixels are brighter than the
+    square's mean (an average hash), leaving out a margin along its edges where pieces of the neighbouring squares may
+    stick out. A square changed when enough bits flipped: a piece arriving or leaving changes the shape within the
+    square, while the last move highlight coming or going only shifts its brightness. A change is only reported once
+    the board stopped changing (no piece being dragged, no move animating), so that the full read that follows sees the
+    final position.
+    """
+
+    def __init__(self, interval=.1, settle_frames=2, hash_distance=8, size=96, margin=2,
+                 timeout: typing.Optional[float] = 60.0):
+        """
+        :param interval: The seconds between two samples, which bounds how long a change goes unnoticed
+        :param settle_frames: How many consecutive samples must look the same for the board to have settled
+        :param hash_distance: How many bits of the average hash of a square must flip for the square to have changed
+        :param size: The side (in pixels) of the thumbnails, a multiple of 8
+        :param margin: How many pixels along the edges of each square of the thumbnails are left out of its hash
+        :param timeout: The seconds to wait for a change at most (None to wait as long as it takes, E.G forever if the
+                        opponent resigned or left)
+        """
+        self.interval = interval
+        self.settle_frames = settle_frames
+        self.hash_distance = hash_distance
+        self.size = size
+        self.margin = margin
+        self.timeout = timeout
+
+    def get_hashes(self, region: np.ndarray, rows=8, columns=8) -> np.ndarray:
+        """
+        :param region: The board region, or a rectangle of its squares (RGB or grayscale)
+        :param rows: How many squares the region is high
+        :param columns: How many squares the region is wide
+        :return: The average hash bits of every square (rows x columns x pixels within the margins, by row and column on
+                 screen)
+        """
+        cell, margin = self.size // 8, self.margin
+        thumbnail = cv2.resize(imagesearch.to_grayscale(region), (columns * cell, rows * cell),
+                               interpolation=cv2.INTER_AREA)
+        cells = thumbnail.astype(np.float32).reshape(rows, cell, columns, cell).transpose(0, 2, 1, 3)
+        cells = cells[:, :, margin:cell - margin, margin:cell - margin].reshape(rows, columns, -1)
+        return cells > cells.mean(axis=2, keepdims=True)
+
+    def get_changed_squares(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """
+        :return: Which squares (booleans, by row and column on screen) differ between two sets of hashes
+        """
+        return (a != b).sum(axis=2) >= self.hash_distance
+
+    @staticmethod
+    def get_mask(board, squares: typing.Optional[typing.Iterable[str]]) -> np.ndarray:
+        """
+        :param board: The board.Board being watched, for its orientation
+        :param squares: The squares to watch (E.G 'e4'), None for all of them
+        :return: 8 x 8 booleans, by row and column on screen
+        """
+        if squares is None:
+            return np.ones((8, 8), dtype=bool)
+        mask = np.zeros((8, 8), dtype=bool)
+        for square in squares:
+            mask[board.columns.index(square[1]), board.rows.index(square[0])] = True
+        return mask
+
+    def get_sampling(self, board, mask: np.ndarray) -> typing.Tuple[typing.Tuple[int, int, int, int],
+                                                                   typing.Tuple[int, int, int, int], int]:
+        """
+        :param board: The board.Board being watched, for its geometry
+        :param mask: The squares watched (see get_mask)
+        :return: The smallest rectangle of squares holding those watched (first row, first column, rows, columns), the
+                 region it covers within the board frame (x1, y1, x2, y2, in pixels) and how many pixels to step by for
+                 the squares to still be twice as large as those of the thumbnails (which then average them down)
+        """
+        found_rows, found_columns = np.nonzero(mask)
+        top, left = int(found_rows.min()), int(found_columns.min())
+        rows, columns = int(found_rows.max()) + 1 - top, int(found_columns.max()) + 1 - left
+        x1, y1, x2, y2 = board.get_frame_region()
+        unit = (x2 - x1) / 8
+        region = int(round(left * unit)), int(round(top * unit)), \
+            int(round((left + columns) * unit)), int(round((top + rows) * unit))
+        return (top, left, rows, columns), region, max(1, int(unit // (2 * (self.size // 8))))
+
+    @staticmethod
+    def grab(board, region: typing.Tuple[int, int, int, int], step: int) -> np.ndarray:
+        """
+        :param region: The region to grab within the board frame (x1, y1, x2, y2, in pixels)
+        :param step: Keep every step-th pixel of every step-th row
+        :return: The region of the screen (or of the screenshot the board was read from)
+        """
+        x, y = board.get_frame_region()[:2]
+        return board.capture_region((x + region[0], y + region[1], x + region[2], y + region[3]), step)
+
+    def wait_for_change(self, board, squares: typing.Optional[typing.Iterable[str]] = None,
+                        reference: np.ndarray = None) -> bool:
+        """
+        Block until some of the squares watched changed and the board settled again
+        :param board: The board.Board to watch; its geometry must still be valid
+        :param squares: The squares to watch (E.G where the opponent's legal moves start or land), None for all of them
+        :param reference: The board region (E.G Board.frame_gray of the last read) to compare with; defaults to the
+                          first sample showing a settled board
+        :return: True once a change settled, False if the timeout ran out first
+        """
+        mask = self.get_mask(board, squares)
+        if not mask.any():
+            return False
+        (top, left, rows, columns), region, step = self.get_sampling(board, mask)
+        mask = mask[top:top + rows, left:left + columns]
+        expected = self.get_hashes(reference[region[1]:region[3]:step, region[0]:region[2]:step], rows, columns) \
+            if reference is not None else None
+        previous, stable = None, 0
+        started = time.time()
+        while self.timeout is None or time.time() - started < self.timeout:
+            sampled = time.time()
+            hashes = self.get_hashes(self.grab(board, region, step), rows, columns)
+            metrics.recorder.count('watcher_samples')
+            stable = stable + 1 if previous is not None and not self.get_changed_squares(previous, hashes)[mask].any() \
+                else 0
+            previous = hashes
+            if stable + 1 >= self.settle_frames:
+                if expected is None:
+                    expected = hashes
+                elif self.get_changed_squares(expected, hashes)[mask].any():
+                    return True
+            time.sleep(max(0.0, self.interval - (time.time() - sampled)))
+        return False